@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -79,9 +80,67 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Закрытие дня и покупки идут из параллельных запросов: транзакции
+        # берут блокировку записи сразу (BEGIN IMMEDIATE), а не при первой
+        # записи, когда ее уже нельзя дождаться без взаимоблокировки; WAL не
+        # блокирует чтение во время записи, а busy_timeout заставляет ждать
+        # освобождения базы вместо ошибки "database is locked". Команды
+        # init_command выполняются на каждом новом соединении.
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; PRAGMA busy_timeout=20000',
+        },
     }
 }
 
+# Профиль PostgreSQL: DB_BACKEND=postgresql и параметры подключения в
+# переменных POSTGRES_*. Писатели не блокируют друг друга на уровне всей базы,
+# соединения переиспользуются между запросами (CONN_MAX_AGE) или берутся из
+# пула psycopg (POSTGRES_POOL=1, нужен psycopg[pool]), а iterator() в отчетах
+# читает через серверные курсоры. Тесты создают и удаляют отдельную базу
+# test_<POSTGRES_DB>. За pgbouncer в режиме transaction серверные курсоры
+# нужно отключить: POSTGRES_SERVER_CURSORS=0.
+if os.environ.get('DB_BACKEND') == 'postgresql':
+    pool = os.environ.get('POSTGRES_POOL') == '1'
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('POSTGRES_DB', 'app'),
+        'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+        # пул сам держит соединения, вместе с ним CONN_MAX_AGE должен быть 0
+        'CONN_MAX_AGE': 0 if pool else int(os.environ.get('POSTGRES_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': not pool,
+        'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('POSTGRES_SERVER_CURSORS') == '0',
+        'OPTIONS': {'pool': {'min_size': 2, 'max_size': 20}} if pool else {},
+    }
+
+# Версии кэшей процесса (дата симуляции, цены, рецепты) лежат в общем кэше,
+# чтобы их смену видели все процессы сервера: по умолчанию это файлы в
+# CACHE_DIR на одной машине, для нескольких машин - Redis (REDIS_URL, нужен
+# пакет redis).
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_DIR', BASE_DIR / 'cache'),
+        }
+    }
+
+TEST_RUNNER = 'main.runner.TestRunner'
+
+# Токены внешних клиентов API (прием заказов, закупка списком) через запятую:
+# клиент передает заголовок Authorization: Bearer <токен>
+API_TOKENS = [token for token in os.environ.get('API_TOKENS', '').split(',') if token]
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
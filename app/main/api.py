@@ -0,0 +1,36 @@
+import hmac
+from functools import wraps
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+
+
+def valid_token(header):
+    scheme, _, token = header.partition(' ')
+    return scheme.lower() == 'bearer' and any(
+        hmac.compare_digest(token.encode(), allowed.encode()) for allowed in settings.API_TOKENS
+    )
+
+
+# Эндпоинт для внешних клиентов: запрос с заголовком Authorization: Bearer
+# <токен из settings.API_TOKENS> проходит без CSRF-токена (cookie сессии
+# браузера тут ни при чем), с неверным токеном - 401. Без заголовка запрос
+# отклоняется, а при allow_forms=True обрабатывается как обычная форма из
+# браузера под защитой CSRF.
+def api_view(allow_forms=False):
+    def decorator(view):
+        protected = csrf_protect(view)
+
+        @csrf_exempt
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            header = request.headers.get('Authorization')
+            if header is None and allow_forms:
+                return protected(request, *args, **kwargs)
+            if header is None or not valid_token(header):
+                return JsonResponse({'errors': ['Нужен действующий токен API']}, status=401,
+                                    headers={'WWW-Authenticate': 'Bearer'})
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
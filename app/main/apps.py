@@ -4,4 +4,6 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
-  
\ No newline at end of file
+
+    def ready(self):
+        from . import signals
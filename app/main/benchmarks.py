@@ -0,0 +1,130 @@
+import csv
+import json
+import statistics
+import time
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.test import RequestFactory
+
+from .dataset import Dataset
+from .day_close import DayClose
+from .forms import WarehouseProductsForm
+from .models import CapitalLedger, CapitalSnapshot, Userdj
+from .views import cheque_list_view, debiting_list_view
+
+TODAY = date(2024, 1, 10)
+HISTORY_DAYS = 365
+PERCENTILES = (50, 90, 99)
+
+
+# синтетический мир на size партий: история чеков и списаний того же порядка,
+# заказы и цеха - для закрытия дня
+def populate(size, seed=0):
+    Userdj.objects.all().delete()
+    CapitalLedger.objects.all().delete()
+    CapitalSnapshot.objects.all().delete()
+    dataset = Dataset(seed=seed, products=max(size // 100, 30), suppliers=20, customers=20, recipes=10, workshops=10,
+                      lots=size, orders=max(size // 10, 1), cheques=size, lines_per_cheque=1, debits=size,
+                      history_days=HISTORY_DAYS, today=TODAY, prefix='Бенчмарк ')
+    dataset.generate()
+    return dataset.products
+
+
+def day_close(products):
+    return lambda: DayClose(Userdj.objects.get()).run()
+
+
+def cheque_report(products):
+    request = RequestFactory().get('/cheque-list/', {
+        'start_date': TODAY - timedelta(days=30), 'end_date': TODAY, 'warehouse': -1,
+    })
+    return lambda: cheque_list_view(request)
+
+
+def debiting_report(products):
+    request = RequestFactory().get('/debiting-list/', {
+        'start_date': TODAY - timedelta(days=30), 'end_date': TODAY,
+    })
+    return lambda: debiting_list_view(request)
+
+
+def purchase(products):
+    product = products[0]
+
+    def run():
+        form = WarehouseProductsForm({'product': product.pk, 'quantity': 10, 'production_date': TODAY})
+        form.is_valid()
+        form.save()
+    return run
+
+
+SCENARIOS = {
+    'day_close': day_close,
+    'cheque_report': cheque_report,
+    'debiting_report': debiting_report,
+    'purchase': purchase,
+}
+
+
+def percentile(timings, p):
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, round(p / 100 * (len(ordered) - 1)))]
+
+
+# прогоняет run warmup + repeat раз, каждый раз в откатываемой точке сохранения,
+# чтобы сценарии, меняющие данные, мерились на одном и том же состоянии
+def measure(run, warmup=3, repeat=20):
+    timings = []
+    for i in range(warmup + repeat):
+        with transaction.atomic():
+            start = time.perf_counter_ns()
+            run()
+            elapsed = time.perf_counter_ns() - start
+            transaction.set_rollback(True)
+        if i >= warmup:
+            timings.append(elapsed)
+    return {
+        'repeat': repeat,
+        'min_ms': min(timings) / 1e6,
+        'mean_ms': statistics.mean(timings) / 1e6,
+        **{f'p{p}_ms': percentile(timings, p) / 1e6 for p in PERCENTILES},
+    }
+
+
+# результаты по всем размерам и сценариям; данные каждого размера откатываются
+def run_suite(sizes, scenarios=None, warmup=3, repeat=20, seed=0):
+    results = []
+    for size in sizes:
+        with transaction.atomic():
+            products = populate(size, seed)
+            for name in scenarios or SCENARIOS:
+                results.append({'scenario': name, 'size': size,
+                                **measure(SCENARIOS[name](products), warmup, repeat)})
+            transaction.set_rollback(True)
+    return results
+
+
+def export_json(results, path):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(results, file, ensure_ascii=False, indent=2)
+
+
+def export_csv(results, path):
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=list(results[0]))
+        writer.writeheader()
+        writer.writerows(results)
+
+
+# сравнение p50 с сохраненным прогоном: (результат, базовый p50, отношение)
+# для всех сценариев, которые есть в базовом файле
+def compare(results, baseline_path):
+    with open(baseline_path, encoding='utf-8') as file:
+        baseline = {(row['scenario'], row['size']): row for row in json.load(file)}
+    return [
+        (row, baseline[row['scenario'], row['size']]['p50_ms'],
+         row['p50_ms'] / baseline[row['scenario'], row['size']]['p50_ms'])
+        for row in results
+        if (row['scenario'], row['size']) in baseline
+    ]
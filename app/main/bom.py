@@ -0,0 +1,94 @@
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+
+from .models import Recipe, RecipeProducts
+from .versions import VersionedCache
+
+
+def load_bom():
+    recipes = {}
+    for recipe_id, product_id in Recipe.objects.order_by('pk').values_list('pk', 'finish_product_id'):
+        recipes.setdefault(product_id, recipe_id)
+    ingredients = defaultdict(list)
+    for recipe_product in RecipeProducts.objects.order_by('pk'):
+        ingredients[recipe_product.recipe_id].append(recipe_product)
+    return {'recipes': recipes, 'ingredients': dict(ingredients), 'exploded': {}}
+
+
+# первый рецепт каждого продукта, состав рецептов и уже развернутые
+# спецификации
+_bom = VersionedCache('main:bom_version', load_bom)
+
+
+def _state():
+    return _bom.get()
+
+
+# {finish_product_id: recipe_id} - рецепт, по которому продукт производится
+def product_recipes():
+    return _state()['recipes']
+
+
+# {recipe_id: [RecipeProducts]} - состав рецептов на один уровень
+def recipe_ingredients():
+    return _state()['ingredients']
+
+
+def _explode(state, recipe_id, path):
+    if recipe_id in state['exploded']:
+        return state['exploded'][recipe_id]
+    if recipe_id in path:
+        cycle = path[path.index(recipe_id):] + (recipe_id,)
+        raise ValidationError(f'Рецепты образуют цикл: {" -> ".join(str(item) for item in cycle)}')
+    totals = defaultdict(int)
+    for recipe_product in state['ingredients'].get(recipe_id, []):
+        nested = state['recipes'].get(recipe_product.product_id)
+        if nested is None:
+            totals[recipe_product.product_id] += recipe_product.quantity
+            continue
+        for product_id, quantity in _explode(state, nested, path + (recipe_id,)).items():
+            totals[product_id] += recipe_product.quantity * quantity
+    state['exploded'][recipe_id] = dict(totals)
+    return state['exploded'][recipe_id]
+
+
+# {product_id сырья: количество} на единицу продукции рецепта; сырьем считается
+# все, у чего нет своего рецепта
+def explode(recipe_id):
+    return dict(_explode(_state(), recipe_id, ()))
+
+
+# суммарная потребность в сырье для плана {product_id: количество}
+def raw_demand(plan):
+    state = _state()
+    demand = defaultdict(int)
+    for product_id, quantity in plan.items():
+        recipe_id = state['recipes'].get(product_id)
+        if recipe_id is None:
+            demand[product_id] += quantity
+            continue
+        for raw_id, per_unit in _explode(state, recipe_id, ()).items():
+            demand[raw_id] += per_unit * quantity
+    return dict(demand)
+
+
+# входит ли target_id в дерево продукта product_id (или совпадает с ним)
+def uses(product_id, target_id):
+    state = _state()
+    seen, stack = set(), [product_id]
+    while stack:
+        current = stack.pop()
+        if current == target_id:
+            return True
+        if current in seen:
+            continue
+        seen.add(current)
+        recipe_id = state['recipes'].get(current)
+        if recipe_id is not None:
+            stack.extend(item.product_id for item in state['ingredients'].get(recipe_id, []))
+    return False
+
+
+def invalidate_bom():
+    _bom.invalidate()
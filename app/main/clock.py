@@ -0,0 +1,18 @@
+from .models import Userdj
+from .versions import VersionedCache
+
+# строка Userdj с текущей датой симуляции и капиталом (только для чтения)
+_clock = VersionedCache('main:clock_version', lambda: Userdj.objects.order_by('pk').first())
+
+
+def simulation_state():
+    return _clock.get()
+
+
+def current_date():
+    userdj = simulation_state()
+    return userdj.date_now if userdj else None
+
+
+def invalidate_clock():
+    _clock.invalidate()
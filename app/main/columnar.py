@@ -0,0 +1,151 @@
+from datetime import date
+
+import numpy as np
+
+from .models import Product, WarehouseProducts
+from .simulation import Lot, write_lots
+
+COLUMNS = ('key', 'product', 'quantity', 'production', 'expires', 'mass')
+
+
+def lookup(mapping, ids, default=0):
+    if not mapping:
+        return np.full(len(ids), default, dtype=np.int64)
+    keys = np.fromiter(mapping, dtype=np.int64, count=len(mapping))
+    order = np.argsort(keys)
+    keys = keys[order]
+    values = np.array(list(mapping.values()), dtype=np.int64)[order]
+    positions = np.minimum(np.searchsorted(keys, ids), len(keys) - 1)
+    return np.where(keys[positions] == ids, values[positions], default)
+
+
+# нарастающая сумма values внутри подряд идущих одинаковых groups
+def grouped_cumsum(values, groups):
+    total = np.cumsum(values)
+    if not len(values):
+        return total
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    offsets = (total - values)[starts]
+    return total - np.repeat(offsets, np.diff(np.r_[starts, len(values)]))
+
+
+# Остатки склада столбцами NumPy для прогонов "что если": партии хранятся
+# параллельными массивами (ключ, продукт, количество, даты производства и
+# годности в виде ordinal, масса штуки) и загружаются одним запросом. Интерфейс
+# тот же, что у LotStore, поэтому хранилище подключается к Simulation через
+# stock=; списание по сроку, по вместимости и FIFO-расход считаются
+# векторно, flush пишет в базу только разницу.
+class ColumnarLotStore:
+    def __init__(self, rows, masses, batch_size=1000):
+        rows = list(rows)
+        self.masses = masses
+        self.batch_size = batch_size
+        self.key = np.array([row[0] for row in rows], dtype=np.int64)
+        self.product = np.array([row[1] for row in rows], dtype=np.int64)
+        self.quantity = np.array([row[2] for row in rows], dtype=np.int64)
+        self.production = np.array([row[3].toordinal() for row in rows], dtype=np.int64)
+        self.expires = np.array([row[4].toordinal() for row in rows], dtype=np.int64)
+        self.mass = np.array([masses[row[1]] for row in rows], dtype=np.float64)
+        self.pending = []
+        self.stored_key = self.key.copy()
+        self.stored_quantity = self.quantity.copy()
+        self.next_key = int(self.key.max()) + 1 if len(self.key) else 1
+
+    @classmethod
+    def load(cls, **kwargs):
+        masses = {pk: float(mass) for pk, mass in Product.objects.values_list('pk', 'mass')}
+        return cls(WarehouseProducts.objects.order_by('pk').values_list(
+            'pk', 'product_id', 'quantity', 'production_date', 'expires_on').iterator(chunk_size=10000), masses, **kwargs)
+
+    def merge(self):
+        if not self.pending:
+            return
+        rows = self.pending
+        self.pending = []
+        self.key = np.r_[self.key, [row[0] for row in rows]].astype(np.int64)
+        self.product = np.r_[self.product, [row[1] for row in rows]].astype(np.int64)
+        self.quantity = np.r_[self.quantity, [row[2] for row in rows]].astype(np.int64)
+        self.production = np.r_[self.production, [row[3] for row in rows]].astype(np.int64)
+        self.expires = np.r_[self.expires, [row[4] for row in rows]].astype(np.int64)
+        self.mass = np.r_[self.mass, [self.masses[row[1]] for row in rows]].astype(np.float64)
+
+    def keep(self, mask):
+        for column in COLUMNS:
+            setattr(self, column, getattr(self, column)[mask])
+
+    def rows(self, index):
+        return list(zip(self.product[index].tolist(), self.quantity[index].tolist()))
+
+    def totals(self):
+        self.merge()
+        products, inverse = np.unique(self.product, return_inverse=True)
+        return dict(zip(products.tolist(), np.bincount(inverse, weights=self.quantity).astype(np.int64).tolist()))
+
+    def add(self, product_id, quantity, production_date, expires_on):
+        self.pending.append((self.next_key, product_id, quantity, production_date.toordinal(), expires_on.toordinal()))
+        self.next_key += 1
+
+    def consume(self, amounts):
+        self.merge()
+        need = lookup({product_id: quantity for product_id, quantity in amounts.items() if quantity > 0}, self.product)
+        index = np.flatnonzero(need > 0)
+        index = index[np.lexsort((self.key[index], self.production[index], self.product[index]))]
+        quantity, need = self.quantity[index], need[index]
+        running = grouped_cumsum(quantity, self.product[index])
+        boundary = (running > need) & (running - quantity < need)
+        self.quantity[index[boundary]] = running[boundary] - need[boundary]
+        mask = np.ones(len(self.key), dtype=bool)
+        mask[index[running <= need]] = False
+        self.keep(mask)
+
+    def drop_empty(self):
+        self.merge()
+        self.keep(self.quantity != 0)
+
+    def expire(self, day):
+        self.merge()
+        stale = np.flatnonzero(self.expires < day.toordinal())
+        written_off = self.rows(stale[np.argsort(self.key[stale])])
+        self.keep(self.expires >= day.toordinal())
+        return written_off
+
+    def overflow(self, warehouses, capacities):
+        self.merge()
+        warehouse = lookup(warehouses, self.product)
+        index = np.lexsort((-self.key, -self.production, warehouse))
+        running = grouped_cumsum(self.quantity[index], warehouse[index])
+        over = index[running > lookup(capacities, warehouse[index])]
+        written_off = self.rows(over)
+        mask = np.ones(len(self.key), dtype=bool)
+        mask[over] = False
+        self.keep(mask)
+        return written_off
+
+    # занятая масса по складам, кг
+    def occupied_mass(self, warehouses):
+        self.merge()
+        warehouse = lookup(warehouses, self.product)
+        ids, inverse = np.unique(warehouse, return_inverse=True)
+        return dict(zip(ids.tolist(), np.bincount(inverse, weights=self.quantity * self.mass).tolist()))
+
+    def flush(self):
+        self.merge()
+        known = np.isin(self.key, self.stored_key)
+        stored = np.isin(self.stored_key, self.key)
+        previous = dict(zip(self.stored_key[stored].tolist(), self.stored_quantity[stored].tolist()))
+        new = np.flatnonzero(~known)
+        new = new[np.argsort(self.key[new])]
+        created = write_lots(
+            self.stored_key[~stored].tolist(),
+            {key: quantity for key, quantity in zip(self.key[known].tolist(), self.quantity[known].tolist())
+             if previous[key] != quantity},
+            [Lot(product_id, quantity, date.fromordinal(production), date.fromordinal(expires))
+             for product_id, quantity, production, expires in zip(
+                 self.product[new].tolist(), self.quantity[new].tolist(),
+                 self.production[new].tolist(), self.expires[new].tolist())],
+            self.batch_size,
+        )
+        self.key[new] = [lot.pk for lot in created]
+        self.stored_key = self.key.copy()
+        self.stored_quantity = self.quantity.copy()
+        self.next_key = max(self.next_key, int(self.key.max()) + 1 if len(self.key) else 1)
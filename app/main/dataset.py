@@ -0,0 +1,259 @@
+import random
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max, Min
+
+from .bom import invalidate_bom
+from .ledger import post, snapshot_days
+from .models import (
+    CapitalLedger,
+    Cheque,
+    ChequeProduct,
+    Customer,
+    DebitingList,
+    OrderList,
+    Product,
+    Recipe,
+    RecipeProducts,
+    Supplier,
+    SupplierProductPrice,
+    Userdj,
+    Warehouse,
+    WarehouseProducts,
+    Workshop,
+)
+from .prices import invalidate_cheapest_prices
+from .rollup import rollup_days
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+# Синтетический набор данных, полностью определяемый seed: склады трех
+# категорий, продукты, поставщики с матрицей цен, дерево рецептов (полуфабрикаты
+# из сырья и более ранних полуфабрикатов, блюда из полуфабрикатов и сырья),
+# цеха, история чеков и списаний за history_days, остатки и открытые заказы.
+# Строки пишутся пачками по batch_size и не держатся в памяти целиком, поэтому
+# объем ограничен только базой.
+class Dataset:
+    def __init__(self, seed=0, products=3000, suppliers=200, customers=1000, prices_per_product=3,
+                 recipes=500, workshops=50, lots=10 ** 6, orders=10 ** 4, cheques=10 ** 6, lines_per_cheque=3,
+                 debits=10 ** 5, history_days=3 * 365, today=date(2024, 1, 10), capacity=10 ** 9,
+                 prefix='', batch_size=10000):
+        self.rng = random.Random(seed)
+        self.sizes = {
+            'products': max(products, 10), 'suppliers': max(suppliers, 1), 'customers': max(customers, 1),
+            'prices_per_product': max(prices_per_product, 1), 'recipes': recipes, 'workshops': workshops,
+            'lots': lots, 'orders': orders, 'cheques': cheques, 'lines_per_cheque': max(lines_per_cheque, 1),
+            'debits': debits,
+        }
+        self.history_days = history_days
+        self.today = today
+        self.capacity = capacity
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.created = defaultdict(int)
+
+    def create(self, model, objs):
+        created = []
+        self.stream(model, objs, after=created.extend)
+        return created
+
+    # то же, что create, но без накопления созданных объектов
+    def stream(self, model, objs, after=None):
+        for batch in batched(objs, self.batch_size):
+            batch = model.objects.bulk_create(batch)
+            self.created[model.__name__] += len(batch)
+            if after:
+                after(batch)
+
+    def past_day(self):
+        return self.today - timedelta(days=self.rng.randrange(self.history_days) + 1)
+
+    def price(self, low=100, high=50000):
+        return Decimal(self.rng.randint(low, high)) / 100
+
+    def generate(self):
+        with transaction.atomic():
+            userdj, created = Userdj.objects.get_or_create(defaults={'date_now': self.today, 'capital': 10 ** 9})
+            if not created:
+                # капитал доводится до начального проводкой, журнал остается полным
+                userdj.date_now = self.today
+                userdj.save(update_fields=['date_now'])
+                post(userdj.pk, {(self.today, CapitalLedger.Kind.OPENING): 10 ** 9 - userdj.capital})
+            self.generate_catalog()
+            self.generate_recipes()
+            self.generate_history()
+            self.roll_up_history()
+            self.generate_stock()
+        invalidate_cheapest_prices()
+        invalidate_bom()
+        return dict(self.created)
+
+    def generate_catalog(self):
+        rng, sizes = self.rng, self.sizes
+        self.raw_warehouse, self.semi_warehouse, self.finished_warehouse = self.create(Warehouse, (
+            Warehouse(category=category, max_warehouse_capacity=self.capacity)
+            for category in ('Сырье', 'Полуфабрикаты', 'Готовая продукция')
+        ))
+        self.suppliers = self.create(Supplier, (Supplier(name=f'{self.prefix}Поставщик {i}')
+                                                for i in range(sizes['suppliers'])))
+        self.customers = self.create(Customer, (Customer(name=f'{self.prefix}Клиент {i}')
+                                                for i in range(sizes['customers'])))
+
+        raw_count = sizes['products'] * 6 // 10
+        semi_count = sizes['products'] // 4
+        finished_count = sizes['products'] - raw_count - semi_count
+
+        def products(warehouse, label, count):
+            return self.create(Product, (
+                Product(name=f'{self.prefix}{label} {i}', warehouse=warehouse, expiry_date=rng.randint(3, 30),
+                        mass=Decimal(rng.randint(5, 500)) / 100)
+                for i in range(count)
+            ))
+
+        self.raw = products(self.raw_warehouse, 'Сырье', raw_count)
+        self.semi = products(self.semi_warehouse, 'Полуфабрикат', semi_count)
+        self.finished = products(self.finished_warehouse, 'Блюдо', finished_count)
+        self.products = self.raw + self.semi + self.finished
+
+        per_product = min(sizes['prices_per_product'], len(self.suppliers))
+        prices = [
+            SupplierProductPrice(supplier=supplier, product=product, price=self.price())
+            for product in self.raw
+            for supplier in rng.sample(self.suppliers, per_product)
+        ]
+        self.create(SupplierProductPrice, prices)
+        self.catalog = defaultdict(list)
+        for price in prices:
+            self.catalog[price.supplier].append((price.product, price.price))
+
+    def generate_recipes(self):
+        rng, sizes = self.rng, self.sizes
+        made = self.semi + self.finished
+        recipes = self.create(Recipe, (
+            Recipe(name=f'Рецепт {i}', finish_product=product)
+            for i, product in enumerate(rng.sample(made, min(sizes['recipes'], len(made))))
+        ))
+        semi_index = {product.pk: i for i, product in enumerate(self.semi)}
+
+        def ingredients(recipe):
+            product_id = recipe.finish_product_id
+            if product_id in semi_index:
+                earlier = self.semi[:semi_index[product_id]]
+                parts = rng.sample(self.raw, rng.randint(2, 4))
+                if earlier and rng.random() < 0.3:
+                    parts.append(rng.choice(earlier))
+            else:
+                parts = rng.sample(self.semi, min(rng.randint(1, 2), len(self.semi))) + rng.sample(self.raw, rng.randint(1, 3))
+            return [RecipeProducts(recipe=recipe, product=product, quantity=rng.randint(1, 3)) for product in parts]
+
+        self.create(RecipeProducts, (item for recipe in recipes for item in ingredients(recipe)))
+        self.create(Workshop, (
+            Workshop(name=f'Цех {i}', max_capacity=rng.randint(10, 200), recipe=rng.choice(recipes) if recipes else None)
+            for i in range(sizes['workshops'])
+        ))
+
+    # Крупные таблицы пишутся через executemany без создания объектов моделей:
+    # rows - кортежи значений полей fields. Так грузится около 10^7 строк за
+    # минуты; bulk_create на таких объемах упирается в сборку объектов и SQL.
+    # В PostgreSQL с psycopg 3 вместо INSERT используется COPY FROM STDIN.
+    def insert(self, model, fields, rows, after=None):
+        quote = connection.ops.quote_name
+        columns = ', '.join(quote(model._meta.get_field(name).column) for name in fields)
+        table = quote(model._meta.db_table)
+        sql = f'INSERT INTO {table} ({columns}) VALUES ({", ".join(["%s"] * len(fields))})'
+        with connection.cursor() as cursor:
+            copy = getattr(cursor.cursor, 'copy', None) if connection.vendor == 'postgresql' else None
+            for batch in batched(rows, self.batch_size):
+                if copy:
+                    with copy(f'COPY {table} ({columns}) FROM STDIN') as stream:
+                        for row in batch:
+                            stream.write_row(row)
+                else:
+                    cursor.executemany(sql, batch)
+                self.created[model.__name__] += len(batch)
+                if after:
+                    after()
+
+    # id чеков назначаются заранее, чтобы сразу писать строки чеков; lines
+    # копит строки для чеков текущей пачки и сбрасывается после ее вставки
+    def generate_history(self):
+        rng, sizes = self.rng, self.sizes
+        catalog = [
+            (supplier.pk, [(product.pk, price) for product, price in items])
+            for supplier, items in self.catalog.items()
+        ]
+        sold = [(product.pk, self.price(1000, 90000)) for product in self.semi + self.finished]
+        customers = [customer.pk for customer in self.customers]
+        lines = []
+
+        def cheques(first):
+            for cheque_id in range(first, first + sizes['cheques']):
+                if rng.random() < 0.5:
+                    supplier_id, items = rng.choice(catalog)
+                    yield cheque_id, self.past_day(), None, supplier_id
+                else:
+                    items = sold
+                    yield cheque_id, self.past_day(), rng.choice(customers), None
+                count = min(rng.randint(1, 2 * sizes['lines_per_cheque'] - 1), len(items))
+                lines.extend((cheque_id, product_id, price, rng.randint(1, 50))
+                             for product_id, price in rng.sample(items, count))
+
+        def write_lines():
+            self.insert(ChequeProduct, ['cheque', 'product', 'price', 'quantity'], lines)
+            lines.clear()
+
+        first = (Cheque.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+        self.insert(Cheque, ['cheque_id', 'date', 'customer', 'supplier'], cheques(first), after=write_lines)
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Cheque]):
+                cursor.execute(sql)
+
+        products = [product.pk for product in self.products]
+        prices = dict(SupplierProductPrice.objects.values_list('product_id').annotate(price=Min('price')).order_by())
+
+        def debits():
+            for _ in range(sizes['debits']):
+                product_id, quantity = rng.choice(products), rng.randint(1, 50)
+                price = prices.get(product_id)
+                yield (product_id, quantity, self.past_day(), rng.random() < 0.5,
+                       price * quantity if price is not None else Decimal(0))
+
+        self.insert(DebitingList, ['product', 'quantity', 'date_of_debiting', 'fresh', 'amount'], debits())
+
+    # история сводится сразу, как если бы ее дни закрывались по одному:
+    # отчеты за прошлые периоды читают сводки и снимки капитала
+    def roll_up_history(self):
+        start, end = self.today - timedelta(days=self.history_days), self.today - timedelta(days=1)
+        rollup_days(start, end)
+        snapshot_days(start, end)
+
+    # партии пишутся в обход WarehouseProductsQuerySet.bulk_create, поэтому
+    # занятая масса складов пересчитывается после вставки
+    def generate_stock(self):
+        rng, sizes = self.rng, self.sizes
+        products = [(product.pk, product.expiry_date) for product in self.products]
+
+        def lots():
+            for _ in range(sizes['lots']):
+                product_id, expiry_date = rng.choice(products)
+                production_date = self.today - timedelta(days=rng.randrange(expiry_date))
+                yield product_id, rng.randint(1, 50), production_date, production_date + timedelta(days=expiry_date)
+
+        self.insert(WarehouseProducts, ['product', 'quantity', 'production_date', 'expires_on'], lots())
+        Warehouse.objects.rebuild_occupied_mass()
+        sold = self.semi + self.finished
+        self.stream(OrderList, (
+            OrderList(customer=rng.choice(self.customers), product=rng.choice(sold), quantity=rng.randint(1, 30),
+                      date_order=self.today, price=self.price(1000, 90000))
+            for _ in range(sizes['orders'])
+        ))
@@ -0,0 +1,157 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When, Window
+from django.utils import timezone
+
+from .models import (
+    Cheque,
+    ChequeProduct,
+    DebitingList,
+    CapitalLedger,
+    OrderList,
+    Product,
+    WarehouseProducts,
+    Workshop,
+)
+from .bom import product_recipes, recipe_ingredients
+from .ledger import post
+from .planner import OrderAllocation, ProductionPlan
+from .prices import cheapest_prices
+from .scheduler import WorkshopSchedule
+
+
+def stock_totals(product_ids=None):
+    lots = WarehouseProducts.objects.all()
+    if product_ids is not None:
+        lots = lots.filter(product_id__in=product_ids)
+    return dict(lots.values_list('product_id').annotate(total=Sum('quantity')).order_by())
+
+
+# списывает со склада amounts[product_id] штук, начиная с самых старых партий (FIFO)
+def consume_stock(amounts):
+    amounts = {product_id: quantity for product_id, quantity in amounts.items() if quantity > 0}
+    if not amounts:
+        return
+    need = Case(
+        *[When(product_id=product_id, then=Value(quantity)) for product_id, quantity in amounts.items()],
+        output_field=IntegerField(),
+    )
+    lots = WarehouseProducts.objects.filter(product_id__in=amounts).annotate(
+        need=need,
+        running=Window(Sum('quantity'), partition_by=[F('product_id')], order_by=[F('production_date').asc(), F('pk').asc()]),
+    )
+    boundary = [
+        WarehouseProducts(warehouse_products_id=lot['pk'], quantity=lot['running'] - lot['need'])
+        for lot in lots.annotate(before=F('running') - F('quantity'))
+        .filter(running__gt=F('need'), before__lt=F('need'))
+        .values('pk', 'running', 'need')
+    ]
+    WarehouseProducts.objects.filter(pk__in=lots.filter(running__lte=F('need')).values('pk')).delete()
+    WarehouseProducts.objects.bulk_update(boundary, ['quantity'])
+
+
+class DayClose:
+    def __init__(self, userdj):
+        self.userdj = userdj
+        self.date = userdj.date_now
+        self.prices = cheapest_prices()
+        self.capital = defaultdict(Decimal)
+
+    # движения капитала за день копятся в self.capital по видам проводок и
+    # записываются в журнал одним вызовом post, userdj.capital в памяти
+    # сдвигается на их сумму
+    def run(self):
+        with transaction.atomic():
+            self.workshop_phase()
+            self.order_phase()
+            self.debiting_phase()
+            post(self.userdj.pk, {(self.date, kind): amount for kind, amount in self.capital.items()})
+        self.userdj.capital += sum(self.capital.values())
+        return self.userdj
+
+    def write_cheques(self, cheques):
+        created = Cheque.objects.bulk_create([
+            Cheque(date=self.date, customer_id=customer_id, supplier_id=supplier_id)
+            for customer_id, supplier_id, lines in cheques
+        ])
+        ChequeProduct.objects.bulk_create([
+            ChequeProduct(cheque=cheque, product_id=line['product_id'], price=line['price'], quantity=line['quantity'])
+            for cheque, (customer_id, supplier_id, lines) in zip(created, cheques)
+            for line in lines
+        ])
+
+    def workshop_phase(self):
+        workshops = list(Workshop.objects.select_related('recipe__finish_product').order_by('pk'))
+        ingredients = defaultdict(list, recipe_ingredients())
+        stock = stock_totals({item.product_id for workshop in workshops for item in ingredients[workshop.recipe_id]})
+
+        plan = ProductionPlan(workshops, ingredients, stock, self.prices).plan()
+        self.capital[CapitalLedger.Kind.PURCHASE] -= plan.cost
+        self.write_cheques([
+            (None, supplier_id, purchases)
+            for supplier_id, purchases in plan.purchases_by_supplier().items()
+        ])
+        consume_stock(plan.consumed)
+        WarehouseProducts.objects.bulk_create([
+            WarehouseProducts(
+                product=product,
+                quantity=quantity,
+                production_date=self.date,
+                expires_on=self.date + timezone.timedelta(days=product.expiry_date),
+            )
+            for product, quantity in plan.produced
+            if quantity > 0
+        ])
+
+        recipes = product_recipes()
+        schedule = WorkshopSchedule(
+            workshops, list(OrderList.objects.order_by('pk')), stock_totals(), recipes, ingredients, self.prices,
+            dict(Product.objects.filter(pk__in=recipes).values_list('pk', 'mass')),
+        ).plan()
+        for workshop in workshops:
+            workshop.recipe_id = schedule.assignments[workshop.pk]
+        Workshop.objects.bulk_update(workshops, ['recipe'])
+
+    def order_phase(self):
+        orders = list(OrderList.objects.order_by('pk'))
+        allocation = OrderAllocation(orders, stock_totals({order.product_id for order in orders})).allocate()
+        self.capital[CapitalLedger.Kind.SALE] += allocation.revenue
+        self.write_cheques([
+            (order.customer_id, None, [{'product_id': order.product_id, 'price': order.price, 'quantity': quantity}])
+            for order, quantity in allocation.sales
+        ])
+        consume_stock(allocation.sold)
+        OrderList.objects.bulk_update(allocation.partial, ['quantity'])
+        OrderList.objects.filter(pk__in=[order.pk for order in allocation.closed]).delete()
+
+    def write_off(self, lots, fresh):
+        debits = []
+        for lot in lots:
+            price = self.prices.get(lot['product_id'])
+            # это кринж но надо по тз
+            amount = price.price * lot['quantity'] if price is not None else Decimal(0)
+            debits.append(DebitingList(product_id=lot['product_id'], quantity=lot['quantity'],
+                                       date_of_debiting=self.date, fresh=fresh, amount=amount))
+        DebitingList.objects.bulk_create(debits)
+        kind = CapitalLedger.Kind.FRESH_WRITE_OFF if fresh else CapitalLedger.Kind.STALE_WRITE_OFF
+        self.capital[kind] += sum(debit.amount for debit in debits)
+
+    def debiting_phase(self):
+        WarehouseProducts.objects.filter(quantity=0).delete()
+
+        stale = WarehouseProducts.objects.filter(expires_on__lt=self.date)
+        self.write_off(list(stale.order_by('pk').values('product_id', 'quantity')), fresh=False)
+        stale.delete()
+
+        overflow = WarehouseProducts.objects.annotate(
+            running=Window(
+                Sum('quantity'),
+                partition_by=[F('product__warehouse_id')],
+                order_by=[F('production_date').desc(), F('pk').desc()],
+            ),
+            capacity=F('product__warehouse__max_warehouse_capacity'),
+        ).filter(running__gt=F('capacity'))
+        self.write_off(list(overflow.values('product_id', 'quantity')), fresh=True)
+        WarehouseProducts.objects.filter(pk__in=overflow.values('pk')).delete()
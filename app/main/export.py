@@ -0,0 +1,82 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import ChequeProduct, DebitingList, OrderList
+
+CHUNK_SIZE = 5000
+
+
+# Выгрузки истории за период: строки собираются одним запросом с join и
+# читаются через iterator(chunk_size) (в PostgreSQL - серверным курсором),
+# поэтому память не зависит от объема выгрузки. Каждая выгрузка -
+# {имя: (подпись, поля, функция(start, end, warehouse) -> values_list)}.
+def cheque_lines(start, end, warehouse):
+    lines = ChequeProduct.objects.filter(cheque__date__range=[start, end])
+    if warehouse:
+        lines = lines.filter(product__warehouse=warehouse)
+    return lines.order_by('cheque_id', 'pk').values_list(
+        'cheque_id', 'cheque__date', 'cheque__supplier__name', 'cheque__customer__name',
+        'product__name', 'product__warehouse__category', 'price', 'quantity')
+
+
+def debits(start, end, warehouse):
+    debits = DebitingList.objects.filter(date_of_debiting__range=[start, end])
+    if warehouse:
+        debits = debits.filter(product__warehouse=warehouse)
+    return debits.order_by('date_of_debiting', 'pk').values_list(
+        'debiting_list_id', 'date_of_debiting', 'product__name', 'product__warehouse__category', 'quantity', 'fresh')
+
+
+def orders(start, end, warehouse):
+    orders = OrderList.objects.filter(date_order__range=[start, end])
+    if warehouse:
+        orders = orders.filter(product__warehouse=warehouse)
+    return orders.order_by('date_order', 'pk').values_list(
+        'order_list_id', 'date_order', 'customer__name', 'product__name', 'product__warehouse__category',
+        'quantity', 'price')
+
+
+EXPORTS = {
+    'cheques': ('чеки', ('cheque', 'date', 'supplier', 'customer', 'product', 'category', 'price', 'quantity'), cheque_lines),
+    'debiting': ('списания', ('debiting', 'date', 'product', 'category', 'quantity', 'fresh'), debits),
+    'orders': ('заказы', ('order', 'date', 'customer', 'product', 'category', 'quantity', 'price'), orders),
+}
+
+
+# csv.writer пишет в объект с write, который просто возвращает строку
+class Echo:
+    def write(self, value):
+        return value
+
+
+def csv_stream(fields, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def json_stream(fields, rows):
+    yield '['
+    separator = ''
+    for row in rows:
+        yield separator + json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder, ensure_ascii=False)
+        separator = ','
+    yield ']'
+
+
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', csv_stream),
+    'json': ('application/json', json_stream),
+}
+
+
+def export_links(*names):
+    return [(name, EXPORTS[name][0]) for name in names]
+
+
+def export_stream(name, output, start, end, warehouse=None):
+    label, fields, query = EXPORTS[name]
+    return FORMATS[output][1](fields, query(start, end, warehouse).iterator(chunk_size=CHUNK_SIZE))
@@ -1,3 +1,6 @@
+from collections import defaultdict
+from decimal import Decimal
+
 from django import forms
 from django.db import transaction
 from django.core.exceptions import ValidationError
@@ -17,8 +20,18 @@ from .models import (
     WarehouseProducts,
     DebitingList,
     Cheque,
-    ChequeProduct
+    ChequeProduct,
+    CapitalLedger,
 )
+from .bom import product_recipes, recipe_ingredients, uses
+from .clock import current_date
+from .day_close import DayClose, stock_totals
+from .ledger import post, snapshot_day
+from .prices import cheapest_price, cheapest_prices
+from .purchases import bulk_purchase, check_lines, parse_lines
+from .rollup import rollup_day
+from .scheduler import WorkshopSchedule
+from .simulation import Simulation
 
 class CustomerForm(forms.ModelForm):
     class Meta:
@@ -140,6 +153,13 @@ class RecipeProductsForm(forms.ModelForm):
             'quantity': forms.NumberInput(attrs={'class': 'form-control', 'min': 0}),
         }
 
+    def clean(self):
+        cleaned_data = super().clean()
+        recipe, product = cleaned_data.get('recipe'), cleaned_data.get('product')
+        if recipe and product and uses(product.pk, recipe.finish_product_id):
+            raise ValidationError('Продукт уже содержит в себе результат этого рецепта, получится цикл')
+        return cleaned_data
+
 class OrderListForm(forms.ModelForm):
     class Meta:
         model = OrderList
@@ -157,9 +177,9 @@ class OrderListForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super(OrderListForm, self).__init__(*args, **kwargs)
-        userdj = Userdj.objects.first()
-        if userdj:
-            self.initial['date_order'] = userdj.date_now
+        date_now = current_date()
+        if date_now:
+            self.initial['date_order'] = date_now
 
 
 class WorkshopForm(forms.ModelForm):
@@ -187,28 +207,34 @@ class WarehouseProductsForm(forms.ModelForm):
         
     def __init__(self, *args, **kwargs):
         super(WarehouseProductsForm, self).__init__(*args, **kwargs)
-        userdj = Userdj.objects.first()
-        if userdj:
-            self.initial['production_date'] = userdj.date_now
-
+        date_now = current_date()
+        if date_now:
+            self.initial['production_date'] = date_now
+
+    # партия, чек и капитал меняются одной транзакцией: непродаваемый продукт
+    # откатывает партию, а параллельные покупки не теряют списание капитала.
+    # Строка пользователя блокируется первой, до записи партии, - в том же
+    # порядке, что при закрытии дня и закупке списком, иначе в PostgreSQL
+    # покупка и закрытие дня могут ждать друг друга; дата под блокировкой не
+    # дает чеку попасть в уже закрытый параллельно день.
     def save(self, commit=True):
-        warehouse_product = super(WarehouseProductsForm, self).save(commit=commit)
-        
-        if commit:
-            if self.add_cheque_buy(warehouse_product):
-                raise ValidationError("Такой продукт не продается")
-        
+        with transaction.atomic():
+            userdj = Userdj.objects.select_for_update().order_by('pk').first()
+            warehouse_product = super(WarehouseProductsForm, self).save(commit=commit)
+
+            if commit:
+                if self.add_cheque_buy(warehouse_product, userdj):
+                    raise ValidationError("Такой продукт не продается")
 
         return warehouse_product
     
-    def add_cheque_buy(self, warehouse_product):
-        supplier_product_price = SupplierProductPrice.objects.filter(product=warehouse_product.product).order_by('price').first()
+    def add_cheque_buy(self, warehouse_product, userdj):
+        supplier_product_price = cheapest_price(warehouse_product.product_id)
         if supplier_product_price:
-            userdj = Userdj.objects.first()
             cheque = Cheque.objects.create(
                 date=userdj.date_now,  
                 customer=None,
-                supplier=supplier_product_price.supplier,
+                supplier_id=supplier_product_price.supplier_id,
             )
             ChequeProduct.objects.create(
                 cheque=cheque,
@@ -216,11 +242,37 @@ class WarehouseProductsForm(forms.ModelForm):
                 price=supplier_product_price.price,
                 quantity=warehouse_product.quantity,
             )
-            userdj.capital -= float(warehouse_product.quantity) * float(supplier_product_price.price)
-            userdj.save()
+            post(userdj.pk, {
+                (userdj.date_now, CapitalLedger.Kind.PURCHASE): -warehouse_product.quantity * supplier_product_price.price,
+            })
             return False
         return True
 
+class BulkPurchaseForm(forms.Form):
+    file = forms.FileField(label='Файл JSON или CSV (product, quantity, production_date)')
+
+    def clean_file(self):
+        upload = self.cleaned_data['file']
+        lines = parse_lines(upload.read(), upload.name)
+        errors = check_lines(lines, Product.objects.in_bulk({line[0] for line in lines}), cheapest_prices())
+        if errors:
+            raise ValidationError(errors)
+        return lines
+
+    def save(self, commit=True):
+        return bulk_purchase(self.cleaned_data['file'])
+
+# через веб - не больше месяца за запрос, длинные прокрутки - командой simulate
+class SimulateForm(forms.ModelForm):
+    days = forms.IntegerField(min_value=1, max_value=31, initial=30, label='Количество дней')
+
+    class Meta:
+        model = Userdj
+        fields = []
+
+    def save(self, commit=True):
+        return Simulation(self.instance).run(self.cleaned_data['days'])
+
 class UserdjForm(forms.ModelForm):
     class Meta:
         model = Userdj
@@ -229,42 +281,70 @@ class UserdjForm(forms.ModelForm):
             'date_now': forms.HiddenInput(),
             }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # движения капитала построчного закрытия дня {(date, kind): сумма}
+        self.moves = defaultdict(Decimal)
+
+    # Строка пользователя перечитывается внутри транзакции под блокировкой
+    # (в SQLite ее уже держит BEGIN IMMEDIATE, в PostgreSQL - SELECT ... FOR
+    # UPDATE), поэтому капитал, измененный покупками после загрузки формы, не
+    # затирается, а повторно отправленная форма со старой датой не закрывает
+    # тот же день второй раз.
     def save(self, commit=True):
         userdj = super().save(commit=False)
-        if userdj.date_now:
-            userdj.date_now += timezone.timedelta(days=1)
-            self.new_day(userdj)
-        if commit:
-            userdj.save()
+        posted = userdj.date_now
+        with transaction.atomic():
+            userdj.refresh_from_db(from_queryset=Userdj.objects.select_for_update())
+            if userdj.date_now != posted:
+                return userdj
+            if userdj.date_now:
+                rollup_day(userdj.date_now)
+                snapshot_day(userdj.date_now)
+                userdj.date_now += timezone.timedelta(days=1)
+                self.new_day(userdj)
+            if commit:
+                # капитал уже записан приращением в new_day
+                userdj.save(update_fields=['date_now'])
         return userdj
 
     def new_day(self, userdj):
+        DayClose(userdj).run()
+
+    # построчная реализация закрытия дня, эталон для DayClose
+    def new_day_by_rows(self, userdj):
         self.workshop_update(userdj)
         self.order_update(userdj)
         self.debiting_update(userdj)
+        post(userdj.pk, self.moves)
+        self.moves.clear()
+
+    def move(self, userdj, kind, amount):
+        userdj.capital += amount
+        self.moves[userdj.date_now, kind] += amount
     
     def order_update(self, userdj):
         order_list = OrderList.objects.all()
         for order in order_list:
-            warehouse_products = WarehouseProducts.objects.filter(product = order.product)
+            warehouse_products = WarehouseProducts.objects.filter(product = order.product).order_by('production_date', 'pk')
             total_quantity = warehouse_products.aggregate(total=Sum('quantity'))['total'] or 0
             if total_quantity < order.quantity:
-                cheque = Cheque.objects.create(
-                    date=userdj.date_now,  
-                    customer=order.customer,
-                    supplier=None,
-                )
-                ChequeProduct.objects.create(
-                    cheque=cheque,
-                    product=order.product,
-                    price= float(order.price),
-                    quantity = total_quantity,
-                )
-                userdj.capital +=  float(order.price)
-                userdj.save()
-                warehouse_products.delete()
-                order.quantity -= total_quantity
-                order.save()
+                if total_quantity:
+                    cheque = Cheque.objects.create(
+                        date=userdj.date_now,  
+                        customer=order.customer,
+                        supplier=None,
+                    )
+                    ChequeProduct.objects.create(
+                        cheque=cheque,
+                        product=order.product,
+                        price= order.price,
+                        quantity = total_quantity,
+                    )
+                    self.move(userdj, CapitalLedger.Kind.SALE, order.price * total_quantity)
+                    warehouse_products.delete()
+                    order.quantity -= total_quantity
+                    order.save()
             elif total_quantity >= order.quantity:
                 cheque = Cheque.objects.create(
                     date=userdj.date_now,  
@@ -274,11 +354,10 @@ class UserdjForm(forms.ModelForm):
                 ChequeProduct.objects.create(
                     cheque=cheque,
                     product=order.product,
-                    price=float(order.price),
+                    price=order.price,
                     quantity=order.quantity,
                 )
-                userdj.capital += float(order.price)
-                userdj.save()
+                self.move(userdj, CapitalLedger.Kind.SALE, order.price * order.quantity)
                 for warehouse_product in warehouse_products:
                     if warehouse_product.quantity >= order.quantity:
                         warehouse_product.quantity -= order.quantity
@@ -290,7 +369,7 @@ class UserdjForm(forms.ModelForm):
                 order.delete()
 
     def workshop_update(self, userdj):
-        workshops = Workshop.objects.all()
+        workshops = Workshop.objects.order_by('pk')
         for workshop in workshops:
             if workshop.recipe:
                 recipe_products = RecipeProducts.objects.filter(recipe = workshop.recipe)
@@ -298,23 +377,23 @@ class UserdjForm(forms.ModelForm):
                 end_of_work = True
                 for recipe_product in recipe_products:
                     quantity_recipe_product = recipe_product.quantity * quantity
-                    warehouse_products = WarehouseProducts.objects.filter(product = recipe_product.product)
-                    supplier_product_price = SupplierProductPrice.objects.filter(product=recipe_product.product).order_by('price').first()
+                    warehouse_products = WarehouseProducts.objects.filter(product = recipe_product.product).order_by('production_date', 'pk')
+                    supplier_product_price = cheapest_price(recipe_product.product_id)
                     sum_warehouse = sum(item['quantity'] for item in warehouse_products.values('quantity'))
-                    if sum_warehouse < quantity_recipe_product or supplier_product_price:
+                    if sum_warehouse < quantity_recipe_product and supplier_product_price:
                         cheque = Cheque.objects.create(
                             date=userdj.date_now,  
                             customer=None,
-                            supplier=supplier_product_price.supplier,
+                            supplier_id=supplier_product_price.supplier_id,
                         )
                         ChequeProduct.objects.create(
                             cheque=cheque,
                             product=recipe_product.product,
                             price=supplier_product_price.price,
-                            quantity = quantity - sum_warehouse,
+                            quantity = quantity_recipe_product - sum_warehouse,
                         )
-                        userdj.capital -= (quantity_recipe_product - sum_warehouse) * float(supplier_product_price.price)
-                        userdj.save()
+                        self.move(userdj, CapitalLedger.Kind.PURCHASE,
+                                  -(quantity_recipe_product - sum_warehouse) * supplier_product_price.price)
                         for i in warehouse_products:
                             i.delete()
                     elif sum_warehouse >= quantity_recipe_product:
@@ -322,6 +401,7 @@ class UserdjForm(forms.ModelForm):
                             if warehouse_product.quantity >= quantity_recipe_product:
                                 warehouse_product.quantity -= quantity_recipe_product
                                 warehouse_product.save()
+                                break
                             else:
                                 quantity_recipe_product -= warehouse_product.quantity
                                 warehouse_product.delete()
@@ -339,53 +419,60 @@ class UserdjForm(forms.ModelForm):
                 workshop.recipe = None
                 workshop.save()
 
-        order_list = OrderList.objects.all()
-        for order, workshop in zip([order for order in order_list if Recipe.objects.get(finish_product=order.product)], workshops):
-            workshop.recipe = Recipe.objects.get(finish_product=order.product)
+        recipes = product_recipes()
+        schedule = WorkshopSchedule(
+            list(workshops), list(OrderList.objects.order_by('pk')), stock_totals(), recipes, recipe_ingredients(),
+            cheapest_prices(), dict(Product.objects.filter(pk__in=recipes).values_list('pk', 'mass')),
+        ).plan()
+        for workshop in workshops:
+            workshop.recipe_id = schedule.assignments[workshop.pk]
             workshop.save()
 
     def debiting_update(self, userdj):
         warehouse_products = WarehouseProducts.objects.all()
         for warehouse_product in warehouse_products:
             if warehouse_product.quantity == 0:
-                warehouse_products.delete()
+                warehouse_product.delete()
         warehouse_products = WarehouseProducts.objects.all()
         for warehouse_product in warehouse_products:
             if warehouse_product.production_date + timezone.timedelta(days=warehouse_product.product.expiry_date) < userdj.date_now:
+                # это кринж но надо по тз
+                supplier_product_price = cheapest_price(warehouse_product.product_id)
+                amount = supplier_product_price.price * warehouse_product.quantity if supplier_product_price else 0
                 DebitingList.objects.create(
                     product = warehouse_product.product,
                     quantity = warehouse_product.quantity,
                     date_of_debiting = userdj.date_now,
                     fresh = False,
+                    amount = amount,
                 )
-                # это кринж но надо по тз
-                supplier_product_price = SupplierProductPrice.objects.filter(product=warehouse_product.product).order_by('price').first()
                 if supplier_product_price is not None:
-                    userdj.capital += float(supplier_product_price.price )* float(warehouse_product.quantity)
+                    self.move(userdj, CapitalLedger.Kind.STALE_WRITE_OFF, amount)
 
                 warehouse_product.delete()
 
         warehouses = Warehouse.objects.all()
         for warehouse in warehouses:
             max_warehouse_capacity = warehouse.max_warehouse_capacity
-            warehouse_products = WarehouseProducts.objects.filter(product__in = Product.objects.filter(warehouse = warehouse))
+            # свежие партии остаются на складе, списываются самые старые
+            warehouse_products = WarehouseProducts.objects.filter(product__in = Product.objects.filter(warehouse = warehouse)).order_by('-production_date', '-pk')
             for warehouse_product in warehouse_products:
                 max_warehouse_capacity -= warehouse_product.quantity
                 if max_warehouse_capacity < 0:
+                    # это кринж но надо по тз
+                    supplier_product_price = cheapest_price(warehouse_product.product_id)
+                    amount = supplier_product_price.price * warehouse_product.quantity if supplier_product_price else 0
                     DebitingList.objects.create(
                         product = warehouse_product.product,
                         quantity = warehouse_product.quantity,
                         date_of_debiting = userdj.date_now,
                         fresh = True,
+                        amount = amount,
                     )
-                    # это кринж но надо по тз
-                    supplier_product_price = SupplierProductPrice.objects.filter(product=warehouse_product.product).order_by('price').first()
                     if supplier_product_price:
-                        userdj.capital += float(supplier_product_price.price) * float(warehouse_product.quantity)
+                        self.move(userdj, CapitalLedger.Kind.FRESH_WRITE_OFF, amount)
 
                     warehouse_product.delete()
-                    self.debiting_update(userdj)
-                    break
 
                 
 
@@ -0,0 +1,109 @@
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.db import connection
+from django.db.models import F, Sum
+from django.utils.dateparse import parse_date
+
+from .clock import invalidate_clock
+from .models import CapitalLedger, CapitalSnapshot, Userdj, from_kopecks, to_kopecks
+
+Kind = CapitalLedger.Kind
+
+
+# Проводки {(date, kind): сумма в рублях} пишутся в журнал одним bulk_create,
+# а капитал меняется их суммой одним UPDATE ... SET capital_kopecks =
+# capital_kopecks + delta: не требует читать капитал и не теряет
+# параллельные изменения
+def post(userdj_id, amounts):
+    entries = [
+        CapitalLedger(date=day, kind=kind, amount=to_kopecks(amount))
+        for (day, kind), amount in sorted(amounts.items())
+    ]
+    entries = [entry for entry in entries if entry.amount]
+    CapitalLedger.objects.bulk_create(entries)
+    delta = sum(entry.amount for entry in entries)
+    if delta:
+        Userdj.objects.filter(pk=userdj_id).update(capital_kopecks=F('capital_kopecks') + delta)
+    invalidate_clock()
+
+
+def empty_totals():
+    return dict.fromkeys(Kind.values, 0)
+
+
+def snapshot_totals(snapshot):
+    return {kind: getattr(snapshot, kind) for kind in Kind.values} if snapshot else empty_totals()
+
+
+# суммы журнала по дням и видам после снимка snapshot и не позже end
+def daily_entries(snapshot, end):
+    entries = CapitalLedger.objects.filter(date__lte=end)
+    if snapshot:
+        entries = entries.filter(date__gt=snapshot.date)
+    daily = defaultdict(dict)
+    for day, kind, total in entries.values_list('date', 'kind').annotate(total=Sum('amount')).order_by():
+        daily[day][kind] = total
+    return daily
+
+
+# Снимки нарастающих итогов на конец каждого дня [start, end]: от последнего
+# снимка раньше start прибавляются суммы журнала по дням. Закрытые дни больше
+# не получают проводок, поэтому снимок дня считается один раз при закрытии.
+def snapshot_days(start, end):
+    previous = CapitalSnapshot.objects.filter(date__lt=start).order_by('-date').first()
+    totals = snapshot_totals(previous)
+    daily = daily_entries(previous, end)
+    for day in sorted(day for day in daily if day < start):
+        for kind, amount in daily[day].items():
+            totals[kind] += amount
+
+    rows = []
+    day = start
+    while day <= end:
+        for kind, amount in daily.get(day, {}).items():
+            totals[kind] += amount
+        rows.append(CapitalSnapshot(date=day, **totals))
+        day += timedelta(days=1)
+    if not connection.features.supports_update_conflicts_with_target:
+        CapitalSnapshot.objects.filter(date__range=[start, end]).delete()
+        CapitalSnapshot.objects.bulk_create(rows)
+        return
+    CapitalSnapshot.objects.bulk_create(rows, update_conflicts=True, unique_fields=['date'], update_fields=Kind.values)
+
+
+def snapshot_day(day):
+    snapshot_days(day, day)
+
+
+# нарастающие итоги {kind: копейки} на конец дня day: последний снимок не
+# позже day плюс проводки после него (для закрытых дней - один запрос)
+def cumulative(day):
+    snapshot = CapitalSnapshot.objects.filter(date__lte=day).order_by('-date').first()
+    totals = snapshot_totals(snapshot)
+    if snapshot is None or snapshot.date < day:
+        for amounts in daily_entries(snapshot, day).values():
+            for kind, amount in amounts.items():
+                totals[kind] += amount
+    return totals
+
+
+# движение капитала за период как разность нарастающих итогов на его концах
+def capital_summary(start, end):
+    if isinstance(start, str):
+        start, end = parse_date(start), parse_date(end)
+    before, after = cumulative(start - timedelta(days=1)), cumulative(end)
+    return {
+        'start': start,
+        'end': end,
+        'opening_balance': from_kopecks(sum(before.values())),
+        'closing_balance': from_kopecks(sum(after.values())),
+        'movements': [(label, from_kopecks(after[kind] - before[kind])) for kind, label in Kind.choices],
+    }
+
+
+# границы квартала (1-4) или, без квартала, всего года
+def period_bounds(year, quarter=None):
+    if not quarter:
+        return date(year, 1, 1), date(year, 12, 31)
+    return date(year, 3 * quarter - 2, 1), date(year + quarter // 4, 3 * quarter % 12 + 1, 1) - timedelta(days=1)
@@ -0,0 +1,122 @@
+import random
+import statistics
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from main.models import (
+    Cheque,
+    Customer,
+    DebitingList,
+    OrderList,
+    Product,
+    Supplier,
+    SupplierProductPrice,
+    Warehouse,
+    WarehouseProducts,
+)
+
+START = date(2020, 1, 1)
+DAYS = 1000
+
+
+# горячие пути выборки из forms.py и views.py: (модель, индекс, запрос по случайному ключу)
+def access_paths(rng, products, suppliers, customers):
+    def day():
+        return START + timedelta(days=rng.randrange(DAYS))
+
+    return [
+        (WarehouseProducts, 'warehouse_products_fifo_idx',
+         lambda: WarehouseProducts.objects.filter(product=rng.choice(products)).order_by('production_date')),
+        (Cheque, 'cheque_date_supplier_idx',
+         lambda: Cheque.objects.filter(date=day(), supplier=rng.choice(suppliers))),
+        (Cheque, 'cheque_date_customer_idx',
+         lambda: Cheque.objects.filter(date=day(), customer=rng.choice(customers))),
+        (DebitingList, 'debiting_list_date_idx',
+         lambda: DebitingList.objects.filter(date_of_debiting=day(), fresh=True)),
+        (SupplierProductPrice, 'supplier_price_product_idx',
+         lambda: SupplierProductPrice.objects.filter(product=rng.choice(products)).order_by('price')[:1]),
+        (OrderList, 'order_list_date_idx',
+         lambda: OrderList.objects.filter(date_order=day())),
+    ]
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает план (EXPLAIN) и время горячих запросов с составными индексами и без них '
+            'на синтетических данных; данные откатываются')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10 ** 4, 10 ** 5], help='строк в каждой таблице')
+        parser.add_argument('--repeat', type=int, default=200, help='запросов на замер')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        for size in options['sizes']:
+            with transaction.atomic():
+                self.bench(size, options['repeat'], random.Random(options['seed']))
+                transaction.set_rollback(True)
+
+    def fill(self, size, rng):
+        warehouse = Warehouse.objects.create(category='Бенчмарк', max_warehouse_capacity=10 ** 9)
+        products = Product.objects.bulk_create([
+            Product(name=f'Бенчмарк {i}', warehouse=warehouse, expiry_date=DAYS, mass=1)
+            for i in range(max(size // 100, 10))
+        ])
+        suppliers = Supplier.objects.bulk_create([Supplier(name=f'Поставщик {i}') for i in range(100)])
+        customers = Customer.objects.bulk_create([Customer(name=f'Клиент {i}') for i in range(100)])
+
+        def day():
+            return START + timedelta(days=rng.randrange(DAYS))
+
+        def rows(model, make):
+            model.objects.bulk_create((make() for _ in range(size)), batch_size=5000)
+
+        rows(WarehouseProducts, lambda: WarehouseProducts(
+            product=rng.choice(products), quantity=rng.randint(1, 50), production_date=day(), expires_on=day()))
+        rows(Cheque, lambda: Cheque(date=day(), **(
+            {'supplier': rng.choice(suppliers)} if rng.random() < 0.5 else {'customer': rng.choice(customers)})))
+        rows(DebitingList, lambda: DebitingList(
+            product=rng.choice(products), quantity=rng.randint(1, 50), date_of_debiting=day(), fresh=rng.random() < 0.5))
+        rows(OrderList, lambda: OrderList(
+            customer=rng.choice(customers), product=rng.choice(products), quantity=rng.randint(1, 50),
+            date_order=day(), price=Decimal(rng.randint(100, 10000)) / 100))
+        SupplierProductPrice.objects.bulk_create([
+            SupplierProductPrice(supplier=supplier, product=product, price=Decimal(rng.randint(100, 10000)) / 100)
+            for product in products
+            for supplier in rng.sample(suppliers, 3)
+        ], batch_size=5000)
+        return products, suppliers, customers
+
+    # план запрашивается с пометкой в тексте: sqlite3 кэширует подготовленные
+    # EXPLAIN и после DROP INDEX иначе вернет старый план
+    def explain(self, queryset, label):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql} /* {label} */', params)
+            return ' | '.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+    def measure(self, query, repeat):
+        list(query())
+        timings = []
+        for _ in range(repeat):
+            queryset = query()
+            start = time.perf_counter_ns()
+            list(queryset)
+            timings.append(time.perf_counter_ns() - start)
+        return statistics.median(timings) / 1000
+
+    def bench(self, size, repeat, rng):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'Строк в таблице: {size}'))
+        for model, index, query in access_paths(rng, *self.fill(size, rng)):
+            plan, elapsed = self.explain(query(), 'с индексом'), self.measure(query, repeat)
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP INDEX {connection.ops.quote_name(index)}')
+            plan_without, elapsed_without = self.explain(query(), 'без индекса'), self.measure(query, repeat)
+
+            self.stdout.write(f'{model._meta.db_table} / {index}')
+            self.stdout.write(f'  с индексом:  {elapsed:10.1f} мкс  {plan}')
+            self.stdout.write(f'  без индекса: {elapsed_without:10.1f} мкс  {plan_without}')
+            self.stdout.write(f'  ускорение: x{elapsed_without / elapsed:.1f}')
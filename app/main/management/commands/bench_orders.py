@@ -0,0 +1,63 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from main.day_close import DayClose
+from main.models import Customer, OrderList, Product, Userdj, Warehouse, WarehouseProducts
+
+
+class Command(BaseCommand):
+    help = 'Замеряет пропускную способность распределения остатков по заказам (заказов/с); данные откатываются'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=10000, help='количество заказов')
+        parser.add_argument('--products', type=int, default=50, help='количество продуктов')
+        parser.add_argument('--lots', type=int, default=20, help='партий на продукт')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            today = date(2024, 1, 10)
+            userdj = Userdj(date_now=today, capital=0)
+            warehouse = Warehouse.objects.create(category='Бенчмарк', max_warehouse_capacity=10 ** 9)
+            customer = Customer.objects.create(name='Бенчмарк')
+            products = [
+                Product.objects.create(name=f'Бенчмарк {i}', warehouse=warehouse, expiry_date=30, mass=1)
+                for i in range(options['products'])
+            ]
+            WarehouseProducts.objects.bulk_create([
+                WarehouseProducts(
+                    product=product,
+                    quantity=rng.randint(1, 50),
+                    production_date=today - timedelta(days=rng.randint(0, 29)),
+                    expires_on=today + timedelta(days=1),
+                )
+                for product in products
+                for _ in range(options['lots'])
+            ], batch_size=1000)
+            OrderList.objects.bulk_create([
+                OrderList(
+                    customer=customer,
+                    product=rng.choice(products),
+                    quantity=rng.randint(1, 10),
+                    date_order=today,
+                    price=Decimal(rng.randint(100, 10000)) / 100,
+                )
+                for _ in range(options['orders'])
+            ], batch_size=1000)
+
+            start = time.perf_counter()
+            DayClose(userdj).order_phase()
+            elapsed = time.perf_counter() - start
+            left = OrderList.objects.filter(customer=customer).count()
+            transaction.set_rollback(True)
+
+        self.stdout.write(
+            f'Заказов: {options["orders"]}, закрыто: {options["orders"] - left}, '
+            f'время: {elapsed:.3f} с, {options["orders"] / elapsed:.0f} заказов/с'
+        )
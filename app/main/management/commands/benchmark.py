@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.benchmarks import SCENARIOS, compare, export_csv, export_json, run_suite
+
+
+class Command(BaseCommand):
+    help = ('Замеряет закрытие дня, отчеты и закупку на синтетических данных разного размера; '
+            'данные откатываются')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000], help='партий на складе')
+        parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), help='по умолчанию все')
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', help='сохранить результаты в JSON (годится как базовый прогон)')
+        parser.add_argument('--csv', help='сохранить результаты в CSV')
+        parser.add_argument('--baseline', help='JSON прошлого прогона для сравнения')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='допустимое замедление p50 относительно базового прогона')
+
+    def handle(self, *args, **options):
+        results = run_suite(options['sizes'], options['scenarios'], options['warmup'], options['repeat'], options['seed'])
+        for row in results:
+            self.stdout.write(
+                f'{row["scenario"]:<16} {row["size"]:>9}  '
+                f'p50 {row["p50_ms"]:9.2f} мс  p90 {row["p90_ms"]:9.2f} мс  p99 {row["p99_ms"]:9.2f} мс'
+            )
+        if options['json']:
+            export_json(results, options['json'])
+        if options['csv']:
+            export_csv(results, options['csv'])
+
+        if options['baseline']:
+            regressions = []
+            for row, baseline, ratio in compare(results, options['baseline']):
+                self.stdout.write(f'{row["scenario"]:<16} {row["size"]:>9}  {baseline:9.2f} -> {row["p50_ms"]:9.2f} мс  x{ratio:.2f}')
+                if ratio > 1 + options['tolerance']:
+                    regressions.append(row)
+            if regressions:
+                raise CommandError(f'Замедлений больше допуска: {len(regressions)}')
+            self.stdout.write(self.style.SUCCESS('Замедлений нет'))
@@ -0,0 +1,32 @@
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from main.purchases import bulk_purchase, parse_lines
+
+
+class Command(BaseCommand):
+    help = 'Закупает сырье списком из файла JSON или CSV (product, quantity, production_date) одной транзакцией'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='файл со строками закупки')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], 'rb') as upload:
+                lines = parse_lines(upload.read(), options['path'])
+        except OSError as error:
+            raise CommandError(error)
+        except ValidationError as error:
+            raise CommandError('; '.join(error.messages))
+
+        start = time.perf_counter()
+        try:
+            result = bulk_purchase(lines)
+        except ValidationError as error:
+            raise CommandError('; '.join(error.messages))
+        self.stdout.write(self.style.SUCCESS(
+            f'Куплено партий: {result["lots"]}, чеков: {result["cheques"]}, на сумму {result["cost"]:.2f} '
+            f'за {time.perf_counter() - start:.2f} с'
+        ))
@@ -0,0 +1,52 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from main.dataset import Dataset
+from main.models import Product
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическим набором данных, детерминированным по seed; '
+            'объемы строк масштабируются через --scale (при --scale 2 около 10^7 строк)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--scale', type=float, default=1, help='множитель для партий, чеков, списаний и заказов')
+        parser.add_argument('--products', type=int, default=3000)
+        parser.add_argument('--suppliers', type=int, default=200)
+        parser.add_argument('--customers', type=int, default=1000)
+        parser.add_argument('--prices-per-product', type=int, default=3)
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--workshops', type=int, default=50)
+        parser.add_argument('--lots', type=int, default=10 ** 6)
+        parser.add_argument('--orders', type=int, default=10 ** 4)
+        parser.add_argument('--cheques', type=int, default=10 ** 6)
+        parser.add_argument('--lines-per-cheque', type=int, default=3, help='в среднем')
+        parser.add_argument('--debits', type=int, default=10 ** 5)
+        parser.add_argument('--history-days', type=int, default=3 * 365)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--flush', action='store_true', help='предварительно очистить базу (manage.py flush)')
+
+    def handle(self, *args, **options):
+        if options['flush']:
+            call_command('flush', interactive=False, verbosity=0)
+        elif Product.objects.exists():
+            raise CommandError('База не пуста, запустите с --flush')
+
+        scaled = {name: int(options[name] * options['scale']) for name in ('lots', 'orders', 'cheques', 'debits')}
+        dataset = Dataset(
+            seed=options['seed'], products=options['products'], suppliers=options['suppliers'],
+            customers=options['customers'], prices_per_product=options['prices_per_product'],
+            recipes=options['recipes'], workshops=options['workshops'], lines_per_cheque=options['lines_per_cheque'],
+            history_days=options['history_days'], batch_size=options['batch_size'], **scaled,
+        )
+        start = time.perf_counter()
+        created = dataset.generate()
+        elapsed = time.perf_counter() - start
+
+        for model, count in created.items():
+            self.stdout.write(f'{model:<22} {count:>12}')
+        total = sum(created.values())
+        self.stdout.write(self.style.SUCCESS(f'Создано строк: {total} за {elapsed:.1f} с ({total / elapsed:.0f} строк/с)'))
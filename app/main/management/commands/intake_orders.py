@@ -0,0 +1,36 @@
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from main.orders import intake_upload
+
+
+class Command(BaseCommand):
+    help = 'Принимает пачку заказов из файла JSON или CSV (customer, product, quantity, price)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='файл со строками заказов')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], 'rb') as upload:
+                content = upload.read()
+        except OSError as error:
+            raise CommandError(error)
+
+        start = time.perf_counter()
+        try:
+            result = intake_upload(content, options['path'])
+        except ValidationError as error:
+            raise CommandError('; '.join(error.messages))
+        elapsed = time.perf_counter() - start
+
+        for line in result['lines']:
+            if 'errors' in line:
+                self.stdout.write(f'Строка {line["line"]}: {"; ".join(line["errors"])}')
+        total = result['accepted'] + result['rejected']
+        self.stdout.write(self.style.SUCCESS(
+            f'Принято заказов: {result["accepted"]}, отклонено: {result["rejected"]} '
+            f'за {elapsed:.2f} с ({total / elapsed if elapsed else 0:.0f} строк/с)'
+        ))
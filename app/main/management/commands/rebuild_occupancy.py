@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.models import Warehouse, WarehouseProducts
+
+
+class Command(BaseCommand):
+    help = 'Сверяет и пересчитывает занятую массу складов по партиям WarehouseProducts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='только сверить, не исправляя')
+
+    def handle(self, *args, **options):
+        occupied = WarehouseProducts.objects.occupied_mass()
+        mismatched = [
+            (warehouse, occupied.get(warehouse.pk) or 0)
+            for warehouse in Warehouse.objects.order_by('pk')
+            if round(warehouse.occupied_mass - (occupied.get(warehouse.pk) or 0), 2)
+        ]
+        for warehouse, actual in mismatched:
+            self.stdout.write(f'Склад {warehouse.pk}: счетчик {warehouse.occupied_mass} кг, по партиям {actual} кг')
+
+        if options['check']:
+            if mismatched:
+                raise CommandError(f'Расхождений: {len(mismatched)}')
+            self.stdout.write(self.style.SUCCESS('Расхождений нет'))
+            return
+
+        Warehouse.objects.rebuild_occupied_mass()
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано складов: {Warehouse.objects.count()}'))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from main.bom import product_recipes, recipe_ingredients
+from main.day_close import stock_totals
+from main.models import OrderList, Product, Workshop
+from main.prices import cheapest_prices
+from main.scheduler import WorkshopSchedule
+
+
+class Command(BaseCommand):
+    help = 'Показывает назначение рецептов цехам на завтра и качество плана по текущему состоянию, ничего не меняя'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--time-limit', type=float, default=None,
+                            help='ограничение времени эвристики, с (по умолчанию без ограничения)')
+
+    def handle(self, *args, **options):
+        recipes = product_recipes()
+        workshops = list(Workshop.objects.order_by('pk'))
+        schedule = WorkshopSchedule(
+            workshops, list(OrderList.objects.order_by('pk')), stock_totals(), recipes, recipe_ingredients(),
+            cheapest_prices(), dict(Product.objects.filter(pk__in=recipes).values_list('pk', 'mass')),
+            time_limit=options['time_limit'],
+        ).plan()
+
+        products = {recipe_id: product_id for product_id, recipe_id in recipes.items()}
+        names = dict(Product.objects.filter(
+            pk__in=[products[recipe_id] for recipe_id in schedule.assignments.values() if recipe_id]
+        ).values_list('pk', 'name'))
+        for workshop in workshops:
+            recipe_id = schedule.assignments[workshop.pk]
+            product = names[products[recipe_id]] if recipe_id else 'простаивает'
+            self.stdout.write(f'{workshop.name}: {product}')
+
+        report = schedule.report()
+        self.stdout.write(f'Спрос по заказам сверх остатков: {report["backlog"]} шт')
+        self.stdout.write(f'Закрывается планом: {report["covered"]} шт ({report["coverage"]:.0%}), '
+                          f'прежним назначением: {report["baseline_covered"]} шт ({report["baseline_coverage"]:.0%})')
+        self.stdout.write(f'Загружено цехов: {report["busy_workshops"]} из {len(workshops)}, '
+                          f'использование мощности: {report["utilization"]:.0%}')
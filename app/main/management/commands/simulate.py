@@ -0,0 +1,52 @@
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from main.models import Userdj
+from main.simulation import Simulation
+
+
+class Command(BaseCommand):
+    help = 'Прокручивает симуляцию на несколько дней вперед, записывая изменения в базу пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, required=True)
+        parser.add_argument('--flush-every', type=int, default=30, help='через сколько дней сбрасывать изменения в базу')
+        parser.add_argument('--columnar', action='store_true', help='держать остатки в столбцах NumPy')
+        parser.add_argument('--dry-run', action='store_true', help='только посчитать, ничего не записывая в базу')
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError('--days должно быть положительным')
+        userdj = Userdj.objects.first()
+        if userdj is None:
+            raise CommandError('Нет пользователя симуляции')
+        stock = None
+        if options['columnar']:
+            from main.columnar import ColumnarLotStore
+            stock = ColumnarLotStore.load()
+
+        start = time.perf_counter()
+        simulation = Simulation(userdj, flush_every=options['flush_every'], stock=stock)
+        if options['dry_run']:
+            simulation.preview(options['days'])
+        else:
+            try:
+                simulation.run(options['days'])
+            except ValidationError as error:
+                raise CommandError(' '.join(error.messages))
+        elapsed = time.perf_counter() - start
+
+        if options['dry_run']:
+            purchases = sum(line['quantity'] for date, customer_id, supplier_id, lines in simulation.cheques
+                            if supplier_id for line in lines)
+            self.stdout.write(f'Закуплено сырья, шт: {purchases}')
+            self.stdout.write(f'Списано, шт: {sum(debit.quantity for debit in simulation.debits)}')
+            if options['columnar']:
+                for warehouse_id, mass in sorted(stock.occupied_mass(simulation.warehouses).items()):
+                    self.stdout.write(f'Склад {warehouse_id}: занято {mass:.2f} кг')
+        self.stdout.write(self.style.SUCCESS(
+            f'Дата: {simulation.date}, капитал: {simulation.capital:.2f}, '
+            f'{options["days"]} дн. за {elapsed:.2f} с{" (без записи в базу)" if options["dry_run"] else ""}'
+        ))
@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def fill_expires_on(apps, schema_editor):
+    WarehouseProducts = apps.get_model('main', 'WarehouseProducts')
+    for product_id, production_date, expiry_date in (
+            WarehouseProducts.objects.values_list('product_id', 'production_date', 'product__expiry_date').distinct()):
+        WarehouseProducts.objects.filter(product_id=product_id, production_date=production_date).update(
+            expires_on=production_date + timedelta(days=expiry_date))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='warehouseproducts',
+            name='expires_on',
+            field=models.DateField(null=True),
+        ),
+        migrations.RunPython(fill_expires_on, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='warehouseproducts',
+            name='expires_on',
+            field=models.DateField(db_index=True),
+        ),
+    ]
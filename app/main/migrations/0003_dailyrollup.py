@@ -0,0 +1,71 @@
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Case, DecimalField, F, Sum, Value, When
+
+
+def fill_daily_rollup(apps, schema_editor):
+    Userdj = apps.get_model('main', 'Userdj')
+    ChequeProduct = apps.get_model('main', 'ChequeProduct')
+    DebitingList = apps.get_model('main', 'DebitingList')
+    SupplierProductPrice = apps.get_model('main', 'SupplierProductPrice')
+    DailyRollup = apps.get_model('main', 'DailyRollup')
+
+    userdj = Userdj.objects.first()
+    if userdj is None:
+        return
+    rows = []
+    lines = (ChequeProduct.objects
+             .filter(cheque__date__lt=userdj.date_now)
+             .values('product_id', date=F('cheque__date'), warehouse_id=F('product__warehouse_id'),
+                     kind=Case(When(cheque__supplier__isnull=False, then=Value('purchase')), default=Value('sale')))
+             .annotate(total_quantity=Sum('quantity'),
+                       total_amount=Sum(F('quantity') * F('price'), output_field=DecimalField(max_digits=16, decimal_places=2)))
+             .order_by())
+    for line in lines:
+        rows.append(DailyRollup(date=line['date'], warehouse_id=line['warehouse_id'], product_id=line['product_id'],
+                                kind=line['kind'], quantity=line['total_quantity'], amount=line['total_amount']))
+
+    prices = {}
+    for price in SupplierProductPrice.objects.order_by('product_id', 'price', 'pk'):
+        prices.setdefault(price.product_id, price.price)
+    debits = (DebitingList.objects
+              .filter(date_of_debiting__lt=userdj.date_now)
+              .values('date_of_debiting', 'product_id', 'fresh', warehouse_id=F('product__warehouse_id'))
+              .annotate(total_quantity=Sum('quantity'))
+              .order_by())
+    for debit in debits:
+        rows.append(DailyRollup(date=debit['date_of_debiting'], warehouse_id=debit['warehouse_id'],
+                                product_id=debit['product_id'], kind='fresh' if debit['fresh'] else 'stale',
+                                quantity=debit['total_quantity'],
+                                amount=prices.get(debit['product_id'], Decimal(0)) * debit['total_quantity']))
+    DailyRollup.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0002_warehouseproducts_expires_on'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('daily_rollup_id', models.AutoField(primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('kind', models.CharField(choices=[('purchase', 'Закупка'), ('sale', 'Продажа'), ('fresh', 'Списание свежей'), ('stale', 'Списание стухшей')], max_length=16)),
+                ('quantity', models.IntegerField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main.product')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main.warehouse')),
+            ],
+            options={
+                'db_table': 'daily_rollup',
+                'indexes': [models.Index(fields=['date', 'warehouse', 'kind'], name='daily_rollup_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'product', 'kind'), name='unique_daily_rollup')],
+            },
+        ),
+        migrations.RunPython(fill_daily_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+
+def fill_occupied_mass(apps, schema_editor):
+    Warehouse = apps.get_model('main', 'Warehouse')
+    WarehouseProducts = apps.get_model('main', 'WarehouseProducts')
+    occupied = dict(WarehouseProducts.objects
+                    .values_list('product__warehouse_id')
+                    .annotate(total=Sum(F('quantity') * F('product__mass')))
+                    .order_by())
+    for warehouse_id, total in occupied.items():
+        Warehouse.objects.filter(pk=warehouse_id).update(occupied_mass=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0003_dailyrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='warehouse',
+            name='occupied_mass',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.RunPython(fill_occupied_mass, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0004_warehouse_occupied_mass'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cheque',
+            index=models.Index(fields=['date', 'supplier'], name='cheque_date_supplier_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cheque',
+            index=models.Index(fields=['date', 'customer'], name='cheque_date_customer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='debitinglist',
+            index=models.Index(fields=['date_of_debiting', 'fresh'], name='debiting_list_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderlist',
+            index=models.Index(fields=['date_order'], name='order_list_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='supplierproductprice',
+            index=models.Index(fields=['product', 'price'], name='supplier_price_product_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='warehouseproducts',
+            index=models.Index(fields=['product', 'production_date'], name='warehouse_products_fifo_idx'),
+        ),
+    ]
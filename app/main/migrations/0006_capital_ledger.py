@@ -0,0 +1,76 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations, models
+
+
+# капитал переводится в копейки, а текущий капитал становится начальной
+# проводкой журнала: прошлые движения из чеков восстановить нельзя
+def fill_capital_kopecks(apps, schema_editor):
+    Userdj = apps.get_model('main', 'Userdj')
+    CapitalLedger = apps.get_model('main', 'CapitalLedger')
+    for userdj in Userdj.objects.all():
+        userdj.capital_kopecks = int((Decimal(str(userdj.capital)) * 100).to_integral_value(ROUND_HALF_UP))
+        userdj.save(update_fields=['capital_kopecks'])
+        if userdj.capital_kopecks:
+            CapitalLedger.objects.create(date=userdj.date_now, kind='opening', amount=userdj.capital_kopecks)
+
+
+def fill_capital(apps, schema_editor):
+    Userdj = apps.get_model('main', 'Userdj')
+    for userdj in Userdj.objects.all():
+        userdj.capital = userdj.capital_kopecks / 100
+        userdj.save(update_fields=['capital'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CapitalLedger',
+            fields=[
+                ('capital_ledger_id', models.AutoField(primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('kind', models.CharField(choices=[('opening', 'Начальный капитал'), ('purchase', 'Закупка'), ('sale', 'Продажа'), ('fresh', 'Списание свежей'), ('stale', 'Списание стухшей')], max_length=16)),
+                ('amount', models.BigIntegerField()),
+            ],
+            options={
+                'db_table': 'capital_ledger',
+                'indexes': [models.Index(fields=['date', 'kind'], name='capital_ledger_date_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CapitalSnapshot',
+            fields=[
+                ('capital_snapshot_id', models.AutoField(primary_key=True, serialize=False)),
+                ('date', models.DateField(unique=True)),
+                ('opening', models.BigIntegerField(default=0)),
+                ('purchase', models.BigIntegerField(default=0)),
+                ('sale', models.BigIntegerField(default=0)),
+                ('fresh', models.BigIntegerField(default=0)),
+                ('stale', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'capital_snapshot',
+            },
+        ),
+        migrations.AddField(
+            model_name='userdj',
+            name='capital_kopecks',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_capital_kopecks, fill_capital),
+        # default нужен только для отката: поле возвращается в заполненную таблицу
+        migrations.AlterField(
+            model_name='userdj',
+            name='capital',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RemoveField(
+            model_name='userdj',
+            name='capital',
+        ),
+    ]
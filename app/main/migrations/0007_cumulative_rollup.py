@@ -0,0 +1,56 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+# нарастающие итоги по уже сведенным дням DailyRollup
+def fill_cumulative_rollup(apps, schema_editor):
+    DailyRollup = apps.get_model('main', 'DailyRollup')
+    CumulativeRollup = apps.get_model('main', 'CumulativeRollup')
+    daily = defaultdict(list)
+    for row in DailyRollup.objects.values_list('date', 'warehouse_id', 'kind').annotate(
+            quantity=Sum('quantity'), amount=Sum('amount')).order_by('date'):
+        daily[row[0]].append(row[1:])
+    if not daily:
+        return
+    totals = defaultdict(lambda: [0, Decimal(0)])
+    rows = []
+    day, end = min(daily), max(daily)
+    while day <= end:
+        for warehouse_id, kind, quantity, amount in daily.get(day, []):
+            totals[warehouse_id, kind][0] += quantity
+            totals[warehouse_id, kind][1] += amount
+        rows.extend(CumulativeRollup(date=day, warehouse_id=warehouse_id, kind=kind, quantity=quantity, amount=amount)
+                    for (warehouse_id, kind), (quantity, amount) in totals.items() if quantity or amount)
+        day += timedelta(days=1)
+    CumulativeRollup.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_capital_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CumulativeRollup',
+            fields=[
+                ('cumulative_rollup_id', models.AutoField(primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('kind', models.CharField(choices=[('purchase', 'Закупка'), ('sale', 'Продажа'), ('fresh', 'Списание свежей'), ('stale', 'Списание стухшей')], max_length=16)),
+                ('quantity', models.BigIntegerField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=18)),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main.warehouse')),
+            ],
+            options={
+                'db_table': 'cumulative_rollup',
+                'constraints': [models.UniqueConstraint(fields=('date', 'warehouse', 'kind'), name='unique_cumulative_rollup')],
+            },
+        ),
+        migrations.RunPython(fill_cumulative_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations, models
+from django.db.models import Min
+
+
+# для прошлых списаний цена в момент списания не сохранилась: берется
+# текущая самая дешевая, по которой их оценивали сводки до этого
+def fill_amount(apps, schema_editor):
+    DebitingList = apps.get_model('main', 'DebitingList')
+    SupplierProductPrice = apps.get_model('main', 'SupplierProductPrice')
+    prices = SupplierProductPrice.objects.values_list('product_id').annotate(price=Min('price')).order_by()
+    for product_id, price in prices:
+        DebitingList.objects.filter(product_id=product_id).update(amount=models.F('quantity') * price)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_cumulative_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='debitinglist',
+            name='amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=16),
+        ),
+        migrations.RunPython(fill_amount, migrations.RunPython.noop),
+    ]
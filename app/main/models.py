@@ -1,16 +1,39 @@
-from django.db import models
+from collections import defaultdict
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
 from django.core.exceptions import ValidationError
 
 
+# деньги хранятся в целых копейках: сложение точное и в SQL (в SQLite
+# DecimalField лежит как REAL), а наружу отдается Decimal в рублях
+def to_kopecks(amount):
+    return int((Decimal(str(amount)) * 100).to_integral_value(ROUND_HALF_UP))
+
+
+def from_kopecks(kopecks):
+    return Decimal(kopecks).scaleb(-2)
+
+
 class Userdj(models.Model):
     user_id = models.AutoField(primary_key=True)
     date_now = models.DateField()
-    capital = models.FloatField()
+    capital_kopecks = models.BigIntegerField(default=0)
     
     objects = models.Manager()
     class Meta:
         db_table = 'userdj'
 
+    @property
+    def capital(self):
+        return from_kopecks(self.capital_kopecks)
+
+    @capital.setter
+    def capital(self, value):
+        self.capital_kopecks = to_kopecks(value)
+
     def __str__(self):
         return (f"Капитал: {self.capital}, Дата: {self.date_now}")
 
@@ -40,26 +63,68 @@ class Supplier(models.Model):
         return f"Поставщик {self.name}"
 
 
+class WarehouseQuerySet(models.QuerySet):
+    def add_occupied_mass(self, deltas):
+        deltas = {warehouse_id: delta for warehouse_id, delta in deltas.items() if delta}
+        if not deltas:
+            return 0
+        return self.filter(pk__in=deltas).update(occupied_mass=models.F('occupied_mass') + models.Case(
+            *[models.When(pk=warehouse_id, then=models.Value(delta)) for warehouse_id, delta in deltas.items()],
+            output_field=models.DecimalField(max_digits=14, decimal_places=2),
+        ))
+
+    def rebuild_occupied_mass(self):
+        occupied = (WarehouseProducts.objects
+                    .filter(product__warehouse=models.OuterRef('pk'))
+                    .values('product__warehouse')
+                    .annotate(total=models.Sum(models.F('quantity') * models.F('product__mass')))
+                    .values('total'))
+        return self.update(occupied_mass=Coalesce(
+            models.Subquery(occupied, output_field=models.DecimalField(max_digits=14, decimal_places=2)),
+            models.Value(0, output_field=models.DecimalField(max_digits=14, decimal_places=2)),
+        ))
+
+
 class Warehouse(models.Model):
     warehouse_id = models.AutoField(primary_key=True)
     category = models.CharField(max_length=32)
     max_warehouse_capacity = models.IntegerField()
+    occupied_mass = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    objects = WarehouseQuerySet.as_manager()
 
     class Meta:
         db_table = 'warehouse'
 
     def __str__(self):
-        products = Product.objects.filter(warehouse_id=self.warehouse_id)
-        warehouse_products = WarehouseProducts.objects.filter(product__in = products)
-        warehouse_capacity = self.max_warehouse_capacity
-        for warehouse_product in warehouse_products:
-            warehouse_capacity -= int(warehouse_product.quantity)*float(warehouse_product.product.mass)
+        warehouse_capacity = self.max_warehouse_capacity - float(self.occupied_mass)
         return (f"Склад {self.warehouse_id}: "
                 f"Категория: {self.category}, "
                 f"Максимальная вместимость: {self.max_warehouse_capacity} кг, "
                 f"Текущая вместимость: {warehouse_capacity} кг")
     
   
+# Занятая масса складов зависит от массы и склада продукта, поэтому массовые
+# изменения этих полей пересчитывают затронутые склады, а удаление продуктов
+# сначала удаляет их партии через WarehouseProductsQuerySet, уменьшая счетчик
+class ProductQuerySet(models.QuerySet):
+    def delete(self):
+        with transaction.atomic():
+            WarehouseProducts.objects.filter(product__in=self).delete()
+            return super().delete()
+
+    def update(self, **kwargs):
+        if not {'mass', 'warehouse', 'warehouse_id'} & kwargs.keys():
+            return super().update(**kwargs)
+        with transaction.atomic():
+            pks = list(self.values_list('pk', flat=True))
+            warehouses = set(self.values_list('warehouse_id', flat=True))
+            result = super().update(**kwargs)
+            warehouses.update(Product.objects.filter(pk__in=pks).values_list('warehouse_id', flat=True))
+            Warehouse.objects.filter(pk__in=warehouses).rebuild_occupied_mass()
+        return result
+
+
 class Product(models.Model):
     product_id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=64, unique=True)
@@ -67,6 +132,8 @@ class Product(models.Model):
     expiry_date = models.IntegerField()
     mass = models.DecimalField(max_digits=10, decimal_places=2)
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         db_table = 'product'
 
@@ -83,7 +150,23 @@ class Product(models.Model):
 
     def save(self, *args, **kwargs):
         self.clean()
+        previous = Product.objects.filter(pk=self.pk).first() if self.pk is not None else None
         super().save(*args, **kwargs)
+        if previous is None:
+            return
+        if previous.expiry_date != self.expiry_date:
+            WarehouseProducts.objects.filter(product=self).update_expires_on()
+        if previous.mass != self.mass or previous.warehouse_id != self.warehouse_id:
+            quantity = WarehouseProducts.objects.filter(product=self).aggregate(total=models.Sum('quantity'))['total'] or 0
+            deltas = defaultdict(Decimal)
+            deltas[previous.warehouse_id] -= quantity * previous.mass
+            deltas[self.warehouse_id] += quantity * Decimal(self.mass)
+            Warehouse.objects.add_occupied_mass(deltas)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            WarehouseProducts.objects.filter(product=self).delete()
+            return super().delete(*args, **kwargs)
 
 
 class DebitingList(models.Model):
@@ -92,9 +175,15 @@ class DebitingList(models.Model):
     quantity = models.IntegerField()
     date_of_debiting = models.DateField()
     fresh = models.BooleanField()
+    # на сколько списание увеличило капитал: по самой дешевой цене поставщика
+    # в момент списания, ту же сумму получают журнал капитала и сводки
+    amount = models.DecimalField(max_digits=16, decimal_places=2, default=0)
 
     class Meta:
         db_table = 'debiting_list'
+        indexes = [
+            models.Index(fields=['date_of_debiting', 'fresh'], name='debiting_list_date_idx'),
+        ]
 
     def __str__(self):
         return (f"Списание {self.debiting_list_id}: "
@@ -103,14 +192,67 @@ class DebitingList(models.Model):
                 f"Количество: {self.quantity}, "
                 f"{'Свежий' if self.fresh else 'Стухший'}")
 
+class WarehouseProductsQuerySet(models.QuerySet):
+    def occupied_mass(self):
+        return dict(self.values_list('product__warehouse_id')
+                    .annotate(total=models.Sum(models.F('quantity') * models.F('product__mass')))
+                    .order_by())
+
+    def delete(self):
+        occupied = self.occupied_mass()
+        result = super().delete()
+        Warehouse.objects.add_occupied_mass({warehouse_id: -mass for warehouse_id, mass in occupied.items()})
+        return result
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        products = Product.objects.in_bulk({obj.product_id for obj in objs})
+        deltas = defaultdict(Decimal)
+        for obj in objs:
+            product = products[obj.product_id]
+            deltas[product.warehouse_id] += obj.quantity * product.mass
+        Warehouse.objects.add_occupied_mass(deltas)
+        return objs
+
+    # смена количества или продукта партий (и bulk_update, который идет через
+    # update) меняет счетчик на разность занятой массы этих партий до и после
+    def update(self, **kwargs):
+        if not {'quantity', 'product', 'product_id'} & kwargs.keys():
+            return super().update(**kwargs)
+        with transaction.atomic():
+            rows = self.model.objects.filter(pk__in=list(self.values_list('pk', flat=True)))
+            before = rows.occupied_mass()
+            result = super().update(**kwargs)
+            deltas = defaultdict(Decimal, rows.occupied_mass())
+            for warehouse_id, mass in before.items():
+                deltas[warehouse_id] -= mass
+            Warehouse.objects.add_occupied_mass(deltas)
+        return result
+
+    # expires_on = production_date + срок годности: один UPDATE на продукт,
+    # размер запроса не зависит от числа партий
+    def update_expires_on(self):
+        updated = 0
+        for product_id, expiry_date in self.values_list('product_id', 'product__expiry_date').distinct().order_by():
+            updated += self.filter(product_id=product_id).update(expires_on=models.ExpressionWrapper(
+                models.F('production_date') + timedelta(days=expiry_date), output_field=models.DateField()))
+        return updated
+
+
 class WarehouseProducts(models.Model):
     warehouse_products_id = models.AutoField(primary_key=True)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.IntegerField()
     production_date = models.DateField()
+    expires_on = models.DateField(db_index=True)
+
+    objects = WarehouseProductsQuerySet.as_manager()
 
     class Meta:
         db_table = 'WarehouseProducts'
+        indexes = [
+            models.Index(fields=['product', 'production_date'], name='warehouse_products_fifo_idx'),
+        ]
 
 
     def __str__(self):
@@ -121,7 +263,20 @@ class WarehouseProducts(models.Model):
     def save(self, *args, **kwargs):
         if self.quantity < 0:
             raise ValidationError("Количество не может быть отрицательным.")
+        self.expires_on = self.production_date + timedelta(days=self.product.expiry_date)
+        previous = WarehouseProducts.objects.filter(pk=self.pk).values_list(
+            'quantity', 'product__mass', 'product__warehouse_id').first() if self.pk is not None else None
         super().save(*args, **kwargs)
+        deltas = defaultdict(Decimal)
+        if previous is not None:
+            quantity, mass, warehouse_id = previous
+            deltas[warehouse_id] -= quantity * mass
+        deltas[self.product.warehouse_id] += self.quantity * Decimal(self.product.mass)
+        Warehouse.objects.add_occupied_mass(deltas)
+
+    def delete(self, *args, **kwargs):
+        Warehouse.objects.add_occupied_mass({self.product.warehouse_id: -self.quantity * Decimal(self.product.mass)})
+        return super().delete(*args, **kwargs)
 
 
 
@@ -134,6 +289,9 @@ class SupplierProductPrice(models.Model):
     class Meta:
         db_table = 'supplier_product_price'
         unique_together = ('supplier', 'product')
+        indexes = [
+            models.Index(fields=['product', 'price'], name='supplier_price_product_idx'),
+        ]
 
     def __str__(self):
         return (f"Цена для продукта {self.product.name} от поставшика {self.supplier.name}: "
@@ -152,6 +310,10 @@ class Cheque(models.Model):
 
     class Meta:
         db_table = 'cheque'
+        indexes = [
+            models.Index(fields=['date', 'supplier'], name='cheque_date_supplier_idx'),
+            models.Index(fields=['date', 'customer'], name='cheque_date_customer_idx'),
+        ]
 
     def __str__(self):
         return (f"Чек {self.cheque_id} - Дата: {self.date} - Клиент: {self.customer} - Поставщик: {self.supplier}")
@@ -235,6 +397,9 @@ class OrderList(models.Model):
 
     class Meta:
         db_table = 'order_list'
+        indexes = [
+            models.Index(fields=['date_order'], name='order_list_date_idx'),
+        ]
 
 
     def __str__(self):
@@ -244,4 +409,101 @@ class OrderList(models.Model):
                 f"По цене за шт: {self.price}, "
                 f"Количество: {self.quantity}, "
                 f"Дата: {self.date_order}, ")
-    
\ No newline at end of file
+    
+
+class DailyRollup(models.Model):
+    class Kind(models.TextChoices):
+        PURCHASE = 'purchase', 'Закупка'
+        SALE = 'sale', 'Продажа'
+        FRESH_WRITE_OFF = 'fresh', 'Списание свежей'
+        STALE_WRITE_OFF = 'stale', 'Списание стухшей'
+
+    daily_rollup_id = models.AutoField(primary_key=True)
+    date = models.DateField()
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=16, choices=Kind.choices)
+    quantity = models.IntegerField()
+    amount = models.DecimalField(max_digits=16, decimal_places=2)
+
+    class Meta:
+        db_table = 'daily_rollup'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product', 'kind'], name='unique_daily_rollup')
+        ]
+        indexes = [
+            models.Index(fields=['date', 'warehouse', 'kind'], name='daily_rollup_date_idx'),
+        ]
+
+    def __str__(self):
+        return (f"{self.date}: {self.get_kind_display()} "
+                f"{self.product.name} - {self.quantity} шт на {self.amount:.2f} руб.")
+
+
+# Нарастающие итоги DailyRollup по складам и видам операций на конец дня date
+# (строка на каждый сведенный день, нулевые итоги не хранятся): итоги за
+# [start, end] - разность строк на end и на start - 1.
+class CumulativeRollup(models.Model):
+    cumulative_rollup_id = models.AutoField(primary_key=True)
+    date = models.DateField()
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=16, choices=DailyRollup.Kind.choices)
+    quantity = models.BigIntegerField()
+    amount = models.DecimalField(max_digits=18, decimal_places=2)
+
+    class Meta:
+        db_table = 'cumulative_rollup'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'warehouse', 'kind'], name='unique_cumulative_rollup')
+        ]
+
+    def __str__(self):
+        return (f"до {self.date}: {self.get_kind_display()} "
+                f"{self.warehouse.category} - {self.quantity} шт на {self.amount:.2f} руб.")
+
+
+# Журнал движения капитала: только добавление, сумма всех проводок равна
+# капиталу. amount - со знаком, в копейках.
+class CapitalLedger(models.Model):
+    class Kind(models.TextChoices):
+        OPENING = 'opening', 'Начальный капитал'
+        PURCHASE = 'purchase', 'Закупка'
+        SALE = 'sale', 'Продажа'
+        FRESH_WRITE_OFF = 'fresh', 'Списание свежей'
+        STALE_WRITE_OFF = 'stale', 'Списание стухшей'
+
+    capital_ledger_id = models.AutoField(primary_key=True)
+    date = models.DateField()
+    kind = models.CharField(max_length=16, choices=Kind.choices)
+    amount = models.BigIntegerField()
+
+    class Meta:
+        db_table = 'capital_ledger'
+        indexes = [
+            models.Index(fields=['date', 'kind'], name='capital_ledger_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date}: {self.get_kind_display()} {from_kopecks(self.amount)} руб."
+
+
+# Нарастающие итоги журнала на конец дня date по видам проводок (поля
+# названы значениями CapitalLedger.Kind), в копейках; balance - капитал.
+class CapitalSnapshot(models.Model):
+    capital_snapshot_id = models.AutoField(primary_key=True)
+    date = models.DateField(unique=True)
+    opening = models.BigIntegerField(default=0)
+    purchase = models.BigIntegerField(default=0)
+    sale = models.BigIntegerField(default=0)
+    fresh = models.BigIntegerField(default=0)
+    stale = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'capital_snapshot'
+
+    @property
+    def balance(self):
+        return sum(getattr(self, kind) for kind in CapitalLedger.Kind.values)
+
+    def __str__(self):
+        return f"{self.date}: капитал {from_kopecks(self.balance)} руб."
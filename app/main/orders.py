@@ -0,0 +1,82 @@
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .clock import current_date
+from .models import Customer, OrderList, Product
+from .uploads import read_rows
+
+PRICE_LIMIT = Decimal(10) ** (OrderList._meta.get_field('price').max_digits - 2)
+
+
+def parse_order(row, customers, products):
+    errors = []
+    try:
+        customer_id = int(row['customer'])
+        if customer_id not in customers:
+            errors.append(f'нет клиента {customer_id}')
+    except (KeyError, TypeError, ValueError):
+        errors.append('customer должен быть id клиента')
+        customer_id = None
+    try:
+        product_id = int(row['product'])
+        if product_id not in products:
+            errors.append(f'нет продукта {product_id}')
+    except (KeyError, TypeError, ValueError):
+        errors.append('product должен быть id продукта')
+        product_id = None
+    try:
+        quantity = int(row['quantity'])
+        if quantity <= 0:
+            errors.append('количество должно быть положительным')
+    except (KeyError, TypeError, ValueError):
+        errors.append('quantity должно быть целым')
+        quantity = None
+    try:
+        price = Decimal(str(row['price']))
+        if not price.is_finite() or price < 0 or price >= PRICE_LIMIT or price != price.quantize(Decimal('0.01')):
+            raise ValueError
+        price = price.quantize(Decimal('0.01'))
+    except (KeyError, ValueError, InvalidOperation):
+        errors.append('price должна быть неотрицательной суммой с точностью до копейки')
+        price = None
+    return (customer_id, product_id, quantity, price), errors
+
+
+# Прием пачки заказов: клиенты и продукты проверяются двумя запросами на всю
+# пачку, дата симуляции берется один раз, корректные строки вставляются одним
+# bulk_create. Ошибки в одних строках не мешают принять остальные; результат -
+# по строке на каждую входную: {'line': номер, 'order': id} или
+# {'line': номер, 'errors': [...]}. Без пользователя симуляции (нет даты
+# заказа) пачка отклоняется целиком.
+def intake_orders(rows, batch_size=2000):
+    customer_ids, product_ids = set(), set()
+    for row in rows:
+        customer_ids.add(str(row.get('customer')))
+        product_ids.add(str(row.get('product')))
+    customers = set(Customer.objects.filter(pk__in=[pk for pk in customer_ids if pk.isdigit()]).values_list('pk', flat=True))
+    products = set(Product.objects.filter(pk__in=[pk for pk in product_ids if pk.isdigit()]).values_list('pk', flat=True))
+
+    results, orders = [], []
+    with transaction.atomic():
+        date_order = current_date()
+        if date_order is None:
+            raise ValidationError('Нет пользователя симуляции: заказам не на что поставить дату')
+        for number, row in enumerate(rows, 1):
+            (customer_id, product_id, quantity, price), errors = parse_order(row, customers, products)
+            if errors:
+                results.append({'line': number, 'errors': errors})
+                continue
+            results.append({'line': number})
+            orders.append(OrderList(customer_id=customer_id, product_id=product_id, quantity=quantity,
+                                    date_order=date_order, price=price))
+        created = iter(OrderList.objects.bulk_create(orders, batch_size=batch_size))
+    for result in results:
+        if 'errors' not in result:
+            result['order'] = next(created).pk
+    return {'accepted': len(orders), 'rejected': len(results) - len(orders), 'lines': results}
+
+
+def intake_upload(content, name=''):
+    return intake_orders(read_rows(content, name))
@@ -0,0 +1,101 @@
+from collections import defaultdict
+from decimal import Decimal
+
+
+# План производства на день, рассчитанный в памяти по остаткам и ценам:
+# purchases - закупки недостающего сырья, consumed - сколько штук каждого
+# продукта забрать из уже лежащих партий, produced - новые партии
+# [product, quantity] в порядке запуска цехов, cost - затраты на закупку.
+class ProductionPlan:
+
+    def __init__(self, workshops, ingredients, stock, prices):
+        self.workshops = workshops
+        self.ingredients = ingredients
+        self.stock = stock
+        self.prices = prices
+        self.purchases = []
+        self.consumed = defaultdict(int)
+        self.produced = []
+        self.cost = Decimal(0)
+        self._new_lots = defaultdict(list)
+
+    def available(self, product_id):
+        return (self.stock.get(product_id, 0) - self.consumed[product_id]
+                + sum(lot[1] for lot in self._new_lots[product_id]))
+
+    def take(self, product_id, quantity):
+        from_stock = min(quantity, self.stock.get(product_id, 0) - self.consumed[product_id])
+        self.consumed[product_id] += from_stock
+        quantity -= from_stock
+        for lot in self._new_lots[product_id]:
+            used = min(quantity, lot[1])
+            lot[1] -= used
+            quantity -= used
+
+    def plan(self):
+        for workshop in self.workshops:
+            if not workshop.recipe:
+                continue
+            finish_product = workshop.recipe.finish_product
+            quantity = int(float(workshop.max_capacity) / float(finish_product.mass))
+            end_of_work = True
+            for recipe_product in self.ingredients[workshop.recipe_id]:
+                product_id = recipe_product.product_id
+                quantity_recipe_product = recipe_product.quantity * quantity
+                sum_warehouse = self.available(product_id)
+                price = self.prices.get(product_id)
+                if sum_warehouse < quantity_recipe_product and price:
+                    self.purchases.append({
+                        'supplier_id': price.supplier_id,
+                        'product_id': product_id,
+                        'price': price.price,
+                        'quantity': quantity_recipe_product - sum_warehouse,
+                    })
+                    self.cost += (quantity_recipe_product - sum_warehouse) * price.price
+                    self.take(product_id, sum_warehouse)
+                elif sum_warehouse >= quantity_recipe_product:
+                    self.take(product_id, quantity_recipe_product)
+                else:
+                    end_of_work = False
+            if end_of_work:
+                lot = [finish_product, quantity]
+                self.produced.append(lot)
+                self._new_lots[finish_product.pk].append(lot)
+        return self
+
+    def purchases_by_supplier(self):
+        grouped = defaultdict(list)
+        for purchase in self.purchases:
+            grouped[purchase['supplier_id']].append(purchase)
+        return grouped
+
+
+# Распределение остатков по открытым заказам за один проход: заказы
+# обслуживаются по порядку поступления, заказ без полного остатка получает
+# все, что есть, и остается открытым на остаток. Какие именно партии уходят
+# в продажу (самые старые), решает consume_stock.
+class OrderAllocation:
+    def __init__(self, orders, stock):
+        self.orders = orders
+        self.stock = stock
+        self.sales = []
+        self.sold = defaultdict(int)
+        self.partial = []
+        self.closed = []
+        self.revenue = Decimal(0)
+
+    def allocate(self):
+        for order in self.orders:
+            total_quantity = self.stock.get(order.product_id, 0) - self.sold[order.product_id]
+            quantity = min(total_quantity, order.quantity)
+            if total_quantity < order.quantity:
+                if not total_quantity:
+                    continue
+                order.quantity -= total_quantity
+                self.partial.append(order)
+            else:
+                self.closed.append(order)
+            self.sold[order.product_id] += quantity
+            self.sales.append((order, quantity))
+            self.revenue += order.price * quantity
+        return self
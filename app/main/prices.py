@@ -0,0 +1,25 @@
+from .models import SupplierProductPrice
+from .versions import VersionedCache
+
+
+def load_cheapest_prices():
+    prices = {}
+    for price in SupplierProductPrice.objects.order_by('product_id', 'price', 'pk'):
+        prices.setdefault(price.product_id, price)
+    return prices
+
+
+# {product_id: самая дешевая SupplierProductPrice}
+_cheapest = VersionedCache('main:cheapest_prices_version', load_cheapest_prices)
+
+
+def cheapest_prices():
+    return _cheapest.get()
+
+
+def cheapest_price(product_id):
+    return cheapest_prices().get(product_id)
+
+
+def invalidate_cheapest_prices():
+    _cheapest.invalidate()
@@ -0,0 +1,86 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from .ledger import post
+from .models import CapitalLedger, Cheque, ChequeProduct, Product, Userdj, WarehouseProducts
+from .prices import cheapest_prices
+from .uploads import read_rows
+
+
+# строки закупки из файла JSON или CSV: поля product (id), quantity и
+# необязательная production_date (ГГГГ-ММ-ДД, по умолчанию текущая дата)
+def parse_lines(content, name=''):
+    rows = read_rows(content, name)
+    lines, errors = [], []
+    for number, row in enumerate(rows, 1):
+        try:
+            production_date = row.get('production_date') or None
+            if production_date is not None:
+                production_date = parse_date(str(production_date))
+                if production_date is None:
+                    raise ValueError
+            lines.append((int(row['product']), int(row['quantity']), production_date))
+        except (KeyError, TypeError, ValueError):
+            errors.append(f'Строка {number}: нужны целые product и quantity и дата production_date')
+    if errors:
+        raise ValidationError(errors)
+    if not lines:
+        raise ValidationError('Нет строк для закупки')
+    return lines
+
+
+def check_lines(lines, products, prices):
+    errors = []
+    for number, (product_id, quantity, production_date) in enumerate(lines, 1):
+        if product_id not in products:
+            errors.append(f'Строка {number}: нет продукта {product_id}')
+        elif product_id not in prices:
+            errors.append(f'Строка {number}: продукт {products[product_id].name} не продается')
+        if quantity <= 0:
+            errors.append(f'Строка {number}: количество должно быть положительным')
+    return errors
+
+
+# Закупка списком одной транзакцией: продукты и цены берутся одним запросом
+# каждый, партии пишутся одним bulk_create, на каждого поставщика - один чек
+# со всеми его строками, в журнал капитала - одна проводка на всю сумму.
+# Строки проверяются заранее: при любой ошибке ничего не покупается.
+def bulk_purchase(lines):
+    with transaction.atomic():
+        userdj = Userdj.objects.select_for_update().order_by('pk').first()
+        if userdj is None:
+            raise ValidationError('Нет пользователя симуляции: закупке не на что поставить дату')
+        products = Product.objects.in_bulk({product_id for product_id, quantity, production_date in lines})
+        prices = cheapest_prices()
+        errors = check_lines(lines, products, prices)
+        if errors:
+            raise ValidationError(errors)
+
+        lots = []
+        by_supplier = defaultdict(list)
+        cost = Decimal(0)
+        for product_id, quantity, production_date in lines:
+            production_date = production_date or userdj.date_now
+            lots.append(WarehouseProducts(
+                product_id=product_id, quantity=quantity, production_date=production_date,
+                expires_on=production_date + timedelta(days=products[product_id].expiry_date),
+            ))
+            price = prices[product_id]
+            by_supplier[price.supplier_id].append(ChequeProduct(product_id=product_id, price=price.price, quantity=quantity))
+            cost += quantity * price.price
+
+        WarehouseProducts.objects.bulk_create(lots)
+        cheques = Cheque.objects.bulk_create([
+            Cheque(date=userdj.date_now, customer=None, supplier_id=supplier_id) for supplier_id in by_supplier
+        ])
+        for cheque, items in zip(cheques, by_supplier.values()):
+            for item in items:
+                item.cheque = cheque
+        ChequeProduct.objects.bulk_create([item for items in by_supplier.values() for item in items])
+        post(userdj.pk, {(userdj.date_now, CapitalLedger.Kind.PURCHASE): -cost})
+    return {'lots': len(lots), 'cheques': len(cheques), 'cost': cost}
@@ -0,0 +1,161 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Case, DecimalField, F, Max, Subquery, Sum, Value, When
+from django.utils.dateparse import parse_date
+
+from .clock import current_date
+from .models import ChequeProduct, CumulativeRollup, DailyRollup, DebitingList, Warehouse
+
+Kind = DailyRollup.Kind
+
+
+# движения за [start, end], сгруппированные по дню, продукту и виду операции
+def activity(start, end):
+    rows = []
+    lines = (ChequeProduct.objects
+             .filter(cheque__date__range=[start, end])
+             .values('product_id', date=F('cheque__date'), warehouse_id=F('product__warehouse_id'),
+                     kind=Case(When(cheque__supplier__isnull=False, then=Value(Kind.PURCHASE)), default=Value(Kind.SALE)))
+             .annotate(total_quantity=Sum('quantity'),
+                       total_amount=Sum(F('quantity') * F('price'), output_field=DecimalField(max_digits=16, decimal_places=2)))
+             .order_by())
+    for line in lines:
+        rows.append({
+            'date': line['date'],
+            'warehouse_id': line['warehouse_id'],
+            'product_id': line['product_id'],
+            'kind': line['kind'],
+            'quantity': line['total_quantity'],
+            'amount': line['total_amount'],
+        })
+
+    debits = (DebitingList.objects
+              .filter(date_of_debiting__range=[start, end])
+              .values('date_of_debiting', 'product_id', 'fresh', warehouse_id=F('product__warehouse_id'))
+              .annotate(total_quantity=Sum('quantity'), total_amount=Sum('amount'))
+              .order_by())
+    for debit in debits:
+        rows.append({
+            'date': debit['date_of_debiting'],
+            'warehouse_id': debit['warehouse_id'],
+            'product_id': debit['product_id'],
+            'kind': Kind.FRESH_WRITE_OFF if debit['fresh'] else Kind.STALE_WRITE_OFF,
+            'quantity': debit['total_quantity'],
+            'amount': debit['total_amount'],
+        })
+    return rows
+
+
+# Пересчитанные строки за [start, end] пишутся через INSERT ... ON CONFLICT
+# DO UPDATE по уникальному ключу unique_fields: уже посчитанные дни
+# обновляются на месте, а удаляются только строки, которых больше нет. В
+# PostgreSQL так не копятся мертвые строки и не перестраиваются индексы при
+# каждом пересчете.
+def write_days(model, rows, start, end, unique_fields, update_fields):
+    if not connection.features.supports_update_conflicts_with_target:
+        model.objects.filter(date__range=[start, end]).delete()
+        model.objects.bulk_create(rows)
+        return
+    columns = [model._meta.get_field(name).attname for name in unique_fields]
+    keys = {tuple(getattr(row, column) for column in columns) for row in rows}
+    model.objects.filter(pk__in=[
+        pk for pk, *key in model.objects.filter(date__range=[start, end]).values_list('pk', *columns)
+        if tuple(key) not in keys
+    ]).delete()
+    model.objects.bulk_create(rows, update_conflicts=True, unique_fields=unique_fields, update_fields=update_fields)
+
+
+def rollup_days(start, end):
+    write_days(DailyRollup, [DailyRollup(**row) for row in activity(start, end)], start, end,
+               ['date', 'product', 'kind'], ['warehouse', 'quantity', 'amount'])
+    accumulate_days(start, end)
+
+
+def rollup_day(day):
+    rollup_days(day, day)
+
+
+# Нарастающие итоги CumulativeRollup за дни [start, end]: от строк последнего
+# дня раньше start прибавляются суммы DailyRollup по дням. Если после end уже
+# есть нарастающие итоги (пересчитан прошлый день), они пересчитываются тоже.
+def accumulate_days(start, end):
+    end = max(end, CumulativeRollup.objects.aggregate(last=Max('date'))['last'] or end)
+    previous = CumulativeRollup.objects.filter(date__lt=start).aggregate(last=Max('date'))['last']
+    totals = defaultdict(lambda: [0, Decimal(0)])
+    daily = defaultdict(list)
+    rollups = DailyRollup.objects.filter(date__lte=end)
+    if previous:
+        rollups = rollups.filter(date__gt=previous)
+        for warehouse_id, kind, quantity, amount in CumulativeRollup.objects.filter(date=previous).values_list(
+                'warehouse_id', 'kind', 'quantity', 'amount'):
+            totals[warehouse_id, kind] = [quantity, amount]
+    for row in rollups.values('date', 'warehouse_id', 'kind').annotate(
+            total_quantity=Sum('quantity'), total_amount=Sum('amount')).order_by('date'):
+        daily[row['date']].append(row)
+
+    rows = []
+    for day in sorted(daily):
+        if day >= start:
+            break
+        add_daily(totals, daily[day])
+    day = start
+    while day <= end:
+        add_daily(totals, daily.get(day, []))
+        rows.extend(CumulativeRollup(date=day, warehouse_id=warehouse_id, kind=kind, quantity=quantity, amount=amount)
+                    for (warehouse_id, kind), (quantity, amount) in totals.items() if quantity or amount)
+        day += timedelta(days=1)
+    write_days(CumulativeRollup, rows, start, end, ['date', 'warehouse', 'kind'], ['quantity', 'amount'])
+
+
+def add_daily(totals, rows):
+    for row in rows:
+        total = totals[row['warehouse_id'], row['kind']]
+        total[0] += row['total_quantity']
+        total[1] += row['total_amount']
+
+
+# нарастающие итоги {(warehouse_id, kind): [quantity, amount]} на конец дня
+# day - строки последнего сведенного дня не позже day, одним запросом
+def cumulative_totals(day, warehouse=None):
+    rows = CumulativeRollup.objects.filter(
+        date=Subquery(CumulativeRollup.objects.filter(date__lte=day).order_by('-date').values('date')[:1]))
+    if warehouse:
+        rows = rows.filter(warehouse=warehouse)
+    return {(warehouse_id, kind): [quantity, amount]
+            for warehouse_id, kind, quantity, amount in rows.values_list('warehouse_id', 'kind', 'quantity', 'amount')}
+
+
+# итоги за период по складам и видам операций: закрытые дни (раньше текущей
+# даты симуляции) - разность нарастающих итогов на концах периода, два
+# запроса при любой длине периода; текущий день - из исходных таблиц
+def period_totals(start, end, warehouse=None):
+    if isinstance(start, str):
+        start, end = parse_date(start), parse_date(end)
+    date_now = current_date()
+    totals = defaultdict(lambda: {'quantity': 0, 'amount': Decimal(0)})
+
+    closed_end = min(end, date_now - timedelta(days=1)) if date_now else end
+    if start <= closed_end:
+        before = cumulative_totals(start - timedelta(days=1), warehouse)
+        for key, (quantity, amount) in cumulative_totals(closed_end, warehouse).items():
+            quantity_before, amount_before = before.get(key, (0, 0))
+            totals[key]['quantity'] += quantity - quantity_before
+            totals[key]['amount'] += amount - amount_before
+
+    if date_now and date_now <= end:
+        for row in activity(max(start, date_now), end):
+            if warehouse and row['warehouse_id'] != warehouse:
+                continue
+            totals[row['warehouse_id'], row['kind']]['quantity'] += row['quantity']
+            totals[row['warehouse_id'], row['kind']]['amount'] += row['amount']
+
+    warehouses = Warehouse.objects.all()
+    if warehouse:
+        warehouses = warehouses.filter(pk=warehouse)
+    return [
+        {'warehouse': item, 'totals': [(label, totals[item.pk, kind]) for kind, label in Kind.choices]}
+        for item in warehouses
+    ]
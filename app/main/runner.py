@@ -0,0 +1,27 @@
+import os
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+# тесты держат версии кэшей в памяти своего процесса, а не в общем кэше
+# рабочих процессов (settings.CACHES)
+class TestRunner(DiscoverRunner):
+    # у main нет __init__.py, и unittest не находит корень для меток-модулей
+    # вида main.tests - им корнем служит каталог проекта
+    def load_tests_for_label(self, label, discover_kwargs):
+        if not self.top_level and not os.path.exists(label):
+            discover_kwargs = {**discover_kwargs, 'top_level_dir': str(settings.BASE_DIR)}
+        return super().load_tests_for_label(label, discover_kwargs)
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.caches = override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        })
+        self.caches.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.caches.disable()
+        super().teardown_test_environment(**kwargs)
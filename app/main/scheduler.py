@@ -0,0 +1,155 @@
+import heapq
+import time
+from collections import defaultdict
+
+
+# продукт без массы цех выпускать не может
+def units_per_day(workshop, mass):
+    return int(float(workshop.max_capacity) / float(mass)) if mass and mass > 0 else 0
+
+
+# Назначение рецептов цехам на следующий день. Цех, получивший рецепт сегодня,
+# выпускает продукцию только завтра, поэтому спрос - это открытые заказы за
+# вычетом того, что уже лежит на складе. Жадно, пока есть свободные цеха,
+# выбирается пара цех-продукт, закрывающая больше всего оставшегося спроса с
+# учетом мощности цеха (кг/сут) и массы продукта; рецепт, для которого не
+# хватает сырья, которое нельзя купить, не назначается, а недостающий
+# полуфабрикат со своим рецептом добавляется в спрос. Результат не зависит от
+# скорости машины; time_limit (секунды) - необязательный предел для команды
+# schedule. assignments - {workshop_id: recipe_id или None}, planned -
+# ожидаемый выпуск {product_id: штук}.
+class WorkshopSchedule:
+    def __init__(self, workshops, orders, stock, recipes, ingredients, prices, masses, time_limit=None):
+        self.workshops = workshops
+        self.orders = orders
+        self.stock = stock
+        self.recipes = recipes
+        self.ingredients = ingredients
+        self.prices = prices
+        self.masses = masses
+        self.time_limit = time_limit
+        self.assignments = {}
+        self.planned = {}
+
+        self.ordered = defaultdict(int)
+        for order in orders:
+            self.ordered[order.product_id] += order.quantity
+        self.backlog = {
+            product_id: max(quantity - stock.get(product_id, 0), 0)
+            for product_id, quantity in self.ordered.items()
+        }
+
+    def feasible(self, recipe_id, units, free):
+        return all(
+            recipe_product.product_id in self.prices or free.get(recipe_product.product_id, 0) >= recipe_product.quantity * units
+            for recipe_product in self.ingredients.get(recipe_id, [])
+        )
+
+    # спрос на полуфабрикаты, без которых не собрать заказанную продукцию
+    def derived_demand(self, demand, free):
+        frontier = dict(demand)
+        for _ in range(10):
+            extra = defaultdict(int)
+            for product_id, quantity in frontier.items():
+                for recipe_product in self.ingredients.get(self.recipes.get(product_id), []):
+                    ingredient_id = recipe_product.product_id
+                    if ingredient_id in self.prices or ingredient_id not in self.recipes:
+                        continue
+                    extra[ingredient_id] += recipe_product.quantity * quantity
+            frontier = {}
+            for product_id, quantity in extra.items():
+                shortfall = quantity - free.get(product_id, 0)
+                if shortfall > 0:
+                    demand[product_id] = demand.get(product_id, 0) + shortfall
+                    frontier[product_id] = shortfall
+            if not frontier:
+                break
+        return demand
+
+    def free_stock(self):
+        return {product_id: max(quantity - self.ordered.get(product_id, 0), 0) for product_id, quantity in self.stock.items()}
+
+    def reserve(self, recipe_id, units, free):
+        for recipe_product in self.ingredients.get(recipe_id, []):
+            if recipe_product.product_id in free:
+                free[recipe_product.product_id] = max(free[recipe_product.product_id] - recipe_product.quantity * units, 0)
+
+    # Все пары цех-продукт оцениваются один раз и лежат в куче: больше
+    # закрытого спроса, затем меньше лишней продукции, затем порядок цехов и
+    # продуктов. Оценка пары со временем только падает (спрос уменьшается), а
+    # выполнимость только пропадает (сырье резервируется), поэтому устаревшая
+    # пара с вершины пересчитывается и кладется обратно, а невыполнимая
+    # выбрасывается - выбор тот же, что при полном переборе на каждом шаге.
+    def plan(self):
+        deadline = None if self.time_limit is None else time.perf_counter() + self.time_limit
+        free = self.free_stock()
+        demand = self.derived_demand(
+            {product_id: quantity for product_id, quantity in self.backlog.items()
+             if quantity > 0 and product_id in self.recipes}, free)
+
+        heap = []
+        for index, workshop in enumerate(self.workshops):
+            for rank, (product_id, quantity) in enumerate(demand.items()):
+                units = units_per_day(workshop, self.masses[product_id])
+                if units and quantity > 0:
+                    heap.append((-min(units, quantity), units, index, rank, product_id))
+        heapq.heapify(heap)
+        busy = set()
+        while heap and (deadline is None or time.perf_counter() < deadline):
+            covered, units, index, rank, product_id = heapq.heappop(heap)
+            quantity = demand[product_id]
+            if index in busy or quantity <= 0:
+                continue
+            if -covered != min(units, quantity):
+                heapq.heappush(heap, (-min(units, quantity), units, index, rank, product_id))
+                continue
+            if not self.feasible(self.recipes[product_id], units, free):
+                continue
+            busy.add(index)
+            self.assignments[self.workshops[index].pk] = self.recipes[product_id]
+            demand[product_id] -= units
+            self.reserve(self.recipes[product_id], units, free)
+        for workshop in self.workshops:
+            self.assignments.setdefault(workshop.pk, None)
+        self.planned = self.output(self.assignments)
+        return self
+
+    # сколько чего выпустят цеха при назначении assignments: цеха идут по
+    # порядку, рецепт без нужного некупленного сырья ничего не дает
+    def output(self, assignments):
+        recipes = {recipe_id: product_id for product_id, recipe_id in self.recipes.items()}
+        free = self.free_stock()
+        output = defaultdict(int)
+        for workshop in self.workshops:
+            recipe_id = assignments.get(workshop.pk)
+            if not recipe_id:
+                continue
+            units = units_per_day(workshop, self.masses[recipes[recipe_id]])
+            if units and self.feasible(recipe_id, units, free):
+                output[recipes[recipe_id]] += units
+                self.reserve(recipe_id, units, free)
+        return output
+
+    # насколько план закрывает спрос по заказам и загружает цеха; для сравнения
+    # те же показатели у прежнего назначения "заказ за заказом по цехам"
+    def report(self):
+        orders = [order for order in self.orders if order.product_id in self.recipes]
+        baseline = self.output({
+            workshop.pk: self.recipes[order.product_id] for order, workshop in zip(orders, self.workshops)
+        })
+        capacity = sum(float(workshop.max_capacity) for workshop in self.workshops)
+        loaded = sum(units * float(self.masses[product_id]) for product_id, units in self.planned.items())
+        backlog = sum(self.backlog.values())
+
+        def covered(output):
+            return sum(min(output.get(product_id, 0), quantity) for product_id, quantity in self.backlog.items())
+
+        return {
+            'backlog': backlog,
+            'covered': covered(self.planned),
+            'coverage': covered(self.planned) / backlog if backlog else 1.0,
+            'baseline_covered': covered(baseline),
+            'baseline_coverage': covered(baseline) / backlog if backlog else 1.0,
+            'busy_workshops': sum(1 for recipe_id in self.assignments.values() if recipe_id),
+            'utilization': loaded / capacity if capacity else 0.0,
+        }
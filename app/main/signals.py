@@ -0,0 +1,35 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .bom import invalidate_bom
+from .clock import invalidate_clock
+from .models import CapitalLedger, Recipe, RecipeProducts, SupplierProductPrice, Userdj
+from .prices import invalidate_cheapest_prices
+
+
+@receiver(post_save, sender=SupplierProductPrice)
+@receiver(post_delete, sender=SupplierProductPrice)
+def supplier_product_price_changed(sender, **kwargs):
+    invalidate_cheapest_prices()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeProducts)
+@receiver(post_delete, sender=RecipeProducts)
+def recipe_changed(sender, **kwargs):
+    invalidate_bom()
+
+
+@receiver(post_save, sender=Userdj)
+@receiver(post_delete, sender=Userdj)
+def userdj_changed(sender, **kwargs):
+    invalidate_clock()
+
+
+# начальный капитал нового пользователя - первая проводка журнала
+@receiver(post_save, sender=Userdj)
+def userdj_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and instance.capital_kopecks:
+        CapitalLedger.objects.create(date=instance.date_now, kind=CapitalLedger.Kind.OPENING,
+                                     amount=instance.capital_kopecks)
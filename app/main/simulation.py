@@ -0,0 +1,286 @@
+from collections import defaultdict
+from decimal import Decimal
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .models import (
+    CapitalLedger,
+    Cheque,
+    ChequeProduct,
+    DebitingList,
+    OrderList,
+    Product,
+    Recipe,
+    Userdj,
+    Warehouse,
+    WarehouseProducts,
+    Workshop,
+)
+from .bom import product_recipes, recipe_ingredients
+from .ledger import post, snapshot_days
+from .planner import OrderAllocation, ProductionPlan
+from .prices import cheapest_prices
+from .rollup import rollup_days
+from .scheduler import WorkshopSchedule
+
+
+# записывает разницу остатков: удаляет партии deleted, меняет количество
+# changed {pk: quantity}, создает new (в этом порядке получат возрастающие pk)
+def write_lots(deleted, changed, new, batch_size):
+    for start in range(0, len(deleted), batch_size):
+        WarehouseProducts.objects.filter(pk__in=deleted[start:start + batch_size]).delete()
+    WarehouseProducts.objects.bulk_update([
+        WarehouseProducts(warehouse_products_id=key, quantity=quantity) for key, quantity in changed.items()
+    ], ['quantity'], batch_size=batch_size)
+    return WarehouseProducts.objects.bulk_create([
+        WarehouseProducts(product_id=lot.product_id, quantity=lot.quantity,
+                          production_date=lot.production_date, expires_on=lot.expires_on)
+        for lot in new
+    ], batch_size=batch_size)
+
+
+class Lot:
+    __slots__ = ('product_id', 'quantity', 'production_date', 'expires_on')
+
+    def __init__(self, product_id, quantity, production_date, expires_on):
+        self.product_id = product_id
+        self.quantity = quantity
+        self.production_date = production_date
+        self.expires_on = expires_on
+
+
+# Остатки склада в памяти: партии по ключу (pk партии в базе или временный
+# ключ для еще не записанных), порядок FIFO - (production_date, ключ), как у
+# consume_stock. flush записывает в базу разницу с последним сохраненным
+# состоянием через счетные методы WarehouseProductsQuerySet.
+class LotStore:
+    def __init__(self, lots, batch_size=1000):
+        self.lots = dict(lots)
+        self.stored = {key: lot.quantity for key, lot in self.lots.items()}
+        self.by_product = defaultdict(dict)
+        for key, lot in self.lots.items():
+            self.by_product[lot.product_id][key] = None
+        self.next_key = max(self.lots, default=0) + 1
+        self.batch_size = batch_size
+
+    # iterator() в PostgreSQL читает партии серверным курсором, не держа
+    # весь результат запроса в памяти клиента
+    @classmethod
+    def load(cls, **kwargs):
+        return cls(((pk, Lot(*values)) for pk, *values in WarehouseProducts.objects.order_by('pk').values_list(
+            'pk', 'product_id', 'quantity', 'production_date', 'expires_on').iterator(chunk_size=10000)), **kwargs)
+
+    def totals(self):
+        totals = defaultdict(int)
+        for lot in self.lots.values():
+            totals[lot.product_id] += lot.quantity
+        return dict(totals)
+
+    def fifo(self, product_id):
+        return sorted(self.by_product[product_id], key=lambda key: (self.lots[key].production_date, key))
+
+    def remove(self, key):
+        lot = self.lots.pop(key)
+        del self.by_product[lot.product_id][key]
+        return lot
+
+    def add(self, product_id, quantity, production_date, expires_on):
+        key = self.next_key
+        self.next_key += 1
+        self.lots[key] = Lot(product_id, quantity, production_date, expires_on)
+        self.by_product[product_id][key] = None
+
+    def consume(self, amounts):
+        for product_id, need in amounts.items():
+            for key in self.fifo(product_id):
+                if need <= 0:
+                    break
+                lot = self.lots[key]
+                if lot.quantity <= need:
+                    need -= lot.quantity
+                    self.remove(key)
+                else:
+                    lot.quantity -= need
+                    need = 0
+
+    def drop_empty(self):
+        for key in [key for key, lot in self.lots.items() if lot.quantity == 0]:
+            self.remove(key)
+
+    # (product_id, quantity) просроченных на date партий в порядке ключей
+    def expire(self, date):
+        return [(lot.product_id, lot.quantity) for lot in
+                (self.remove(key) for key in sorted(key for key, lot in self.lots.items() if lot.expires_on < date))]
+
+    # (product_id, quantity) партий сверх вместимости склада: на складе
+    # остаются самые свежие, как в DayClose.debiting_phase
+    def overflow(self, warehouses, capacities):
+        by_warehouse = defaultdict(list)
+        for key, lot in self.lots.items():
+            by_warehouse[warehouses[lot.product_id]].append(key)
+        written_off = []
+        for warehouse_id, keys in by_warehouse.items():
+            running = 0
+            for key in sorted(keys, key=lambda key: (self.lots[key].production_date, key), reverse=True):
+                running += self.lots[key].quantity
+                if running > capacities[warehouse_id]:
+                    lot = self.remove(key)
+                    written_off.append((lot.product_id, lot.quantity))
+        return written_off
+
+    def flush(self):
+        new = sorted(key for key in self.lots if key not in self.stored)
+        created = write_lots(
+            [key for key in self.stored if key not in self.lots],
+            {key: self.lots[key].quantity for key, quantity in self.stored.items()
+             if key in self.lots and self.lots[key].quantity != quantity},
+            [self.lots[key] for key in new],
+            self.batch_size,
+        )
+        for key in new:
+            self.remove(key)
+        for lot in created:
+            self.lots[lot.pk] = Lot(lot.product_id, lot.quantity, lot.production_date, lot.expires_on)
+            self.by_product[lot.product_id][lot.pk] = None
+        self.next_key = max(self.next_key, max(self.lots, default=0) + 1)
+        self.stored = {key: lot.quantity for key, lot in self.lots.items()}
+
+
+# Прокрутка симуляции на несколько дней в одном процессе: остатки, заказы,
+# назначения цехов и капитал живут в памяти, день закрывается по тем же
+# правилам, что DayClose, а в базу изменения пишутся пачками раз в flush_every
+# дней вместе со сводками DailyRollup и снимками капитала за закрытые дни.
+# Движения капитала копятся в moves {(date, kind): сумма}, как в журнале.
+# Цены, рецепты и справочники за время прокрутки не меняются. Сброс берет
+# строку пользователя под блокировкой и отменяется, если дату за это время
+# сдвинул кто-то другой (закрытие дня или вторая прокрутка), чтобы не записать
+# те же дни дважды.
+class Simulation:
+    def __init__(self, userdj, flush_every=30, batch_size=1000, stock=None):
+        self.userdj = userdj
+        self.date = userdj.date_now
+        self.stored_date = userdj.date_now
+        self.capital = userdj.capital
+        self.moves = defaultdict(Decimal)
+        self.flush_every = flush_every
+        self.batch_size = batch_size
+        self.prices = cheapest_prices()
+        self.stock = stock or LotStore.load(batch_size=batch_size)
+
+        self.warehouses = dict(Product.objects.values_list('pk', 'warehouse_id'))
+        self.capacities = dict(Warehouse.objects.values_list('pk', 'max_warehouse_capacity'))
+        self.workshops = list(Workshop.objects.select_related('recipe__finish_product').order_by('pk'))
+        self.ingredients = defaultdict(list, recipe_ingredients())
+        self.product_recipes = product_recipes()
+        self.recipes = Recipe.objects.select_related('finish_product').in_bulk(self.product_recipes.values())
+        self.masses = dict(Product.objects.filter(pk__in=self.product_recipes).values_list('pk', 'mass'))
+
+        self.orders = list(OrderList.objects.order_by('pk'))
+        self.stored_orders = {order.pk: order.quantity for order in self.orders}
+        self.cheques = []
+        self.debits = []
+        self.rolled_from = self.date
+
+    def run(self, days):
+        for day in range(1, days + 1):
+            self.close_day()
+            if day % self.flush_every == 0 or day == days:
+                self.flush()
+        return self.userdj
+
+    # прогон "что если": дни закрываются только в памяти, в базу ничего не
+    # пишется, результат - в capital, stock, cheques и debits
+    def preview(self, days):
+        for _ in range(days):
+            self.close_day()
+        return self
+
+    def close_day(self):
+        self.date += timedelta(days=1)
+
+        plan = ProductionPlan(self.workshops, self.ingredients, self.stock.totals(), self.prices).plan()
+        self.move(CapitalLedger.Kind.PURCHASE, -plan.cost)
+        for supplier_id, purchases in plan.purchases_by_supplier().items():
+            self.cheques.append((self.date, None, supplier_id, purchases))
+        self.stock.consume(plan.consumed)
+        for product, quantity in plan.produced:
+            if quantity > 0:
+                self.stock.add(product.pk, quantity, self.date, self.date + timedelta(days=product.expiry_date))
+        schedule = WorkshopSchedule(self.workshops, self.orders, self.stock.totals(), self.product_recipes,
+                                    self.ingredients, self.prices, self.masses).plan()
+        for workshop in self.workshops:
+            workshop.recipe = self.recipes.get(schedule.assignments[workshop.pk])
+
+        allocation = OrderAllocation(self.orders, self.stock.totals()).allocate()
+        self.move(CapitalLedger.Kind.SALE, allocation.revenue)
+        for order, quantity in allocation.sales:
+            self.cheques.append((self.date, order.customer_id, None,
+                                 [{'product_id': order.product_id, 'price': order.price, 'quantity': quantity}]))
+        self.stock.consume(allocation.sold)
+        closed = {order.pk for order in allocation.closed}
+        self.orders = [order for order in self.orders if order.pk not in closed]
+
+        self.stock.drop_empty()
+        self.write_off(self.stock.expire(self.date), fresh=False)
+        self.write_off(self.stock.overflow(self.warehouses, self.capacities), fresh=True)
+
+    def move(self, kind, amount):
+        self.capital += amount
+        self.moves[self.date, kind] += amount
+
+    def write_off(self, lots, fresh):
+        kind = CapitalLedger.Kind.FRESH_WRITE_OFF if fresh else CapitalLedger.Kind.STALE_WRITE_OFF
+        for product_id, quantity in lots:
+            price = self.prices.get(product_id)
+            # это кринж но надо по тз
+            amount = price.price * quantity if price is not None else Decimal(0)
+            self.debits.append(DebitingList(product_id=product_id, quantity=quantity,
+                                            date_of_debiting=self.date, fresh=fresh, amount=amount))
+            if price is not None:
+                self.move(kind, amount)
+
+    def flush(self):
+        with transaction.atomic():
+            stored = Userdj.objects.select_for_update().get(pk=self.userdj.pk).date_now
+            if stored != self.stored_date:
+                raise ValidationError(f'Дата уже сдвинута на {stored}, прокрутка с {self.stored_date} отменена')
+            created = Cheque.objects.bulk_create([
+                Cheque(date=date, customer_id=customer_id, supplier_id=supplier_id)
+                for date, customer_id, supplier_id, lines in self.cheques
+            ], batch_size=self.batch_size)
+            ChequeProduct.objects.bulk_create([
+                ChequeProduct(cheque=cheque, product_id=line['product_id'], price=line['price'], quantity=line['quantity'])
+                for cheque, (date, customer_id, supplier_id, lines) in zip(created, self.cheques)
+                for line in lines
+            ], batch_size=self.batch_size)
+            DebitingList.objects.bulk_create(self.debits, batch_size=self.batch_size)
+            self.cheques, self.debits = [], []
+
+            self.stock.flush()
+            remaining = {order.pk for order in self.orders}
+            closed = [pk for pk in self.stored_orders if pk not in remaining]
+            for start in range(0, len(closed), self.batch_size):
+                OrderList.objects.filter(pk__in=closed[start:start + self.batch_size]).delete()
+            OrderList.objects.bulk_update([order for order in self.orders
+                                           if order.quantity != self.stored_orders[order.pk]],
+                                          ['quantity'], batch_size=self.batch_size)
+            self.stored_orders = {order.pk: order.quantity for order in self.orders}
+            Workshop.objects.bulk_update(self.workshops, ['recipe'], batch_size=self.batch_size)
+
+            # капитал пишется приращением, чтобы не затереть покупки,
+            # сделанные за время прокрутки
+            post(self.userdj.pk, self.moves)
+            self.moves = defaultdict(Decimal)
+            rollup_days(self.rolled_from, self.date - timedelta(days=1))
+            snapshot_days(self.rolled_from, self.date - timedelta(days=1))
+            self.rolled_from = self.date
+            self.stored_date = self.date
+            self.userdj.date_now = self.date
+            self.userdj.capital = self.capital
+            self.userdj.save(update_fields=['date_now'])
+
+
+def simulate(days, flush_every=30):
+    return Simulation(Userdj.objects.first(), flush_every=flush_every).run(days)
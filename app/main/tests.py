@@ -1 +0,0 @@
-from django.test import TestCase
\ No newline at end of file
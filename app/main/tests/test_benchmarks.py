@@ -0,0 +1,22 @@
+import os
+import tempfile
+
+from django.test import TestCase
+
+from main import benchmarks
+from main.models import Cheque
+
+
+class BenchmarkTests(TestCase):
+    def test_suite_round_trip(self):
+        results = benchmarks.run_suite([20], warmup=1, repeat=2)
+        self.assertEqual({row['scenario'] for row in results}, set(benchmarks.SCENARIOS))
+        self.assertFalse(Cheque.objects.exists())
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'baseline.json')
+            benchmarks.export_json(results, path)
+            benchmarks.export_csv(results, os.path.join(directory, 'results.csv'))
+            self.assertEqual([ratio for row, baseline, ratio in benchmarks.compare(results, path)], [1.0] * len(results))
+
+    def test_percentile(self):
+        self.assertEqual([benchmarks.percentile(range(1, 101), p) for p in (0, 50, 90, 100)], [1, 51, 90, 100])
@@ -0,0 +1,45 @@
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+
+from main.bom import explode, raw_demand
+from main.forms import RecipeProductsForm
+from main.models import Product, Recipe, RecipeProducts, Warehouse
+
+
+class BillOfMaterialsTests(TestCase):
+    def setUp(self):
+        warehouse = Warehouse.objects.create(category='Сырье', max_warehouse_capacity=100)
+        self.flour, self.eggs, self.dough, self.pie_base, self.pie = [
+            Product.objects.create(name=name, warehouse=warehouse, expiry_date=5, mass=1)
+            for name in ('Мука', 'Яйца', 'Тесто', 'Основа', 'Пирог')
+        ]
+        self.recipes = {}
+        for product, ingredients in ((self.dough, [(self.flour, 2), (self.eggs, 1)]),
+                                     (self.pie_base, [(self.dough, 3), (self.flour, 1)]),
+                                     (self.pie, [(self.pie_base, 2), (self.eggs, 1)])):
+            recipe = Recipe.objects.create(name=f'Рецепт {product.name}', finish_product=product)
+            for ingredient, quantity in ingredients:
+                RecipeProducts.objects.create(recipe=recipe, product=ingredient, quantity=quantity)
+            self.recipes[product] = recipe
+
+    def test_explode_multiplies_nested_quantities(self):
+        self.assertEqual(explode(self.recipes[self.pie].pk), {self.flour.pk: 14, self.eggs.pk: 7})
+        self.assertEqual(raw_demand({self.pie.pk: 2, self.dough.pk: 1, self.flour.pk: 5}),
+                         {self.flour.pk: 35, self.eggs.pk: 15})
+
+    def test_explode_is_memoized_and_invalidated(self):
+        explode(self.recipes[self.pie].pk)
+        with self.assertNumQueries(0):
+            explode(self.recipes[self.pie].pk)
+            explode(self.recipes[self.dough].pk)
+        item = RecipeProducts.objects.get(recipe=self.recipes[self.dough], product=self.flour)
+        item.quantity = 3
+        item.save()
+        self.assertEqual(explode(self.recipes[self.pie].pk), {self.flour.pk: 20, self.eggs.pk: 7})
+
+    def test_cycles(self):
+        form = RecipeProductsForm({'recipe': self.recipes[self.dough].pk, 'product': self.pie.pk, 'quantity': 1})
+        self.assertFalse(form.is_valid())
+        RecipeProducts.objects.create(recipe=self.recipes[self.dough], product=self.pie, quantity=1)
+        with self.assertRaises(ValidationError):
+            explode(self.recipes[self.pie].pk)
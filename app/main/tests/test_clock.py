@@ -0,0 +1,36 @@
+from datetime import date
+
+from django.db import transaction
+from django.test import TransactionTestCase
+
+from main.clock import current_date, simulation_state
+from main.forms import OrderListForm, UserdjForm
+from main.ledger import post
+from main.models import CapitalLedger, Userdj
+
+
+class SimulationClockTests(TransactionTestCase):
+    def test_cached_until_changed(self):
+        userdj = Userdj.objects.create(date_now=date(2024, 1, 10), capital=100)
+        self.assertEqual(current_date(), date(2024, 1, 10))
+        with self.assertNumQueries(0):
+            self.assertEqual(simulation_state().capital, 100)
+            self.assertEqual(OrderListForm().initial['date_order'], date(2024, 1, 10))
+
+        post(userdj.pk, {(date(2024, 1, 10), CapitalLedger.Kind.PURCHASE): -30})
+        userdj.capital += 1000
+        userdj.save(update_fields=['date_now'])
+        self.assertEqual(simulation_state().capital, 70)
+
+        form = UserdjForm({'date_now': date(2024, 1, 10)}, instance=userdj)
+        self.assertTrue(form.is_valid())
+        form.save()
+        self.assertEqual(current_date(), date(2024, 1, 11))
+
+    def test_rolled_back_changes_are_not_cached(self):
+        userdj = Userdj.objects.create(date_now=date(2024, 1, 10), capital=100)
+        with transaction.atomic():
+            post(userdj.pk, {(date(2024, 1, 10), CapitalLedger.Kind.SALE): 50})
+            self.assertEqual(simulation_state().capital, 150)
+            transaction.set_rollback(True)
+        self.assertEqual(simulation_state().capital, 100)
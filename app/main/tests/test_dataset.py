@@ -0,0 +1,66 @@
+from datetime import date
+
+from django.db import transaction
+from django.test import TestCase
+
+from main.dataset import Dataset
+from main.models import (
+    CapitalSnapshot,
+    Cheque,
+    ChequeProduct,
+    DebitingList,
+    OrderList,
+    RecipeProducts,
+    SupplierProductPrice,
+    Warehouse,
+    WarehouseProducts,
+)
+from main.rollup import period_totals
+
+
+class DatasetTests(TestCase):
+    def generate(self, seed):
+        with transaction.atomic():
+            created = Dataset(seed=seed, products=40, suppliers=5, customers=5, recipes=15, workshops=3, lots=300,
+                              orders=20, cheques=200, debits=50, history_days=30, batch_size=64).generate()
+            rows = (
+                sorted(SupplierProductPrice.objects.values_list('supplier__name', 'product__name', 'price')),
+                sorted(RecipeProducts.objects.values_list('recipe__name', 'product__name', 'quantity')),
+                sorted(ChequeProduct.objects.values_list('cheque__date', 'product__name', 'price', 'quantity')),
+                sorted(DebitingList.objects.values_list('product__name', 'quantity', 'date_of_debiting', 'fresh')),
+                sorted(WarehouseProducts.objects.values_list('product__name', 'quantity', 'production_date')),
+                sorted(OrderList.objects.values_list('customer__name', 'product__name', 'quantity')),
+            )
+            transaction.set_rollback(True)
+        return created, rows
+
+    def test_generate_is_deterministic(self):
+        created, rows = self.generate(0)
+        self.assertEqual(created['WarehouseProducts'], 300)
+        self.assertEqual(created['Cheque'], 200)
+        self.assertGreaterEqual(created['ChequeProduct'], 200)
+        self.assertEqual(self.generate(0), (created, rows))
+        self.assertNotEqual(self.generate(1)[1], rows)
+
+    def test_history_is_rolled_up(self):
+        Dataset(products=20, lots=50, cheques=300, debits=100, history_days=30, batch_size=64).generate()
+        start, end = date(2023, 12, 11), date(2024, 1, 9)
+        self.assertEqual(CapitalSnapshot.objects.filter(date__range=[start, end]).count(), 30)
+        totals = {
+            (item['warehouse'].pk, label): value['quantity']
+            for item in period_totals(start, end)
+            for label, value in item['totals']
+        }
+        for warehouse in Warehouse.objects.all():
+            lines = ChequeProduct.objects.filter(product__warehouse=warehouse, cheque__date__range=[start, end])
+            debits = DebitingList.objects.filter(product__warehouse=warehouse, date_of_debiting__range=[start, end])
+            self.assertEqual(totals[warehouse.pk, 'Закупка'], sum(line.quantity for line in lines.filter(cheque__supplier__isnull=False)))
+            self.assertEqual(totals[warehouse.pk, 'Продажа'], sum(line.quantity for line in lines.filter(cheque__customer__isnull=False)))
+            self.assertEqual(totals[warehouse.pk, 'Списание свежей'], sum(debit.quantity for debit in debits.filter(fresh=True)))
+        self.assertTrue(any(totals.values()))
+
+    def test_generated_stock_keeps_occupancy(self):
+        Dataset(products=20, lots=500, cheques=10, debits=10, batch_size=64).generate()
+        for warehouse in Warehouse.objects.all():
+            self.assertEqual(warehouse.occupied_mass, WarehouseProducts.objects.occupied_mass().get(warehouse.pk, 0))
+        self.assertEqual(Cheque.objects.create(date=date(2024, 1, 1)).pk, 11)
@@ -0,0 +1,271 @@
+import os
+import tempfile
+import threading
+from datetime import date, timedelta
+
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from main.bom import explode, invalidate_bom
+from main.clock import invalidate_clock
+from main.dataset import Dataset
+from main.day_close import DayClose
+from main.forms import UserdjForm, WarehouseProductsForm
+from main.models import (
+    CapitalLedger,
+    Cheque,
+    ChequeProduct,
+    Customer,
+    DebitingList,
+    OrderList,
+    Product,
+    Recipe,
+    RecipeProducts,
+    Supplier,
+    SupplierProductPrice,
+    Userdj,
+    Warehouse,
+    WarehouseProducts,
+    Workshop,
+)
+from main.prices import cheapest_price, invalidate_cheapest_prices
+
+
+class DayCloseTests(TestCase):
+    days = 5
+
+    # пекарня: цех печет хлеб из муки и яиц, которых нет на складе и которые
+    # покупаются у одного поставщика, клиент ждет хлеб
+    def bakery(self):
+        userdj = Userdj.objects.create(date_now=date(2024, 1, 10), capital=1000)
+        raw = Warehouse.objects.create(category='Сырье', max_warehouse_capacity=100)
+        finished = Warehouse.objects.create(category='Готовая продукция', max_warehouse_capacity=100)
+        supplier = Supplier.objects.create(name='Поставщик')
+        for name, price in (('Мука', 2), ('Яйца', 5)):
+            product = Product.objects.create(name=name, warehouse=raw, expiry_date=3, mass=1)
+            SupplierProductPrice.objects.create(supplier=supplier, product=product, price=price)
+        bread = Product.objects.create(name='Хлеб', warehouse=finished, expiry_date=2, mass=1)
+        recipe = Recipe.objects.create(name='Рецепт хлеба', finish_product=bread)
+        for product, quantity in zip(Product.objects.filter(warehouse=raw).order_by('pk'), (2, 1)):
+            RecipeProducts.objects.create(recipe=recipe, product=product, quantity=quantity)
+        Workshop.objects.create(name='Пекарня', max_capacity=10, recipe=recipe)
+        OrderList.objects.create(customer=Customer.objects.create(name='Клиент'), product=bread, quantity=25,
+                                 date_order=date(2024, 1, 10), price=20)
+        return userdj
+
+    def state(self):
+        return (
+            Userdj.objects.get().capital,
+            sorted(CapitalLedger.objects.values_list('date', 'kind', 'amount')),
+            sorted(
+                (line.cheque.date, str(line.cheque.supplier), str(line.cheque.customer),
+                 line.product.name, line.price, line.quantity)
+                for line in ChequeProduct.objects.select_related('cheque__supplier', 'cheque__customer', 'product')
+            ),
+            sorted(DebitingList.objects.values_list('product__name', 'quantity', 'date_of_debiting', 'fresh', 'amount')),
+            sorted(WarehouseProducts.objects.values_list('product__name', 'quantity', 'production_date')),
+            sorted(OrderList.objects.values_list('customer__name', 'product__name', 'quantity')),
+            sorted(Workshop.objects.values_list('name', 'recipe__name')),
+        )
+
+    # случайный набор со списаниями стухшего, переполнением складов, вложенными
+    # рецептами и заказами
+    def close_days(self, seed, new_day):
+        Dataset(seed=seed, products=15, suppliers=3, customers=3, recipes=8, workshops=4, lots=60, orders=10,
+                cheques=0, debits=0, history_days=1, capacity=300).generate()
+        userdj = Userdj.objects.get()
+        form = UserdjForm(instance=userdj)
+        for _ in range(self.days):
+            userdj.date_now += timedelta(days=1)
+            new_day(form, userdj)
+            userdj.save()
+        return self.state()
+
+    def test_matches_row_by_row_day_close(self):
+        for seed in range(8):
+            with self.subTest(seed=seed):
+                with transaction.atomic():
+                    expected = self.close_days(seed, UserdjForm.new_day_by_rows)
+                    transaction.set_rollback(True)
+                with transaction.atomic():
+                    actual = self.close_days(seed, UserdjForm.new_day)
+                    transaction.set_rollback(True)
+                capital, ledger, cheques, debits, *rest = expected
+                self.assertTrue(cheques and debits)
+                self.assertEqual(actual, expected)
+
+    def test_form_save_advances_date(self):
+        userdj = self.bakery()
+        form = UserdjForm({'date_now': userdj.date_now}, instance=userdj)
+        self.assertTrue(form.is_valid())
+        form.save()
+        userdj.refresh_from_db()
+        self.assertEqual(userdj.date_now, date(2024, 1, 11))
+        self.assertEqual(Cheque.objects.filter(supplier__isnull=False).count(), 1)
+        self.assertEqual(Cheque.objects.filter(customer__isnull=False).count(), 1)
+
+    def test_capacity_overflow_writes_off_oldest_lots(self):
+        warehouse = Warehouse.objects.create(category='Сырье', max_warehouse_capacity=100)
+        product = Product.objects.create(name='Мука', warehouse=warehouse, expiry_date=10000, mass=1)
+        WarehouseProducts.objects.bulk_create([
+            WarehouseProducts(
+                product=product,
+                quantity=1,
+                production_date=date(2020, 1, 1) + timedelta(days=i),
+                expires_on=date(2020, 1, 1) + timedelta(days=i + 10000),
+            )
+            for i in range(1200)
+        ])
+        for new_day in (UserdjForm.debiting_update, lambda form, userdj: DayClose(userdj).debiting_phase()):
+            with self.subTest(new_day=new_day), transaction.atomic():
+                userdj = Userdj.objects.create(date_now=date(2024, 1, 1), capital=0)
+                new_day(UserdjForm(instance=userdj), userdj)
+                self.assertEqual(DebitingList.objects.filter(fresh=True).count(), 1100)
+                self.assertEqual(
+                    WarehouseProducts.objects.order_by('production_date').first().production_date,
+                    date(2020, 1, 1) + timedelta(days=1100),
+                )
+                transaction.set_rollback(True)
+
+    def test_day_close_does_not_query_prices_or_recipes(self):
+        userdj = self.bakery()
+        cheapest_price(None)
+        explode(Recipe.objects.get().pk)
+        userdj.date_now += timedelta(days=1)
+        with CaptureQueriesContext(connection) as queries:
+            DayClose(userdj).run()
+        self.assertTrue(ChequeProduct.objects.exists())
+        self.assertFalse([query for query in queries
+                          if 'supplier_product_price' in query['sql'] or 'recipe_products' in query['sql']])
+
+    def test_one_purchase_cheque_per_supplier_per_day(self):
+        userdj = self.bakery()
+        for _ in range(self.days):
+            userdj.date_now += timedelta(days=1)
+            DayClose(userdj).run()
+            userdj.save()
+        purchases = Cheque.objects.filter(supplier__isnull=False)
+        self.assertTrue(purchases.exists())
+        self.assertEqual(purchases.count(), purchases.values('date', 'supplier').distinct().count())
+        self.assertEqual(ChequeProduct.objects.filter(cheque__in=purchases).count(), 2 * purchases.count())
+
+    def test_orders_take_oldest_lots_first(self):
+        warehouse = Warehouse.objects.create(category='Готовая продукция', max_warehouse_capacity=1000)
+        product = Product.objects.create(name='Блюдо', warehouse=warehouse, expiry_date=100, mass=1)
+        customer = Customer.objects.create(name='Клиент')
+        for day, quantity in ((5, 4), (1, 3), (3, 5)):
+            WarehouseProducts.objects.create(product=product, quantity=quantity, production_date=date(2024, 1, day))
+        OrderList.objects.create(customer=customer, product=product, quantity=6, date_order=date(2024, 1, 9), price=10)
+
+        def order_phase(form, userdj):
+            day_close = DayClose(userdj)
+            day_close.order_phase()
+            userdj.capital += sum(day_close.capital.values())
+
+        for new_day in (UserdjForm.order_update, order_phase):
+            with self.subTest(new_day=new_day), transaction.atomic():
+                userdj = Userdj.objects.create(date_now=date(2024, 1, 10), capital=0)
+                new_day(UserdjForm(instance=userdj), userdj)
+                self.assertEqual(
+                    sorted(WarehouseProducts.objects.values_list('production_date', 'quantity')),
+                    [(date(2024, 1, 3), 2), (date(2024, 1, 5), 4)],
+                )
+                self.assertFalse(OrderList.objects.exists())
+                self.assertEqual(userdj.capital, 60)
+                transaction.set_rollback(True)
+
+
+# Тестовая база SQLite живет в памяти, а потоки должны идти через те же
+# блокировки файла (WAL, BEGIN IMMEDIATE), что и рабочая база, поэтому на
+# время класса соединение переключается на временный файл с миграциями
+class FileDatabaseMixin:
+    @classmethod
+    def setUpClass(cls):
+        if connection.vendor == 'sqlite':
+            cls.directory = tempfile.TemporaryDirectory()
+            cls.memory = connection.settings_dict['NAME'], connection.connection
+            connection.connection = None
+            connection.settings_dict['NAME'] = os.path.join(cls.directory.name, 'db.sqlite3')
+            call_command('migrate', verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if connection.vendor == 'sqlite':
+            connection.close()
+            connection.settings_dict['NAME'], connection.connection = cls.memory
+            cls.directory.cleanup()
+            invalidate_clock()
+            invalidate_cheapest_prices()
+            invalidate_bom()
+
+
+class ConcurrentDayCloseTests(FileDatabaseMixin, TransactionTestCase):
+    purchases = 30
+
+    # мука по 2 за штуку и стухшая партия, которую спишет закрытие дня
+    def setUp(self):
+        invalidate_clock()
+        invalidate_cheapest_prices()
+        invalidate_bom()
+        Userdj.objects.create(date_now=date(2024, 1, 10), capital=1000)
+        warehouse = Warehouse.objects.create(category='Сырье', max_warehouse_capacity=10 ** 6)
+        self.flour = Product.objects.create(name='Мука', warehouse=warehouse, expiry_date=30, mass=1)
+        SupplierProductPrice.objects.create(supplier=Supplier.objects.create(name='Поставщик'), product=self.flour, price=2)
+        WarehouseProducts.objects.create(product=self.flour, quantity=5, production_date=date(2023, 12, 1))
+
+    def close_day(self):
+        userdj = Userdj.objects.get()
+        form = UserdjForm({'date_now': userdj.date_now}, instance=userdj)
+        self.assertTrue(form.is_valid())
+        form.save()
+
+    def buy(self):
+        form = WarehouseProductsForm({'product': self.flour.pk, 'quantity': 1, 'production_date': date(2024, 1, 10)})
+        self.assertTrue(form.is_valid())
+        form.save()
+
+    def test_purchase_locks_user_before_lot(self):
+        form = WarehouseProductsForm({'product': self.flour.pk, 'quantity': 1, 'production_date': date(2024, 1, 10)})
+        self.assertTrue(form.is_valid())
+        with CaptureQueriesContext(connection) as queries:
+            form.save()
+        tables = [next((table for table in ('"userdj"', '"WarehouseProducts"') if table in query['sql']), None)
+                  for query in queries]
+        self.assertLess(tables.index('"userdj"'), tables.index('"WarehouseProducts"'))
+
+    def test_purchases_during_day_close(self):
+        with transaction.atomic():
+            self.close_day()
+            closed = Userdj.objects.get().capital
+            transaction.set_rollback(True)
+
+        # две отправки формы закрытия дня со старой датой и покупки вперемешку
+        jobs = [self.close_day] * 2 + [self.buy] * self.purchases
+        barrier = threading.Barrier(len(jobs))
+        errors = []
+
+        def run(job):
+            try:
+                barrier.wait()
+                job()
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(job,)) for job in jobs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        userdj = Userdj.objects.get()
+        self.assertEqual(userdj.date_now, date(2024, 1, 11))
+        self.assertEqual(userdj.capital, closed - 2 * self.purchases)
+        self.assertEqual(WarehouseProducts.objects.filter(product=self.flour).count(), self.purchases)
+        self.assertEqual(ChequeProduct.objects.filter(product=self.flour).count(), self.purchases)
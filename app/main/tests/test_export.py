@@ -0,0 +1,61 @@
+import csv
+import json
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from main.models import Cheque, ChequeProduct, Customer, DebitingList, OrderList, Product, Supplier, Warehouse
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        raw = Warehouse.objects.create(category='Сырье', max_warehouse_capacity=100)
+        finished = Warehouse.objects.create(category='Готовая продукция', max_warehouse_capacity=100)
+        flour = Product.objects.create(name='Мука', warehouse=raw, expiry_date=10, mass=1)
+        bread = Product.objects.create(name='Хлеб', warehouse=finished, expiry_date=2, mass=1)
+        supplier = Supplier.objects.create(name='Поставщик')
+        customer = Customer.objects.create(name='Клиент')
+        for day in range(10, 13):
+            purchase = Cheque.objects.create(date=date(2024, 1, day), supplier=supplier)
+            ChequeProduct.objects.create(cheque=purchase, product=flour, price='2.50', quantity=day)
+            sale = Cheque.objects.create(date=date(2024, 1, day), customer=customer)
+            ChequeProduct.objects.create(cheque=sale, product=bread, price=10, quantity=2)
+            ChequeProduct.objects.create(cheque=sale, product=flour, price=4, quantity=1)
+            DebitingList.objects.create(product=flour, quantity=1, date_of_debiting=date(2024, 1, day), fresh=False, amount=2)
+            OrderList.objects.create(customer=customer, product=bread, quantity=3, date_order=date(2024, 1, day), price=10)
+        # за пределами выгружаемого периода
+        later = Cheque.objects.create(date=date(2025, 1, 1), supplier=supplier)
+        ChequeProduct.objects.create(cheque=later, product=flour, price=2, quantity=1)
+
+    def export(self, name, output, **params):
+        response = self.client.get(reverse('main:export', args=[name]), {
+            'start_date': '2024-01-01', 'end_date': '2024-12-31', 'format': output, **params})
+        self.assertTrue(response.streaming)
+        with CaptureQueriesContext(connection) as queries:
+            content = b''.join(response.streaming_content).decode()
+        self.assertEqual(len(queries), 1)
+        return content
+
+    def test_csv_and_json_match_rows(self):
+        lines = ChequeProduct.objects.filter(cheque__date__year=2024).order_by('cheque_id', 'pk')
+        rows = list(csv.reader(StringIO(self.export('cheques', 'csv'))))
+        self.assertEqual(rows[0], ['cheque', 'date', 'supplier', 'customer', 'product', 'category', 'price', 'quantity'])
+        self.assertEqual([(int(row[0]), row[4], Decimal(row[6]), int(row[7])) for row in rows[1:]],
+                         [(line.cheque_id, line.product.name, line.price, line.quantity) for line in lines])
+
+        items = json.loads(self.export('debiting', 'json'))
+        self.assertEqual(len(items), DebitingList.objects.count())
+        self.assertEqual(len(json.loads(self.export('orders', 'json'))), OrderList.objects.count())
+
+    def test_filters_by_warehouse_and_validates(self):
+        warehouse = Warehouse.objects.get(category='Сырье')
+        items = json.loads(self.export('cheques', 'json', warehouse=warehouse.pk))
+        self.assertEqual(len(items), ChequeProduct.objects.filter(product__warehouse=warehouse, cheque__date__year=2024).count())
+        self.assertEqual({item['category'] for item in items}, {'Сырье'})
+        self.assertEqual(self.client.get(reverse('main:export', args=['cheques']), {'start_date': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('main:export', args=['users'])).status_code, 404)
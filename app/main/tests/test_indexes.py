@@ -0,0 +1,20 @@
+import random
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+
+from main.management.commands.bench_indexes import access_paths
+from main.models import Customer, Product, Supplier, Warehouse
+
+
+class IndexTests(TestCase):
+    @skipUnless(connection.vendor == 'sqlite', 'проверяются планы SQLite')
+    def test_hot_paths_use_composite_indexes(self):
+        warehouse = Warehouse.objects.create(category='Сырье', max_warehouse_capacity=100)
+        product = Product.objects.create(name='Мука', warehouse=warehouse, expiry_date=10, mass=1)
+        supplier = Supplier.objects.create(name='Поставщик')
+        customer = Customer.objects.create(name='Клиент')
+        for model, index, query in access_paths(random.Random(0), [product], [supplier], [customer]):
+            with self.subTest(index=index):
+                self.assertIn(index, query().explain())
@@ -0,0 +1,75 @@
+from datetime import date
+from decimal import Decimal
+
+from django.test import TestCase
+from django.urls import reverse
+
+from main.forms import UserdjForm
+from main.ledger import capital_summary, cumulative, period_bounds, post
+from main.models import (
+    CapitalLedger,
+    CapitalSnapshot,
+    ChequeProduct,
+    Customer,
+    OrderList,
+    Product,
+    Recipe,
+    RecipeProducts,
+    Supplier,
+    SupplierProductPrice,
+    Userdj,
+    Warehouse,
+    Workshop,
+)
+
+
+class CapitalLedgerTests(TestCase):
+    def test_kopecks_do_not_drift(self):
+        userdj = Userdj.objects.create(date_now=date(2024, 1, 10), capital=0)
+        for _ in range(1000):
+            post(userdj.pk, {(date(2024, 1, 10), CapitalLedger.Kind.SALE): Decimal('0.10')})
+        post(userdj.pk, {(date(2024, 1, 10), CapitalLedger.Kind.PURCHASE): -0.3})
+        self.assertEqual(Userdj.objects.get().capital, Decimal('99.70'))
+
+    # цех каждый день покупает муку на хлеб, хлеб уходит по заказу
+    def test_snapshots_match_cheques(self):
+        userdj = Userdj.objects.create(date_now=date(2024, 1, 10), capital=1000)
+        opening = userdj.capital
+        warehouse = Warehouse.objects.create(category='Сырье', max_warehouse_capacity=1000)
+        flour = Product.objects.create(name='Мука', warehouse=warehouse, expiry_date=10, mass=1)
+        bread = Product.objects.create(name='Хлеб', warehouse=warehouse, expiry_date=2, mass=1)
+        SupplierProductPrice.objects.create(supplier=Supplier.objects.create(name='Поставщик'), product=flour, price=3)
+        recipe = Recipe.objects.create(name='Рецепт хлеба', finish_product=bread)
+        RecipeProducts.objects.create(recipe=recipe, product=flour, quantity=2)
+        Workshop.objects.create(name='Пекарня', max_capacity=4, recipe=recipe)
+        OrderList.objects.create(customer=Customer.objects.create(name='Клиент'), product=bread, quantity=100,
+                                 date_order=date(2024, 1, 10), price=10)
+
+        for _ in range(5):
+            UserdjForm({'date_now': userdj.date_now}, instance=userdj).save()
+        capital = Userdj.objects.get().capital
+        self.assertEqual(sum(CapitalLedger.objects.values_list('amount', flat=True)), capital * 100)
+        self.assertEqual(CapitalSnapshot.objects.count(), 5)
+
+        last = CapitalSnapshot.objects.latest('date')
+        with self.assertNumQueries(1):
+            self.assertEqual(sum(cumulative(last.date).values()), last.balance)
+
+        start, end = period_bounds(2024, 1)
+        self.assertEqual((start, end), (date(2024, 1, 1), date(2024, 3, 31)))
+        summary = capital_summary(start, end)
+        self.assertEqual(summary['opening_balance'], 0)
+        self.assertEqual(summary['closing_balance'], capital)
+        lines = ChequeProduct.objects.filter(cheque__date__range=[start, end])
+        movements = dict(summary['movements'])
+        for label, lines in (('Закупка', lines.filter(cheque__supplier__isnull=False)),
+                             ('Продажа', lines.filter(cheque__customer__isnull=False))):
+            total = sum(line.price * line.quantity for line in lines)
+            self.assertTrue(total)
+            self.assertEqual(abs(movements[label]), total)
+        self.assertEqual(movements['Начальный капитал'], opening)
+
+        response = self.client.get(reverse('main:finance'), {'year': 2024, 'quarter': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['summary']['closing_balance'], capital)
+        self.assertEqual(self.client.get(reverse('main:finance'), {'year': 2024, 'quarter': 5}).status_code, 400)
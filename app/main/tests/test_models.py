@@ -0,0 +1,117 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.db.models import F
+from django.test import TestCase
+
+from main.forms import UserdjForm
+from main.models import (
+    Customer,
+    OrderList,
+    Product,
+    Recipe,
+    RecipeProducts,
+    Supplier,
+    SupplierProductPrice,
+    Userdj,
+    Warehouse,
+    WarehouseProducts,
+    Workshop,
+)
+
+
+class WarehouseProductsTests(TestCase):
+    def test_expires_on_follows_product_expiry_date(self):
+        warehouse = Warehouse.objects.create(category='Сырье', max_warehouse_capacity=100)
+        product = Product.objects.create(name='Молоко', warehouse=warehouse, expiry_date=3, mass=1)
+        lot = WarehouseProducts.objects.create(product=product, quantity=5, production_date=date(2024, 1, 1))
+        self.assertEqual(lot.expires_on, date(2024, 1, 4))
+
+        product.expiry_date = 7
+        product.save()
+        lot.refresh_from_db()
+        self.assertEqual(lot.expires_on, date(2024, 1, 8))
+
+        WarehouseProducts.objects.bulk_create([
+            WarehouseProducts(product=product, quantity=1, production_date=date(2024, 1, 2) + timedelta(days=day),
+                              expires_on=date(2024, 1, 1))
+            for day in range(300)
+        ])
+        with self.assertNumQueries(2):
+            self.assertEqual(WarehouseProducts.objects.update_expires_on(), 301)
+        self.assertEqual(WarehouseProducts.objects.filter(expires_on__lt=date(2024, 1, 10)).count(), 2)
+
+
+class OccupancyTests(TestCase):
+    # тесный склад сырья со стухшими и свежими партиями муки и цех, который
+    # докупает муку и кладет хлеб на склад готовой продукции
+    def stock(self):
+        raw = Warehouse.objects.create(category='Сырье', max_warehouse_capacity=30)
+        finished = Warehouse.objects.create(category='Готовая продукция', max_warehouse_capacity=20)
+        flour = Product.objects.create(name='Мука', warehouse=raw, expiry_date=4, mass=Decimal('1.50'))
+        bread = Product.objects.create(name='Хлеб', warehouse=finished, expiry_date=2, mass=Decimal('0.75'))
+        SupplierProductPrice.objects.create(supplier=Supplier.objects.create(name='Поставщик'), product=flour, price=2)
+        recipe = Recipe.objects.create(name='Рецепт хлеба', finish_product=bread)
+        RecipeProducts.objects.create(recipe=recipe, product=flour, quantity=2)
+        Workshop.objects.create(name='Пекарня', max_capacity=6, recipe=recipe)
+        OrderList.objects.create(customer=Customer.objects.create(name='Клиент'), product=bread, quantity=5,
+                                 date_order=date(2024, 1, 10), price=10)
+        for age, quantity in ((6, 4), (3, 10), (1, 12), (0, 9)):
+            WarehouseProducts.objects.create(product=flour, quantity=quantity,
+                                             production_date=date(2024, 1, 10) - timedelta(days=age))
+        return Userdj.objects.create(date_now=date(2024, 1, 10), capital=1000)
+
+    def assertOccupancyConsistent(self):
+        occupied = WarehouseProducts.objects.occupied_mass()
+        for warehouse in Warehouse.objects.all():
+            self.assertAlmostEqual(float(warehouse.occupied_mass), float(occupied.get(warehouse.pk) or 0), places=2)
+
+    def test_counter_follows_day_close(self):
+        for new_day in (UserdjForm.new_day_by_rows, UserdjForm.new_day):
+            with self.subTest(new_day=new_day.__name__), transaction.atomic():
+                userdj = self.stock()
+                for _ in range(3):
+                    userdj.date_now += timedelta(days=1)
+                    new_day(UserdjForm(instance=userdj), userdj)
+                    userdj.save()
+                    self.assertOccupancyConsistent()
+                transaction.set_rollback(True)
+
+    def test_counter_follows_product_mass(self):
+        self.stock()
+        product = Product.objects.get(name='Мука')
+        product.mass += 1
+        product.save()
+        self.assertOccupancyConsistent()
+
+    def test_counter_follows_queryset_updates_and_deletes(self):
+        raw, finished = [Warehouse.objects.create(category=category, max_warehouse_capacity=1000)
+                         for category in ('Сырье', 'Готовая продукция')]
+        flour, sugar = [Product.objects.create(name=name, warehouse=raw, expiry_date=10, mass=2) for name in ('Мука', 'Сахар')]
+        cake = Product.objects.create(name='Торт', warehouse=finished, expiry_date=3, mass=1)
+        for product in (flour, sugar, cake):
+            WarehouseProducts.objects.create(product=product, quantity=5, production_date=date(2024, 1, 10))
+
+        WarehouseProducts.objects.filter(product=flour).update(quantity=F('quantity') + 3)
+        self.assertOccupancyConsistent()
+        WarehouseProducts.objects.filter(product=sugar).update(product=cake)
+        self.assertOccupancyConsistent()
+        Product.objects.filter(pk=cake.pk).update(mass=4)
+        self.assertOccupancyConsistent()
+        Product.objects.filter(pk=flour.pk).update(warehouse=finished)
+        self.assertOccupancyConsistent()
+        Product.objects.filter(warehouse=finished).delete()
+        self.assertOccupancyConsistent()
+        self.assertEqual([warehouse.occupied_mass for warehouse in Warehouse.objects.order_by('pk')], [0, 0])
+
+    def test_rebuild_command(self):
+        self.stock()
+        Warehouse.objects.update(occupied_mass=0)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_occupancy', '--check', stdout=StringIO())
+        call_command('rebuild_occupancy', stdout=StringIO())
+        self.assertOccupancyConsistent()
+        call_command('rebuild_occupancy', '--check', stdout=StringIO())
@@ -0,0 +1,82 @@
+import os
+import tempfile
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from main.models import Customer, OrderList, Product, Userdj, Warehouse
+from main.orders import intake_orders
+
+
+class OrderIntakeTests(TestCase):
+    def setUp(self):
+        Userdj.objects.create(date_now=date(2024, 1, 10), capital=0)
+        warehouse = Warehouse.objects.create(category='Готовая продукция', max_warehouse_capacity=100)
+        self.product = Product.objects.create(name='Торт', warehouse=warehouse, expiry_date=3, mass=1)
+        self.customer = Customer.objects.create(name='Клиент')
+
+    def test_per_line_results(self):
+        rows = [
+            {'customer': self.customer.pk, 'product': self.product.pk, 'quantity': 3, 'price': '12.50'},
+            {'customer': 999, 'product': self.product.pk, 'quantity': 0, 'price': 1},
+            {'customer': self.customer.pk, 'product': 'торт', 'quantity': 1, 'price': '0.001'},
+            {'customer': self.customer.pk, 'product': self.product.pk, 'quantity': '2', 'price': 7},
+        ]
+        with self.settings(API_TOKENS=['secret']):
+            response = self.client.post(reverse('main:intake_orders'), rows, content_type='application/json',
+                                        headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 201)
+        result = response.json()
+        self.assertEqual((result['accepted'], result['rejected']), (2, 2))
+        self.assertEqual(len(result['lines'][1]['errors']), 2)
+        self.assertEqual(len(result['lines'][2]['errors']), 2)
+        orders = OrderList.objects.order_by('pk')
+        self.assertEqual([order.pk for order in orders], [result['lines'][0]['order'], result['lines'][3]['order']])
+        self.assertEqual([(order.quantity, order.price, order.date_order) for order in orders],
+                         [(3, Decimal('12.50'), date(2024, 1, 10)), (2, Decimal('7.00'), date(2024, 1, 10))])
+
+    def test_api_needs_token_not_csrf(self):
+        client = Client(enforce_csrf_checks=True)
+        rows = [{'customer': self.customer.pk, 'product': self.product.pk, 'quantity': 1, 'price': 5}]
+        with self.settings(API_TOKENS=['secret']):
+            for headers in ({}, {'Authorization': 'Bearer wrong'}, {'Authorization': 'Basic secret'}):
+                response = client.post(reverse('main:intake_orders'), rows, content_type='application/json', headers=headers)
+                self.assertEqual(response.status_code, 401)
+            response = client.post(reverse('main:intake_orders'), rows, content_type='application/json',
+                                   headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(OrderList.objects.count(), 1)
+
+    def test_rejected_without_simulation_user(self):
+        Userdj.objects.all().delete()
+        rows = [{'customer': self.customer.pk, 'product': self.product.pk, 'quantity': 1, 'price': 5}]
+        with self.settings(API_TOKENS=['secret']):
+            response = self.client.post(reverse('main:intake_orders'), rows, content_type='application/json',
+                                        headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(OrderList.objects.exists())
+
+    def test_large_batch_is_validated_in_bulk(self):
+        rows = [{'customer': self.customer.pk, 'product': self.product.pk, 'quantity': i % 30 + 1, 'price': '99.90'}
+                for i in range(5000)]
+        with CaptureQueriesContext(connection) as queries:
+            result = intake_orders(rows)
+        self.assertEqual(result['accepted'], 5000)
+        # проверка идет тремя запросами, дальше - только пачки INSERT (в SQLite
+        # их размер ограничен числом параметров запроса)
+        self.assertLess(len(queries), 50)
+
+        content = f'customer,product,quantity,price\n{self.customer.pk},{self.product.pk},4,10\n,{self.product.pk},1,1\n'
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'orders.csv')
+            with open(path, 'w') as upload:
+                upload.write(content)
+            out = StringIO()
+            call_command('intake_orders', path, stdout=out)
+        self.assertIn('Принято заказов: 1, отклонено: 1', out.getvalue())
@@ -0,0 +1,26 @@
+from django.test import TestCase
+from django.urls import reverse
+
+from main.models import Product, Supplier, SupplierProductPrice, Warehouse
+from main.prices import cheapest_price, invalidate_cheapest_prices
+
+
+class CheapestPriceTests(TestCase):
+    def setUp(self):
+        invalidate_cheapest_prices()
+        warehouse = Warehouse.objects.create(category='Сырье', max_warehouse_capacity=100)
+        self.product = Product.objects.create(name='Сахар', warehouse=warehouse, expiry_date=30, mass=1)
+        self.suppliers = [Supplier.objects.create(name=f'Поставщик {i}') for i in range(2)]
+
+    def test_cache_follows_price_changes(self):
+        self.assertIsNone(cheapest_price(self.product.pk))
+        expensive = SupplierProductPrice.objects.create(supplier=self.suppliers[0], product=self.product, price=20)
+        cheap = SupplierProductPrice.objects.create(supplier=self.suppliers[1], product=self.product, price=10)
+        self.assertEqual(cheapest_price(self.product.pk).pk, cheap.pk)
+
+        cheap.price = 30
+        cheap.save()
+        self.assertEqual(cheapest_price(self.product.pk).pk, expensive.pk)
+
+        self.client.post(reverse('main:delete_supplier_product_price', args=[expensive.pk]))
+        self.assertEqual(cheapest_price(self.product.pk).pk, cheap.pk)
@@ -0,0 +1,126 @@
+import json
+import os
+import tempfile
+from datetime import date
+from io import StringIO
+
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from main.forms import BulkPurchaseForm, WarehouseProductsForm
+from main.models import (
+    Cheque,
+    ChequeProduct,
+    Product,
+    Supplier,
+    SupplierProductPrice,
+    Userdj,
+    Warehouse,
+    WarehouseProducts,
+)
+from main.prices import cheapest_price
+from main.purchases import bulk_purchase, parse_lines
+
+
+class BulkPurchaseTests(TestCase):
+    # мука дешевле у первого поставщика, сахар - у второго, соль у обоих по
+    # одной цене, а перец не продает никто
+    def setUp(self):
+        Userdj.objects.create(date_now=date(2024, 1, 10), capital=10000)
+        warehouse = Warehouse.objects.create(category='Сырье', max_warehouse_capacity=1000)
+        self.flour, self.sugar, self.salt, self.pepper = [
+            Product.objects.create(name=name, warehouse=warehouse, expiry_date=10, mass=1)
+            for name in ('Мука', 'Сахар', 'Соль', 'Перец')
+        ]
+        first, second = [Supplier.objects.create(name=f'Поставщик {i}') for i in range(2)]
+        for supplier, product, price in ((first, self.flour, 2), (second, self.flour, 3), (first, self.sugar, 5),
+                                         (second, self.sugar, 4), (first, self.salt, 1), (second, self.salt, 1)):
+            SupplierProductPrice.objects.create(supplier=supplier, product=product, price=price)
+        products = [self.flour, self.sugar, self.salt]
+        self.lines = [(products[i % 3].pk, i + 1, None) for i in range(12)]
+
+    def state(self):
+        return (
+            Userdj.objects.get().capital,
+            sorted(WarehouseProducts.objects.values_list('product_id', 'quantity', 'production_date', 'expires_on')),
+            sorted(ChequeProduct.objects.values_list('cheque__supplier_id', 'cheque__date', 'product_id', 'price', 'quantity')),
+            sorted(Warehouse.objects.values_list('pk', 'occupied_mass')),
+        )
+
+    def test_matches_single_purchases(self):
+        with transaction.atomic():
+            for product_id, quantity, production_date in self.lines:
+                form = WarehouseProductsForm({'product': product_id, 'quantity': quantity,
+                                              'production_date': date(2024, 1, 10)})
+                self.assertTrue(form.is_valid())
+                form.save()
+            expected = self.state()
+            transaction.set_rollback(True)
+
+        with CaptureQueriesContext(connection) as queries:
+            result = bulk_purchase(self.lines)
+        self.assertLess(len(queries), 15)
+        self.assertEqual(self.state(), expected)
+        suppliers = {cheapest_price(product_id).supplier_id for product_id, quantity, production_date in self.lines}
+        self.assertEqual(result['cheques'], len(suppliers))
+        self.assertEqual(Cheque.objects.count(), len(suppliers))
+
+    def test_rejected_without_simulation_user(self):
+        Userdj.objects.all().delete()
+        with self.settings(API_TOKENS=['secret']):
+            response = self.client.post(reverse('main:bulk_purchase'), [{'product': self.flour.pk, 'quantity': 2}],
+                                        content_type='application/json', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(WarehouseProducts.objects.exists() or Cheque.objects.exists())
+
+    def test_api_needs_token_and_form_needs_csrf(self):
+        client = Client(enforce_csrf_checks=True)
+        lines = [{'product': self.flour.pk, 'quantity': 2}]
+        with self.settings(API_TOKENS=['secret']):
+            response = client.post(reverse('main:bulk_purchase'), lines, content_type='application/json',
+                                   headers={'Authorization': 'Bearer wrong'})
+            self.assertEqual(response.status_code, 401)
+            response = client.post(reverse('main:bulk_purchase'), lines, content_type='application/json')
+            self.assertEqual(response.status_code, 403)
+            response = client.post(reverse('main:bulk_purchase'), lines, content_type='application/json',
+                                   headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.json()['lots'], 1)
+
+        response = client.get(reverse('main:bulk_purchase'))
+        upload = SimpleUploadedFile('lines.json', json.dumps(lines).encode())
+        response = client.post(reverse('main:bulk_purchase'),
+                               {'file': upload, 'csrfmiddlewaretoken': response.context['csrf_token']})
+        self.assertRedirects(response, reverse('main:success'), fetch_redirect_response=False)
+
+    def test_json_api_csv_command_and_form(self):
+        product_id = self.flour.pk
+        with self.settings(API_TOKENS=['secret']):
+            response = self.client.post(reverse('main:bulk_purchase'), [{'product': product_id, 'quantity': 2}],
+                                        content_type='application/json', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.json()['lots'], 1)
+
+        before = self.state()
+        response = self.client.post(reverse('main:bulk_purchase'), [{'product': product_id, 'quantity': 2},
+                                                                    {'product': self.pepper.pk, 'quantity': 1}],
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.state(), before)
+
+        content = f'product,quantity,production_date\n{product_id},3,2024-01-05\n{product_id},4,\n'
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'lines.csv')
+            with open(path, 'w') as upload:
+                upload.write(content)
+            call_command('bulk_purchase', path, stdout=StringIO())
+        self.assertEqual(WarehouseProducts.objects.filter(product_id=product_id, production_date=date(2024, 1, 5)).count(), 1)
+        with self.assertRaises(ValidationError):
+            parse_lines('product,quantity\nмука,1\n', 'lines.csv')
+
+        form = BulkPurchaseForm({}, {'file': SimpleUploadedFile('lines.json', b'[{"product": %d, "quantity": 5}]' % product_id)})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.save()['cost'], 10)
@@ -0,0 +1,140 @@
+from datetime import date, timedelta
+
+from django.db.models import F, Sum
+from django.test import TestCase
+
+from main.clock import current_date
+from main.forms import UserdjForm
+from main.models import (
+    CapitalLedger,
+    Cheque,
+    ChequeProduct,
+    CumulativeRollup,
+    Customer,
+    DailyRollup,
+    DebitingList,
+    Product,
+    Supplier,
+    SupplierProductPrice,
+    Userdj,
+    Warehouse,
+    WarehouseProducts,
+)
+from main.prices import invalidate_cheapest_prices
+from main.rollup import period_totals, rollup_day, rollup_days
+
+
+class DailyRollupTests(TestCase):
+    def setUp(self):
+        self.userdj = Userdj.objects.create(date_now=date(2024, 1, 10), capital=1000)
+        self.raw = Warehouse.objects.create(category='Сырье', max_warehouse_capacity=1000)
+        self.finished = Warehouse.objects.create(category='Готовая продукция', max_warehouse_capacity=1000)
+        self.flour = Product.objects.create(name='Мука', warehouse=self.raw, expiry_date=2, mass=1)
+        self.bread = Product.objects.create(name='Хлеб', warehouse=self.finished, expiry_date=2, mass=1)
+        self.supplier = Supplier.objects.create(name='Поставщик')
+        self.customer = Customer.objects.create(name='Клиент')
+        SupplierProductPrice.objects.create(supplier=self.supplier, product=self.flour, price=2)
+
+    # закупка муки, продажа хлеба и муки и списания за день
+    def trade(self, day):
+        purchase = Cheque.objects.create(date=day, supplier=self.supplier)
+        ChequeProduct.objects.create(cheque=purchase, product=self.flour, price=2, quantity=day.day)
+        sale = Cheque.objects.create(date=day, customer=self.customer)
+        ChequeProduct.objects.create(cheque=sale, product=self.bread, price=10, quantity=day.day % 3 + 1)
+        ChequeProduct.objects.create(cheque=sale, product=self.flour, price=3, quantity=1)
+        DebitingList.objects.create(product=self.flour, quantity=2, date_of_debiting=day, fresh=False, amount=4)
+        DebitingList.objects.create(product=self.bread, quantity=1, date_of_debiting=day, fresh=True, amount=0)
+
+    def test_period_totals_match_raw_rows(self):
+        userdj = self.userdj
+        for _ in range(4):
+            self.trade(userdj.date_now)
+            form = UserdjForm({'date_now': userdj.date_now}, instance=userdj)
+            self.assertTrue(form.is_valid())
+            userdj = form.save()
+        self.assertEqual(DailyRollup.objects.filter(date__gte=userdj.date_now).count(), 0)
+        self.assertTrue(DailyRollup.objects.exists())
+
+        totals = {
+            (item['warehouse'].pk, label): value
+            for item in period_totals('2024-01-01', '2024-12-31')
+            for label, value in item['totals']
+        }
+        for warehouse in Warehouse.objects.all():
+            purchases = ChequeProduct.objects.filter(cheque__supplier__isnull=False, product__warehouse=warehouse)
+            sales = ChequeProduct.objects.filter(cheque__customer__isnull=False, product__warehouse=warehouse)
+            stale = DebitingList.objects.filter(fresh=False, product__warehouse=warehouse)
+            self.assertEqual(totals[warehouse.pk, 'Закупка']['quantity'], sum(line.quantity for line in purchases))
+            self.assertEqual(totals[warehouse.pk, 'Закупка']['amount'], sum(line.quantity * line.price for line in purchases))
+            self.assertEqual(totals[warehouse.pk, 'Продажа']['quantity'], sum(line.quantity for line in sales))
+            self.assertEqual(totals[warehouse.pk, 'Списание стухшей']['quantity'], sum(debit.quantity for debit in stale))
+
+    def test_recomputed_day_is_updated_in_place(self):
+        day = date(2024, 1, 10)
+        supplier_cheque = Cheque.objects.create(date=day, supplier=self.supplier)
+        line = ChequeProduct.objects.create(cheque=supplier_cheque, product=self.flour, price=2, quantity=3)
+        customer_cheque = Cheque.objects.create(date=day, customer=self.customer)
+        sale = ChequeProduct.objects.create(cheque=customer_cheque, product=self.flour, price=5, quantity=1)
+        rollup_day(day)
+        purchase = DailyRollup.objects.get(date=day, product=self.flour, kind=DailyRollup.Kind.PURCHASE)
+
+        line.quantity = 4
+        line.save()
+        sale.delete()
+        rollup_day(day)
+        self.assertEqual(DailyRollup.objects.get(pk=purchase.pk).quantity, 4)
+        self.assertFalse(DailyRollup.objects.filter(date=day, kind=DailyRollup.Kind.SALE).exists())
+        self.assertEqual(
+            CumulativeRollup.objects.get(date=day, warehouse=self.raw, kind=DailyRollup.Kind.PURCHASE).quantity,
+            DailyRollup.objects.filter(warehouse=self.raw, kind=DailyRollup.Kind.PURCHASE).aggregate(total=Sum('quantity'))['total'],
+        )
+
+    # партии муки стухают и не помещаются на тесный склад
+    def test_write_offs_keep_price_of_close(self):
+        Warehouse.objects.filter(pk=self.raw.pk).update(max_warehouse_capacity=10)
+        for age in range(6):
+            WarehouseProducts.objects.create(product=self.flour, quantity=6,
+                                             production_date=date(2024, 1, 10) - timedelta(days=age))
+        userdj = self.userdj
+        for _ in range(4):
+            userdj = UserdjForm({'date_now': userdj.date_now}, instance=userdj).save()
+        SupplierProductPrice.objects.update(price=F('price') * 2)
+        invalidate_cheapest_prices()
+        rollup_days(date(2024, 1, 1), userdj.date_now - timedelta(days=1))
+
+        kinds = [DailyRollup.Kind.FRESH_WRITE_OFF, DailyRollup.Kind.STALE_WRITE_OFF]
+        rollups = DailyRollup.objects.filter(kind__in=kinds).aggregate(total=Sum('amount'))['total']
+        ledger = CapitalLedger.objects.filter(kind__in=kinds, date__lt=userdj.date_now).aggregate(total=Sum('amount'))['total']
+        self.assertEqual(set(DailyRollup.objects.filter(kind__in=kinds).values_list('kind', flat=True)), set(kinds))
+        self.assertEqual(rollups * 100, ledger)
+
+    def test_prefix_sums_match_daily_rollups(self):
+        for offset in range(6):
+            self.trade(date(2024, 1, 10) + timedelta(days=offset))
+        rollup_days(date(2024, 1, 10), date(2024, 1, 15))
+        self.userdj.date_now = date(2024, 1, 16)
+        self.userdj.save()
+        closed = date(2024, 1, 15)
+        # закрытые дни: дата симуляции, две выборки нарастающих итогов и склады
+        current_date()
+        for start, end, only in ((date(2024, 1, 1), closed, None), (date(2024, 1, 12), date(2024, 1, 13), self.raw.pk),
+                                 (date(2024, 1, 13), date(2024, 1, 13), None)):
+            rollups = DailyRollup.objects.filter(date__range=[start, end])
+            if only:
+                rollups = rollups.filter(warehouse=only)
+            expected = {
+                (row['warehouse_id'], row['kind']): (row['quantity'], row['amount'])
+                for row in rollups.values('warehouse_id', 'kind').annotate(quantity=Sum('quantity'), amount=Sum('amount')).order_by()
+            }
+            labels = dict(DailyRollup.Kind.choices)
+            with self.subTest(start=start, end=end), self.assertNumQueries(3):
+                totals = {
+                    (item['warehouse'].pk, label): (value['quantity'], value['amount'])
+                    for item in period_totals(start, end, only)
+                    for label, value in item['totals']
+                }
+            self.assertTrue(expected)
+            for (warehouse_id, kind), value in expected.items():
+                self.assertEqual(totals[warehouse_id, labels[kind]], value)
+            self.assertEqual(sum(quantity for quantity, amount in totals.values()),
+                             sum(quantity for quantity, amount in expected.values()))
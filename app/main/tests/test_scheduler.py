@@ -0,0 +1,71 @@
+from datetime import date
+
+from django.test import TestCase
+
+from main.forms import UserdjForm
+from main.models import (
+    Customer,
+    OrderList,
+    Product,
+    Recipe,
+    RecipeProducts,
+    Supplier,
+    SupplierProductPrice,
+    Userdj,
+    Warehouse,
+    Workshop,
+)
+from main.scheduler import WorkshopSchedule
+
+
+class WorkshopScheduleTests(TestCase):
+    def setUp(self):
+        warehouse = Warehouse.objects.create(category='Готовая продукция', max_warehouse_capacity=1000)
+        customer = Customer.objects.create(name='Клиент')
+        self.flour, self.yeast, self.bread, self.bun, self.cake = [
+            Product.objects.create(name=name, warehouse=warehouse, expiry_date=5, mass=1)
+            for name in ('Мука', 'Закваска', 'Хлеб', 'Булка', 'Торт')
+        ]
+        supplier = Supplier.objects.create(name='Поставщик')
+        SupplierProductPrice.objects.create(supplier=supplier, product=self.flour, price=1)
+        self.recipes = {}
+        for product, ingredient in ((self.bread, self.flour), (self.bun, self.flour), (self.cake, self.yeast)):
+            self.recipes[product.pk] = Recipe.objects.create(name=f'Рецепт {product.name}', finish_product=product).pk
+            RecipeProducts.objects.create(recipe_id=self.recipes[product.pk], product=ingredient, quantity=1)
+        self.workshops = [Workshop.objects.create(name=f'Цех {capacity}', max_capacity=capacity) for capacity in (10, 100)]
+        self.orders = [
+            OrderList.objects.create(customer=customer, product=product, quantity=quantity,
+                                     date_order=date(2024, 1, 10), price=1)
+            for product, quantity in ((self.bread, 100), (self.bun, 5), (self.cake, 50))
+        ]
+
+    def schedule(self, masses=None):
+        return WorkshopSchedule(self.workshops, self.orders, {}, self.recipes, {
+            recipe_id: list(RecipeProducts.objects.filter(recipe_id=recipe_id)) for recipe_id in self.recipes.values()
+        }, {self.flour.pk: None}, masses or {product_id: 1 for product_id in self.recipes}).plan()
+
+    def test_large_orders_go_to_large_workshops(self):
+        schedule = self.schedule()
+        self.assertEqual(schedule.assignments, {self.workshops[0].pk: self.recipes[self.bun.pk],
+                                                self.workshops[1].pk: self.recipes[self.bread.pk]})
+        report = schedule.report()
+        self.assertEqual((report['covered'], report['baseline_covered']), (105, 15))
+
+    def test_plan_is_repeatable(self):
+        self.assertEqual({self.schedule().assignments == self.schedule().assignments for _ in range(5)}, {True})
+
+    def test_product_without_mass_is_skipped(self):
+        schedule = self.schedule({self.bread.pk: 0, self.bun.pk: 1, self.cake.pk: 1})
+        self.assertNotIn(self.recipes[self.bread.pk], schedule.assignments.values())
+        self.assertEqual(schedule.planned.get(self.bread.pk, 0), 0)
+        schedule.report()
+
+    def test_recipe_without_stock_of_unpurchasable_ingredient_is_skipped(self):
+        self.assertNotIn(self.recipes[self.cake.pk], self.schedule().assignments.values())
+
+    def test_day_close_follows_schedule(self):
+        Userdj.objects.create(date_now=date(2024, 1, 10), capital=1000)
+        form = UserdjForm({'date_now': date(2024, 1, 10), 'capital': 1000}, instance=Userdj.objects.get())
+        self.assertTrue(form.is_valid())
+        form.save()
+        self.assertEqual(dict(Workshop.objects.values_list('pk', 'recipe_id')), self.schedule().assignments)
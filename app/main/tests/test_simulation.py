@@ -0,0 +1,121 @@
+from collections import defaultdict
+from datetime import date
+from io import StringIO
+from unittest import skipUnless
+
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase
+
+from main.dataset import Dataset
+from main.forms import SimulateForm, UserdjForm
+from main.models import (
+    CapitalLedger,
+    CapitalSnapshot,
+    ChequeProduct,
+    CumulativeRollup,
+    DailyRollup,
+    DebitingList,
+    OrderList,
+    Product,
+    Userdj,
+    WarehouseProducts,
+    Workshop,
+)
+from main.simulation import LotStore, Simulation
+
+try:
+    from main.columnar import ColumnarLotStore
+except ImportError:
+    ColumnarLotStore = None
+
+
+class SimulationTests(TestCase):
+    days = 7
+
+    # небольшой случайный набор: тесные склады, вложенные рецепты, заказы
+    def generate(self, seed=0):
+        Dataset(seed=seed, products=15, suppliers=3, customers=3, recipes=8, workshops=4, lots=60, orders=10,
+                cheques=0, debits=0, history_days=1, capacity=300).generate()
+        return Userdj.objects.get()
+
+    def state(self):
+        return (
+            Userdj.objects.get().date_now,
+            Userdj.objects.get().capital,
+            sorted(CapitalLedger.objects.values_list('date', 'kind', 'amount')),
+            sorted(
+                (line.cheque.date, str(line.cheque.supplier), str(line.cheque.customer),
+                 line.product.name, line.price, line.quantity)
+                for line in ChequeProduct.objects.select_related('cheque__supplier', 'cheque__customer', 'product')
+            ),
+            sorted(DebitingList.objects.values_list('product__name', 'quantity', 'date_of_debiting', 'fresh', 'amount')),
+            sorted(WarehouseProducts.objects.values_list('product__name', 'quantity', 'production_date')),
+            sorted(OrderList.objects.values_list('customer__name', 'product__name', 'quantity')),
+            sorted(Workshop.objects.values_list('name', 'recipe__name')),
+            sorted(DailyRollup.objects.values_list('date', 'product__name', 'kind', 'quantity', 'amount')),
+            sorted(CumulativeRollup.objects.values_list('date', 'warehouse__category', 'kind', 'quantity', 'amount')),
+            list(CapitalSnapshot.objects.order_by('date').values_list('date', 'opening', 'purchase', 'sale', 'fresh', 'stale')),
+        )
+
+    def test_matches_day_by_day_close(self):
+        stores = [LotStore.load] + ([ColumnarLotStore.load] if ColumnarLotStore else [])
+        for seed in range(4):
+            with transaction.atomic():
+                userdj = self.generate(seed)
+                for _ in range(self.days):
+                    UserdjForm({'date_now': userdj.date_now}, instance=userdj).save()
+                expected = self.state()
+                transaction.set_rollback(True)
+            for load in stores:
+                with self.subTest(seed=seed, store=load), transaction.atomic():
+                    Simulation(self.generate(seed), flush_every=3, stock=load()).run(self.days)
+                    actual = self.state()
+                    transaction.set_rollback(True)
+                self.assertEqual(actual, expected)
+
+    @skipUnless(ColumnarLotStore, 'нужен numpy')
+    def test_columnar_preview_does_not_write(self):
+        self.generate(5)
+        before = self.state()
+        columnar = Simulation(Userdj.objects.get(), stock=ColumnarLotStore.load()).preview(self.days)
+        rows = Simulation(Userdj.objects.get()).preview(self.days)
+        self.assertEqual(self.state(), before)
+        self.assertEqual(columnar.stock.totals(), rows.stock.totals())
+        self.assertEqual(columnar.capital, rows.capital)
+        self.assertEqual(sorted((debit.product_id, debit.quantity, debit.fresh) for debit in columnar.debits),
+                         sorted((debit.product_id, debit.quantity, debit.fresh) for debit in rows.debits))
+        occupied = columnar.stock.occupied_mass(columnar.warehouses)
+        expected = defaultdict(float)
+        for lot in rows.stock.lots.values():
+            expected[columnar.warehouses[lot.product_id]] += lot.quantity * float(Product.objects.get(pk=lot.product_id).mass)
+        self.assertEqual({key: round(value, 6) for key, value in occupied.items()},
+                         {key: round(value, 6) for key, value in expected.items()})
+
+    def test_second_run_from_same_state_is_rejected(self):
+        self.generate()
+        first, second = Simulation(Userdj.objects.get()), Simulation(Userdj.objects.get())
+        first.run(2)
+        after_first = self.state()
+        with self.assertRaises(ValidationError):
+            second.run(2)
+        self.assertEqual(self.state(), after_first)
+
+    def test_form_limits_days_and_rejects_stale_state(self):
+        self.generate()
+        self.assertFalse(SimulateForm({'days': 365}, instance=Userdj.objects.get()).is_valid())
+        form = SimulateForm({'days': 2}, instance=Userdj.objects.get())
+        Simulation(Userdj.objects.get()).run(1)
+        self.assertTrue(form.is_valid())
+        with self.assertRaises(ValidationError):
+            form.save()
+
+    def test_form_and_command(self):
+        self.generate()
+        form = SimulateForm({'days': 3}, instance=Userdj.objects.get())
+        self.assertTrue(form.is_valid())
+        form.save()
+        call_command('simulate', days=2, stdout=StringIO())
+        self.assertEqual(Userdj.objects.get().date_now, date(2024, 1, 15))
+        call_command('rebuild_occupancy', check=True, stdout=StringIO())
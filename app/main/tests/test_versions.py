@@ -0,0 +1,54 @@
+from django.db import transaction
+from django.test import TransactionTestCase, override_settings
+
+from main.versions import VersionedCache
+
+
+class VersionedCacheTests(TransactionTestCase):
+    def setUp(self):
+        self.loads = []
+        self.rows = {'value': 1}
+
+    def versioned(self):
+        def load():
+            self.loads.append(self.rows['value'])
+            return self.rows['value']
+        return VersionedCache('tests:version', load)
+
+    # два экземпляра с одним ключом - два процесса с общим кэшем
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_version_is_shared_and_changes_after_commit(self):
+        first, second = self.versioned(), self.versioned()
+        self.assertEqual((first.get(), second.get(), first.get()), (1, 1, 1))
+        self.assertEqual(len(self.loads), 2)
+
+        with transaction.atomic():
+            self.rows['value'] = 2
+            second.invalidate()
+            self.assertEqual((second.get(), second.get()), (2, 2))
+            self.assertEqual(first.get(), 1)
+        self.assertEqual((first.get(), second.get()), (2, 2))
+
+        with transaction.atomic():
+            self.rows['value'] = 3
+            first.invalidate()
+            self.assertEqual(first.get(), 3)
+            self.rows['value'] = 2
+            transaction.set_rollback(True)
+        self.assertEqual((first.get(), second.get()), (2, 2))
+        self.assertEqual(self.loads, [1, 1, 2, 2, 2, 3])
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_copy_read_in_rolled_back_savepoint_is_dropped(self):
+        versioned = self.versioned()
+        with transaction.atomic():
+            versioned.invalidate()
+            self.assertEqual(versioned.get(), 1)
+            with transaction.atomic():
+                self.rows['value'] = 2
+                versioned.invalidate()
+                self.assertEqual(versioned.get(), 2)
+                self.rows['value'] = 1
+                transaction.set_rollback(True)
+            self.assertEqual(versioned.get(), 1)
+            transaction.set_rollback(True)
@@ -0,0 +1,148 @@
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from main.models import (
+    Cheque,
+    ChequeProduct,
+    Customer,
+    DebitingList,
+    OrderList,
+    Product,
+    Recipe,
+    RecipeProducts,
+    Supplier,
+    SupplierProductPrice,
+    Userdj,
+    Warehouse,
+    WarehouseProducts,
+    Workshop,
+)
+from main.rollup import rollup_day
+
+
+class ChequeListViewTests(TestCase):
+    def setUp(self):
+        self.userdj = Userdj.objects.create(date_now=date(2024, 1, 10), capital=0)
+        raw = Warehouse.objects.create(category='Сырье', max_warehouse_capacity=1000)
+        finished = Warehouse.objects.create(category='Готовая продукция', max_warehouse_capacity=1000)
+        self.flour = Product.objects.create(name='Мука', warehouse=raw, expiry_date=10, mass=1)
+        self.bread = Product.objects.create(name='Хлеб', warehouse=finished, expiry_date=2, mass=1)
+        Supplier.objects.bulk_create([Supplier(name=f'Поставщик {i}') for i in range(2)])
+        Customer.objects.bulk_create([Customer(name=f'Клиент {i}') for i in range(2)])
+
+    # каждый день все поставщики продают муку, все клиенты покупают хлеб, часть
+    # муки списывается; закрытый день сводится, как при закрытии дня
+    def trade(self, days):
+        for _ in range(days):
+            day = self.userdj.date_now
+            for supplier in Supplier.objects.order_by('pk'):
+                cheque = Cheque.objects.create(date=day, supplier=supplier)
+                ChequeProduct.objects.create(cheque=cheque, product=self.flour, price=2, quantity=day.day)
+            for customer in Customer.objects.order_by('pk'):
+                cheque = Cheque.objects.create(date=day, customer=customer)
+                ChequeProduct.objects.create(cheque=cheque, product=self.bread, price=10, quantity=day.day % 3 + 1)
+            DebitingList.objects.create(product=self.flour, quantity=1, date_of_debiting=day, fresh=day.day % 2 == 0, amount=2)
+            rollup_day(day)
+            self.userdj.date_now += timedelta(days=1)
+            self.userdj.save()
+
+    def report(self, warehouse=-1, details='1'):
+        return self.client.get(reverse('main:cheque_list'), {
+            'start_date': '2024-01-01', 'end_date': '2024-12-31', 'warehouse': warehouse, 'details': details,
+        })
+
+    def test_totals_match_cheque_lines(self):
+        self.trade(3)
+        expected = defaultdict(lambda: {'quantity': 0, 'price': 0})
+        for line in ChequeProduct.objects.select_related('cheque__supplier', 'product'):
+            if line.cheque.supplier:
+                expected[line.cheque.supplier.name, line.product.name]['quantity'] += line.quantity
+                expected[line.cheque.supplier.name, line.product.name]['price'] += line.quantity * line.price
+
+        response = self.report()
+        actual = {
+            (item['supplier'].name, name): value
+            for item in response.context['list_supplier']
+            for name, value in item['temp_supplier'].items()
+        }
+        self.assertEqual(actual, dict(expected))
+        self.assertEqual(len(response.context['list_customer']), Customer.objects.count())
+        self.assertEqual([item['warehouse'] for item in response.context['totals']], list(Warehouse.objects.all()))
+
+    def test_summary_reads_only_rollups(self):
+        self.trade(3)
+        # закрытые дни - только сводки, исходные таблицы читаются лишь за текущий день
+        period = {'start_date': '2024-01-01', 'end_date': self.userdj.date_now - timedelta(days=1)}
+        detailed = self.client.get(reverse('main:cheque_list'), {**period, 'warehouse': -1, 'details': '1'})
+        for name, params in (('main:cheque_list', {'warehouse': -1}), ('main:debiting_list', {})):
+            with self.subTest(name=name), CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(name), {**period, **params})
+            self.assertEqual(response.context['totals'], detailed.context['totals'])
+            self.assertEqual(list(response.context['debiting_list1']), [])
+            self.assertFalse([query for query in queries if any(
+                table in query['sql'] for table in ('"cheque"', '"cheque_product"', '"debiting_list"'))])
+
+    def test_query_count_does_not_grow_with_data(self):
+        self.trade(1)
+        with CaptureQueriesContext(connection) as small:
+            self.report()
+        Supplier.objects.bulk_create([Supplier(name=f'Новый поставщик {i}') for i in range(20)])
+        self.trade(4)
+        with CaptureQueriesContext(connection) as large:
+            self.report()
+        self.assertEqual(len(large), len(small))
+
+
+class IndexViewTests(TestCase):
+    # больше страницы (50 строк) в каждом списке главной
+    def setUp(self):
+        Userdj.objects.create(date_now=date(2024, 1, 10), capital=0)
+        warehouse = Warehouse.objects.create(category='Сырье', max_warehouse_capacity=10 ** 6)
+        products = Product.objects.bulk_create([
+            Product(name=f'Продукт {i}', warehouse=warehouse, expiry_date=10, mass=1) for i in range(60)
+        ])
+        suppliers = Supplier.objects.bulk_create([Supplier(name=f'Поставщик {i}') for i in range(60)])
+        customers = Customer.objects.bulk_create([Customer(name=f'Клиент {i}') for i in range(60)])
+        SupplierProductPrice.objects.bulk_create([
+            SupplierProductPrice(supplier=supplier, product=product, price=5)
+            for supplier, product in zip(suppliers, products)
+        ])
+        recipes = Recipe.objects.bulk_create([
+            Recipe(name=f'Рецепт {i}', finish_product=product) for i, product in enumerate(products)
+        ])
+        RecipeProducts.objects.bulk_create([
+            RecipeProducts(recipe=recipe, product=product, quantity=1)
+            for recipe in recipes for product in products[:2]
+        ])
+        Workshop.objects.bulk_create([Workshop(name=f'Цех {i}', max_capacity=10, recipe=recipes[i]) for i in range(60)])
+        WarehouseProducts.objects.bulk_create([
+            WarehouseProducts(product=product, quantity=1, production_date=date(2024, 1, 10), expires_on=date(2024, 1, 20))
+            for product in products
+        ])
+        OrderList.objects.bulk_create([
+            OrderList(customer=customer, product=product, quantity=1, date_order=date(2024, 1, 10), price=10)
+            for customer, product in zip(customers, products)
+        ])
+        DebitingList.objects.bulk_create([
+            DebitingList(product=product, quantity=1, date_of_debiting=date(2024, 1, 9), fresh=True, amount=5)
+            for product in products
+        ])
+        cheques = Cheque.objects.bulk_create([
+            Cheque(date=date(2024, 1, 9), supplier=supplier) for supplier in suppliers
+        ])
+        ChequeProduct.objects.bulk_create([
+            ChequeProduct(cheque=cheque, product=product, price=5, quantity=1)
+            for cheque in cheques for product in products[:2]
+        ])
+
+    def test_query_budget(self):
+        with self.assertNumQueries(24):
+            response = self.client.get(reverse('main:index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['cheque_list']), 50)
+        self.assertEqual(len(response.context['cheque_list'][0]['cheque_product']), 2)
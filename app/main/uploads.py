@@ -0,0 +1,25 @@
+import csv
+import io
+import json
+
+from django.core.exceptions import ValidationError
+
+
+# Строки загруженного списка: JSON - список объектов (или {"lines": [...]}),
+# CSV - таблица с заголовком. Формат определяется по расширению name, а без
+# него - по первому символу.
+def read_rows(content, name=''):
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+    if name.endswith('.csv') or not content.lstrip().startswith(('[', '{')):
+        rows = list(csv.DictReader(io.StringIO(content)))
+    else:
+        try:
+            rows = json.loads(content)
+        except ValueError as error:
+            raise ValidationError(f'Некорректный JSON: {error}')
+        if isinstance(rows, dict):
+            rows = rows.get('lines', [])
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        raise ValidationError('Ожидается список строк-объектов')
+    return rows
@@ -26,7 +26,9 @@ urlpatterns = [
     path('success/', views.success, name='success'),
 
     path('userdj_update/', views.update_userdj, name='update_userdj'),
+    path('simulate/', views.simulate_days, name='simulate_days'),
     path('warehouse_products_create/', views.create_warehouse_products, name='create_warehouse_products'),
+    path('warehouse_products_bulk/', views.bulk_purchase_view, name='bulk_purchase'),
     
     path('customers_create/', views.create_customer, name='create_customer'),
     path('customers_update/<int:customer_id>/', views.update_customer, name='update_customer'),
@@ -53,6 +55,7 @@ urlpatterns = [
     path('delete_recipe_products/<int:recipe_products_id>/', views.delete_recipe_products, name='delete_recipe_products'),
 
     path('create_order_list/', views.create_order_list, name='create_order_list'),
+    path('orders_intake/', views.intake_orders_view, name='intake_orders'),
     path('update_order_list/<int:order_list_id>/', views.update_order_list, name='update_order_list'),
     path('delete_order_list/<int:order_list_id>/', views.delete_order_list, name='delete_order_list'),
 
@@ -62,5 +65,7 @@ urlpatterns = [
 
     path('debiting-list/', views.debiting_list_view, name='debiting_list'),  
     path('cheque-list/', views.cheque_list_view, name='cheque_list'),  
+    path('export/<str:name>/', views.export_view, name='export'),
+    path('finance/', views.finance_view, name='finance'),
     
 ]
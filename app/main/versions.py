@@ -0,0 +1,58 @@
+import threading
+import time
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+
+# Кэш процесса для редко меняющихся данных (дата симуляции, цены, рецепты):
+# результат load() хранится в памяти вместе с версией из общего для всех
+# процессов кэша (settings.CACHES) и перечитывается, когда версия сменилась.
+# Версия заменяется новым случайным значением, а не увеличивается: incr
+# файлового кэша не атомарен.
+#
+# Смена внутри транзакции меняет версию только после коммита, поэтому другие
+# процессы не успевают закэшировать состояние до коммита, а после отката
+# менять нечего. Сама транзакция, пока ее обработчики on_commit живы, читает
+# свою копию: она перечитывается после каждой смены и когда откат точки
+# сохранения снял одну из них, и в общий кэш процесса не попадает.
+class VersionedCache:
+    def __init__(self, key, load):
+        self.key = key
+        self.load = load
+        self.state = (None, None)
+        self.local = threading.local()
+
+    def version(self):
+        return cache.get_or_set(self.key, time.time_ns, None)
+
+    def get(self):
+        local = self.local
+        if getattr(local, 'pending', None):
+            waiting = {id(entry[1]) for entry in connection.run_on_commit} if connection.in_atomic_block else ()
+            local.pending = [callback for callback in local.pending if id(callback) in waiting]
+            if local.pending:
+                if getattr(local, 'loaded_for', None) != local.pending:
+                    local.value, local.loaded_for = self.load(), local.pending
+                return local.value
+        version = self.version()
+        if self.state[0] != version:
+            self.state = (version, self.load())
+        return self.state[1]
+
+    def bump(self):
+        cache.set(self.key, uuid4().hex, None)
+        self.state = (None, None)
+
+    def invalidate(self):
+        if not connection.in_atomic_block:
+            self.bump()
+            return
+
+        def committed():
+            self.local.pending = []
+            self.bump()
+
+        self.local.pending = getattr(self.local, 'pending', []) + [committed]
+        transaction.on_commit(committed)
@@ -1,5 +1,10 @@
 from django.shortcuts import render, redirect, get_object_or_404, HttpResponse
+from django.core.exceptions import ValidationError
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_date
 from collections import defaultdict
+from django.core.paginator import Paginator
+from django.db.models import DecimalField, Exists, F, Min, OuterRef, Prefetch, Sum
 from .models import (
     Customer,
     Supplier,
@@ -29,33 +34,55 @@ from .forms import (
     WorkshopForm,
     UserdjForm,
     WarehouseProductsForm,
+    BulkPurchaseForm,
+    SimulateForm,
 )
+from .api import api_view
+from .clock import simulation_state
+from .orders import intake_upload
+from .purchases import bulk_purchase, parse_lines
+from .export import EXPORTS, FORMATS, export_links, export_stream
+from .ledger import capital_summary, period_bounds
+from .rollup import period_totals
+
+REPORT_CHUNK_SIZE = 2000
+
+def paginate(request, queryset, param, per_page=50):
+    page = Paginator(queryset, per_page).get_page(request.GET.get(param))
+    query = request.GET.copy()
+    if page.has_previous():
+        query[param] = page.previous_page_number()
+        page.previous_url = f'?{query.urlencode()}'
+    if page.has_next():
+        query[param] = page.next_page_number()
+        page.next_url = f'?{query.urlencode()}'
+    return page
 
 def index(request):    
-    recipes_list = []
-    recipes = Recipe.objects.all()
-    for recipe in recipes:
-        recipes_list.append({'recipe':recipe, 'recipe_products':RecipeProducts.objects.filter(recipe = recipe)})
-
-    cheque_list = []
-    cheques = Cheque.objects.all()
-    for cheque in cheques:
-        cheque_list.append({'cheque':cheque, 'cheque_product':ChequeProduct.objects.filter(cheque = cheque)})
-
-
-
-    context = {'customers': Customer.objects.all(),
-               'suppliers': Supplier.objects.all(),
-               'warehouses': Warehouse.objects.all(),
-               'warehouse_products': WarehouseProducts.objects.all(),
-               'products': Product.objects.all(),
-               'supplier_product_prices': SupplierProductPrice.objects.all(),
+    recipes = paginate(request, Recipe.objects.select_related('finish_product').prefetch_related(
+        Prefetch('recipeproducts_set', queryset=RecipeProducts.objects.select_related('product').order_by('pk'))
+    ).order_by('pk'), 'recipes_page')
+    recipes_list = [{'recipe': recipe, 'recipe_products': recipe.recipeproducts_set.all()} for recipe in recipes]
+
+    cheques = paginate(request, Cheque.objects.select_related('customer', 'supplier').prefetch_related(
+        Prefetch('chequeproduct_set', queryset=ChequeProduct.objects.select_related('product').order_by('pk'))
+    ).order_by('-date', '-pk'), 'cheques_page')
+    cheque_list = [{'cheque': cheque, 'cheque_product': cheque.chequeproduct_set.all()} for cheque in cheques]
+
+    context = {'customers': paginate(request, Customer.objects.order_by('pk'), 'customers_page'),
+               'suppliers': paginate(request, Supplier.objects.order_by('pk'), 'suppliers_page'),
+               'warehouses': Warehouse.objects.order_by('pk'),
+               'warehouse_products': paginate(request, WarehouseProducts.objects.select_related('product').order_by('pk'), 'warehouse_products_page'),
+               'products': paginate(request, Product.objects.select_related('warehouse').order_by('pk'), 'products_page'),
+               'supplier_product_prices': paginate(request, SupplierProductPrice.objects.select_related('product', 'supplier').order_by('pk'), 'prices_page'),
                'recipes': recipes_list,
-               'order_list': OrderList.objects.all(),
-               'workshops': Workshop.objects.all(),
-               'userdj': Userdj.objects.first(),
-               'debiting_list': DebitingList.objects.all(),
+               'recipes_page': recipes,
+               'order_list': paginate(request, OrderList.objects.select_related('customer', 'product').order_by('pk'), 'orders_page'),
+               'workshops': paginate(request, Workshop.objects.select_related('recipe').order_by('pk'), 'workshops_page'),
+               'userdj': simulation_state(),
+               'debiting_list': paginate(request, DebitingList.objects.select_related('product').order_by('-date_of_debiting', '-pk'), 'debiting_page'),
                'cheque_list': cheque_list,
+               'cheques_page': cheques,
                }    
 
     return render(request, 'index.html', context)
@@ -70,8 +97,12 @@ def handle_form(request, form_class, instance=None, action='Create'):
     if request.method == 'POST':
         form = form_class(request.POST, instance=instance)
         if form.is_valid():
-            form.save()
-            return redirect('main:success')
+            try:
+                form.save()
+            except ValidationError as error:
+                form.add_error(None, error)
+            else:
+                return redirect('main:success')
     else:
         form = form_class(instance=instance)
     
@@ -81,11 +112,38 @@ def update_userdj(request):
     userdj = get_object_or_404(Userdj, user_id=1)
     return handle_form(request, UserdjForm, instance=userdj, action='Обновить дату')
 
+def simulate_days(request):
+    userdj = get_object_or_404(Userdj, user_id=1)
+    return handle_form(request, SimulateForm, instance=userdj, action='Промотать дни')
+
 
 def create_warehouse_products(request):
     return handle_form(request, WarehouseProductsForm, action='Купить продукт')
 
 
+# закупка списком: форма с файлом из браузера или JSON в теле запроса с
+# токеном API (ответ тоже JSON)
+@api_view(allow_forms=True)
+def bulk_purchase_view(request):
+    if request.method == 'POST' and request.content_type == 'application/json':
+        try:
+            return JsonResponse(bulk_purchase(parse_lines(request.body)))
+        except ValidationError as error:
+            return JsonResponse({'errors': error.messages}, status=400)
+    if request.method == 'POST':
+        form = BulkPurchaseForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                form.save()
+            except ValidationError as error:
+                form.add_error(None, error)
+            else:
+                return redirect('main:success')
+    else:
+        form = BulkPurchaseForm()
+    return render(request, 'form.html', {'form': form, 'action': 'Купить списком'})
+
+
 def create_customer(request):
     return handle_form(request, CustomerForm, action='Создать клиента')
 
@@ -165,6 +223,18 @@ def update_order_list(request, order_list_id):
     order_list = get_object_or_404(OrderList, order_list_id=order_list_id)
     return handle_form(request, OrderListForm, instance=order_list, action='Обновить список заказов')
 
+# прием пачки заказов: JSON или CSV (с заголовком customer,product,quantity,price)
+# в теле POST с токеном API, в ответе - результат по каждой строке
+@api_view()
+def intake_orders_view(request):
+    if request.method != 'POST':
+        return HttpResponseBadRequest('Пачка заказов передается в теле POST')
+    try:
+        result = intake_upload(request.body, '.csv' if request.content_type == 'text/csv' else '')
+    except ValidationError as error:
+        return JsonResponse({'errors': error.messages}, status=400)
+    return JsonResponse(result, status=201 if result['accepted'] else 400)
+
 def delete_order_list(request, order_list_id):
     price_instance = get_object_or_404(OrderList, pk=order_list_id)
     if request.method == 'POST':
@@ -186,18 +256,44 @@ def delete_workshop(request, workshop_id):
         return redirect('main:success')
     return render(request, 'form_del.html', )
 
+# Отчеты за период по умолчанию - только итоги по категориям из нарастающих
+# сводок (несколько запросов при любой длине периода); построчные списания,
+# чеки и итоги по поставщикам и клиентам читаются из исходных таблиц только
+# по запросу (details=1)
 def debiting_list_view(request):
     debiting_list1 = []
     debiting_list2 = []
+    totals = []
+    details = request.GET.get('details') == '1'
     if request.method == 'GET':
         start_date = request.GET.get('start_date')
         end_date = request.GET.get('end_date')
 
         if start_date and end_date:
-            debiting_list1 = DebitingList.objects.filter(date_of_debiting__range=[start_date, end_date], fresh=True)
-            debiting_list2 = DebitingList.objects.filter(date_of_debiting__range=[start_date, end_date], fresh=False)
-
-    return render(request, 'debiting_list.html', {'debiting_list1': debiting_list1, 'debiting_list2': debiting_list2})
+            totals = period_totals(start_date, end_date)
+            if details:
+                debiting_list1 = DebitingList.objects.filter(date_of_debiting__range=[start_date, end_date], fresh=True).select_related('product')
+                debiting_list2 = DebitingList.objects.filter(date_of_debiting__range=[start_date, end_date], fresh=False).select_related('product')
+
+    return render(request, 'debiting_list.html', {'debiting_list1': debiting_list1,
+                                                  'debiting_list2': debiting_list2,
+                                                  'totals': totals,
+                                                  'details': details,
+                                                  'exports': export_links('debiting')})
+
+
+# движение капитала за квартал или год по журналу: разность нарастающих
+# итогов на границах периода, чеки и списания не пересчитываются
+def finance_view(request):
+    summary = None
+    year = request.GET.get('year')
+    if year:
+        try:
+            start, end = period_bounds(int(year), int(request.GET.get('quarter') or 0))
+        except ValueError:
+            return HttpResponseBadRequest('Неверный год или квартал')
+        summary = capital_summary(start, end)
+    return render(request, 'finance.html', {'summary': summary})
 
 
 def cheque_list_view(request):
@@ -207,59 +303,66 @@ def cheque_list_view(request):
     list_customer = []
     debiting_list1 = []
     debiting_list2 = []
+    totals = []
+    details = request.GET.get('details') == '1'
     if request.method == 'GET':
         start_date = request.GET.get('start_date')
         end_date = request.GET.get('end_date')
         warehouse = int(request.GET.get('warehouse') or 0)
 
         if start_date and end_date and warehouse:
-            if warehouse == -1:
-                debiting_list1 = DebitingList.objects.filter(date_of_debiting__range=[start_date, end_date], fresh=True)
-                debiting_list2 = DebitingList.objects.filter(date_of_debiting__range=[start_date, end_date], fresh=False)
-            else:
-                debiting_list1 = DebitingList.objects.filter(date_of_debiting__range=[start_date, end_date], fresh=True, product__warehouse = warehouse)
-                debiting_list2 = DebitingList.objects.filter(date_of_debiting__range=[start_date, end_date], fresh=False, product__warehouse = warehouse)
-
-            suppliers = Supplier.objects.all()
-            for supplier in suppliers:
-                cheque_supplier = []
-                temp_supplier = defaultdict(lambda: {'quantity': 0, 'price': 0})
-                cheques = Cheque.objects.filter(date__range=[start_date, end_date], supplier=supplier)
-                for cheque in cheques:
-                    if warehouse == -1:
-                        cheque_product = ChequeProduct.objects.filter(cheque = cheque)
-                    else:
-                        cheque_product = ChequeProduct.objects.filter(cheque = cheque, product__warehouse = warehouse)
-                    
-                    if cheque_product:
-                        cheque_supplier.append({'cheque':cheque, 'cheque_product': cheque_product})
-                        for i in cheque_product:
-                            temp_supplier[i.product.name]['quantity'] += i.quantity
-                            temp_supplier[i.product.name]['price'] += i.quantity * i.price
-
-                cheque_list_supplier.append({'supplier': supplier, 'cheque_supplier': cheque_supplier})
-                list_supplier.append({'supplier': supplier, 'temp_supplier': dict(temp_supplier)})
-            
-            customers = Customer.objects.all()
-            for customer in customers:
-                cheque_customer = []
-                temp_customer = defaultdict(lambda: {'quantity': 0, 'price': 0})
-                cheques = Cheque.objects.filter(date__range=[start_date, end_date], customer=customer)
-                for cheque in cheques:
-                    if warehouse == -1:
-                        cheque_product = ChequeProduct.objects.filter(cheque = cheque)
-                    else:
-                        cheque_product = ChequeProduct.objects.filter(cheque = cheque, product__warehouse = warehouse)
-                    
-                    if cheque_product:
-                        cheque_customer.append({'cheque':cheque, 'cheque_product':cheque_product})
-                        for i in cheque_product:
-                            temp_customer[i.product.name]['quantity'] += i.quantity
-                            temp_customer[i.product.name]['price'] += i.quantity * i.price
-                cheque_list_customer.append({'customer': customer, 'cheque_customer': cheque_customer})
-                list_customer.append({'customer': customer, 'temp_customer': dict(temp_customer)})
-
-            
+            totals = period_totals(start_date, end_date, None if warehouse == -1 else warehouse)
+
+        if start_date and end_date and warehouse and details:
+            debiting_list = DebitingList.objects.filter(date_of_debiting__range=[start_date, end_date]).select_related('product')
+            cheque_products = ChequeProduct.objects.filter(cheque__date__range=[start_date, end_date])
+            if warehouse != -1:
+                debiting_list = debiting_list.filter(product__warehouse = warehouse)
+                cheque_products = cheque_products.filter(product__warehouse = warehouse)
+            debiting_list1 = debiting_list.filter(fresh=True)
+            debiting_list2 = debiting_list.filter(fresh=False)
+
+            totals_supplier = defaultdict(dict)
+            totals_customer = defaultdict(dict)
+            product_totals = (cheque_products
+                              .values('cheque__supplier_id', 'cheque__customer_id', 'product__name')
+                              .annotate(total_quantity=Sum('quantity'),
+                                        total_price=Sum(F('quantity') * F('price'), output_field=DecimalField(max_digits=20, decimal_places=2)),
+                                        first_cheque=Min('cheque_id'),
+                                        first_line=Min('pk'))
+                              .order_by('first_cheque', 'first_line'))
+            for total in product_totals:
+                value = {'quantity': total['total_quantity'], 'price': total['total_price']}
+                if total['cheque__supplier_id'] is not None:
+                    totals_supplier[total['cheque__supplier_id']][total['product__name']] = value
+                if total['cheque__customer_id'] is not None:
+                    totals_customer[total['cheque__customer_id']][total['product__name']] = value
+
+            cheques_supplier = defaultdict(list)
+            cheques_customer = defaultdict(list)
+            cheques = (Cheque.objects
+                       .filter(date__range=[start_date, end_date])
+                       .filter(Exists(cheque_products.filter(cheque=OuterRef('pk'))))
+                       .select_related('supplier', 'customer')
+                       .prefetch_related(Prefetch('chequeproduct_set',
+                                                  queryset=cheque_products.select_related('product').order_by('pk'),
+                                                  to_attr='cheque_product'))
+                       .order_by('pk'))
+            # чеки за длинный период читаются пачками (в PostgreSQL -
+            # серверным курсором), строки подгружаются на каждую пачку
+            for cheque in cheques.iterator(chunk_size=REPORT_CHUNK_SIZE):
+                if cheque.supplier_id is not None:
+                    cheques_supplier[cheque.supplier_id].append({'cheque': cheque, 'cheque_product': cheque.cheque_product})
+                if cheque.customer_id is not None:
+                    cheques_customer[cheque.customer_id].append({'cheque': cheque, 'cheque_product': cheque.cheque_product})
+
+            for supplier in Supplier.objects.all():
+                cheque_list_supplier.append({'supplier': supplier, 'cheque_supplier': cheques_supplier[supplier.pk]})
+                list_supplier.append({'supplier': supplier, 'temp_supplier': totals_supplier[supplier.pk]})
+
+            for customer in Customer.objects.all():
+                cheque_list_customer.append({'customer': customer, 'cheque_customer': cheques_customer[customer.pk]})
+                list_customer.append({'customer': customer, 'temp_customer': totals_customer[customer.pk]})
 
     return render(request, 'cheque_list.html', {'cheque_list_supplier': cheque_list_supplier,
                                                 'cheque_list_customer': cheque_list_customer,
@@ -267,4 +370,28 @@ def cheque_list_view(request):
                                                 'list_customer': list_customer,
                                                 'warehouses': Warehouse.objects.all(),
                                                 'debiting_list1': debiting_list1, 
-                                                'debiting_list2': debiting_list2})
+                                                'debiting_list2': debiting_list2,
+                                                'totals': totals,
+                                                'details': details,
+                                                'exports': export_links('cheques', 'debiting', 'orders')})
+
+
+# потоковая выгрузка name (cheques, debiting, orders) за период в csv или json;
+# warehouse - склад (категория продукции), пустой или -1 - все склады
+def export_view(request, name):
+    if name not in EXPORTS:
+        raise Http404
+    output = request.GET.get('format', 'csv')
+    try:
+        start = parse_date(request.GET.get('start_date') or '')
+        end = parse_date(request.GET.get('end_date') or '')
+        warehouse = int(request.GET.get('warehouse') or 0)
+    except ValueError:
+        start = None
+    if not start or not end or output not in FORMATS:
+        return HttpResponseBadRequest('Нужны start_date, end_date (ГГГГ-ММ-ДД) и format csv или json')
+
+    response = StreamingHttpResponse(export_stream(name, output, start, end, None if warehouse == -1 else warehouse),
+                                     content_type=FORMATS[output][0])
+    response['Content-Disposition'] = f'attachment; filename="{name}_{start}_{end}.{output}"'
+    return response